@@ -0,0 +1,182 @@
+"""
+Tiered debug-artifact capture with background writing.
+
+Levels:
+    off         capture nothing
+    on-failure  full capture (screenshot, HTML, console) only at failure points
+    ring        cheap HTML-only snapshots kept in an in-memory ring of the last
+                RING_SIZE steps; flushed to disk together with a full capture
+                when a failure happens
+    full        full capture at every step (the old behaviour)
+
+Captured content is handed to a writer thread, so disk I/O and compression stay
+off the booking path. HTML and console logs are gzip-compressed, and content
+already written in this run (same SHA-1) is not written again.
+
+Code that books on several threads (daemon slots, batch jobs) wraps each
+booking in ARTIFACTS.namespace(name): file names get that prefix and every
+namespace keeps its own ring, so concurrent bookings do not overwrite or flush
+each other's snapshots.
+"""
+import atexit
+import collections
+import contextlib
+import gzip
+import hashlib
+import logging
+import os
+import queue
+import threading
+
+LEVELS = ("off", "on-failure", "ring", "full")
+ARTIFACT_LEVEL = os.getenv("FLOWSCAPE_ARTIFACTS", "ring")
+RING_SIZE = int(os.getenv("FLOWSCAPE_ARTIFACT_RING", "5"))
+
+
+def _console_log(driver):
+    try:
+        return "\n".join(f"{e.get('level')} {e.get('source', '')} {e.get('message')}" for e in driver.get_log("browser"))
+    except Exception:
+        logging.debug("No browser console logs available or get_log failed.")
+        return None
+
+
+class ArtifactRecorder:
+    def __init__(self, level=ARTIFACT_LEVEL, ring_size=RING_SIZE):
+        if level not in LEVELS:
+            # a typo in FLOWSCAPE_ARTIFACTS must not break every import of this module
+            logging.warning("Unknown artifact level %r; expected one of %s. Using %r", level, ", ".join(LEVELS), "ring")
+            level = "ring"
+        self.level = level
+        self.ring_size = ring_size
+        self._rings = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._seen = {}
+        self._writer_pid = None
+
+    @contextlib.contextmanager
+    def namespace(self, name):
+        """
+        Prefix the artifacts captured on this thread with name (a slot or job id).
+        """
+        previous = getattr(self._local, "name", None)
+        self._local.name = name
+        try:
+            yield
+        finally:
+            self._local.name = previous
+            with self._lock:
+                self._rings.pop(name, None)
+
+    def _ring(self):
+        name = getattr(self._local, "name", None)
+        with self._lock:
+            ring = self._rings.get(name)
+            if ring is None:
+                ring = self._rings[name] = collections.deque(maxlen=self.ring_size)
+            return ring
+
+    def _ensure_writer(self):
+        # the thread does not survive fork(), so pool workers start their own
+        if self._writer_pid == os.getpid():
+            return
+        with self._lock:
+            if self._writer_pid != os.getpid():
+                self._queue = queue.Queue()
+                threading.Thread(target=self._write_loop, name="artifact-writer", daemon=True).start()
+                self._writer_pid = os.getpid()
+
+    def _capture(self, driver, prefix, full):
+        name = getattr(self._local, "name", None)
+        if name:
+            prefix = f"{name}_{prefix}"
+        items = []
+        try:
+            items.append((f"{prefix}.html.gz", driver.page_source))
+        except Exception as e:
+            logging.debug("page_source failed for %s: %s", prefix, e)
+        if full:
+            try:
+                items.append((f"{prefix}.png", driver.get_screenshot_as_png()))
+            except Exception as e:
+                logging.debug("Unable to take screenshot %s: %s", prefix, e)
+            console = _console_log(driver)
+            if console is not None:
+                items.append((f"{prefix}_browser_console.log.gz", console))
+        return items
+
+    def snapshot(self, driver, prefix, failure=False):
+        """
+        Record the page state for one step according to the level.
+        """
+        if self.level == "off" or driver is None:
+            return
+        if self.level == "on-failure" and not failure:
+            return
+        if self.level == "ring" and not failure:
+            self._ring().append(self._capture(driver, prefix, full=False))
+            return
+        items = self._capture(driver, prefix, full=True)
+        self._ensure_writer()
+        if self.level == "ring":
+            ring = self._ring()
+            while ring:
+                for item in ring.popleft():
+                    self._queue.put(item)
+        for item in items:
+            self._queue.put(item)
+
+    def _write_loop(self):
+        q = self._queue
+        while True:
+            name, content = q.get()
+            try:
+                self._write(name, content)
+            except Exception as e:
+                logging.debug("Failed writing artifact %s: %s", name, e)
+            finally:
+                q.task_done()
+
+    def _write(self, name, content):
+        data = content.encode("utf-8") if isinstance(content, str) else content
+        digest = hashlib.sha1(data).hexdigest()
+        if digest in self._seen:
+            logging.debug("Skipped artifact %s: identical to %s", name, self._seen[digest])
+            return
+        self._seen[digest] = name
+        if name.endswith(".gz"):
+            with gzip.open(name, "wb", compresslevel=5) as f:
+                f.write(data)
+        else:
+            with open(name, "wb") as f:
+                f.write(data)
+        logging.debug("Wrote artifact: %s", name)
+
+    def flush(self):
+        """
+        Block until queued artifacts are on disk.
+        """
+        if self._writer_pid == os.getpid():
+            self._queue.join()
+
+
+ARTIFACTS = ArtifactRecorder()
+atexit.register(ARTIFACTS.flush)
+
+
+def configure(level=None, ring_size=None):
+    """
+    Change the level / ring size of the shared recorder (e.g. from the CLI).
+    """
+    if level is not None:
+        if level not in LEVELS:
+            raise ValueError(f"unknown artifact level {level!r}; expected one of {', '.join(LEVELS)}")
+        ARTIFACTS.level = level
+    if ring_size is not None:
+        with ARTIFACTS._lock:
+            ARTIFACTS.ring_size = ring_size
+            ARTIFACTS._rings = {name: collections.deque(ring, maxlen=ring_size)
+                                for name, ring in ARTIFACTS._rings.items()}
+    return ARTIFACTS
@@ -0,0 +1,247 @@
+"""
+Concurrent multi-user / multi-seat booking.
+
+A job file lists bookings as a JSON list or as JSON lines, for example:
+
+    {"user": "ALICE", "seat": "ID-6F-277 (UK)", "date": "2026-10-19", "start": "08:00", "end": "17:00"}
+
+"user" is a credential reference: the worker reads FLOWSCAPE_USER_<REF> and
+FLOWSCAPE_PASS_<REF> from the environment (FLOWSCAPE_USER/FLOWSCAPE_PASS when
+omitted). "seat" may be a comma-separated ranked list and "zone" a seat-label
+prefix of acceptable fallbacks. Jobs run in a process pool, each with its own Chrome profile,
+session cache and batch_<id>/booking.log, so total wall time is close to the slowest single booking.
+"""
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import shutil
+import signal
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from datetime import datetime
+
+import log_pipeline
+from artifacts import ARTIFACTS
+from book_seat import DEFAULT_END, DEFAULT_START, LOG_FILENAME, driver_rss_bytes, login_flowscape, make_driver
+from run_metrics import finish_run, sample_memory, start_run
+from session_cache import SESSION_FILENAME
+
+REPORT_FILENAME = os.getenv("FLOWSCAPE_BATCH_REPORT", "batch_report.json")
+
+
+class _JobTimeout(BaseException):
+    # not an Exception, so the booking code's own broad handlers cannot swallow
+    # the alarm; only _run_job catches it
+    pass
+
+
+def load_jobs(path):
+    """
+    Read jobs from a JSON list or a JSON-lines file.
+    """
+    with open(path, encoding="utf-8") as f:
+        text = f.read().strip()
+    if text.startswith("["):
+        jobs = json.loads(text)
+    else:
+        jobs = [json.loads(line) for line in text.splitlines() if line.strip() and not line.startswith("#")]
+    for i, job in enumerate(jobs):
+        if not isinstance(job, dict):
+            raise ValueError(f"job {i} in {path} is not a JSON object")
+        if not isinstance(job.get("seat"), str) or not job["seat"].replace(",", "").strip():
+            raise ValueError(f"job {i} in {path} has no seat (a seat label or comma-separated list)")
+        job.setdefault("id", f"{i:03d}")
+    return jobs
+
+
+def _credentials(ref):
+    if not ref:
+        return os.getenv("FLOWSCAPE_USER"), os.getenv("FLOWSCAPE_PASS")
+    ref = ref.upper()
+    return os.getenv(f"FLOWSCAPE_USER_{ref}"), os.getenv(f"FLOWSCAPE_PASS_{ref}")
+
+
+def _session_file_for(ref):
+    if not ref:
+        return os.path.abspath(SESSION_FILENAME)
+    root, ext = os.path.splitext(SESSION_FILENAME)
+    return os.path.abspath(f"{root}_{ref.lower()}{ext}")
+
+
+def _on_alarm(signum, frame):
+    raise _JobTimeout()
+
+
+_worker_index = None
+
+
+def _init_worker(indices):
+    # a stable worker number for the pool's lifetime, so each worker keeps its own disk cache
+    global _worker_index
+    try:
+        _worker_index = indices.get_nowait()
+    except queue.Empty:
+        # a replacement for a worker that died
+        _worker_index = f"pid{os.getpid()}"
+
+
+def _run_job(job, headless, debug, timeout):
+    """
+    Worker entry point: one isolated browser, one booking.
+    """
+    started = time.monotonic()
+    result = {"id": job["id"], "user": job.get("user"), "seat": job["seat"], "date": job.get("date"), "ok": False}
+    email, password = _credentials(job.get("user"))
+    if not email or not password:
+        result["error"] = "missing credentials"
+        return result
+
+    profile_dir = tempfile.mkdtemp(prefix=f"flowscape_{job['id']}_")
+    session_file = _session_file_for(job.get("user"))
+    # keep each job's debug dumps apart; workers are separate processes so chdir is local
+    workdir = os.getcwd()
+    artifact_dir = os.path.abspath(f"batch_{job['id']}")
+    os.makedirs(artifact_dir, exist_ok=True)
+    os.chdir(artifact_dir)
+    # one log file per job; the pipeline inherited from the parent has no listener after the fork
+    log_pipeline.configure(debug, os.path.join(artifact_dir, os.path.basename(LOG_FILENAME)))
+    driver = None
+    start_run(run_id=f"batch_{job['id']}_{int(time.time())}", job=job["id"], user=job.get("user"), seat=job["seat"])
+    # the alarm interrupts a hung WebDriver call so the finally block can still quit Chrome
+    signal.signal(signal.SIGALRM, _on_alarm)
+    try:
+        signal.alarm(timeout)
+        driver = make_driver(headless=headless, enable_console_logs=debug, user_data_dir=profile_dir,
+                             cache_key=f"worker{_worker_index}" if _worker_index is not None else None)
+        sample_memory(lambda: driver_rss_bytes(driver))
+        with ARTIFACTS.namespace(f"job{job['id']}"):
+            result["ok"] = bool(login_flowscape(
+                driver, email=email, password=password, seat_identifier=job["seat"], debug=debug,
+                session_file=session_file,
+                start_time=job.get("start") or DEFAULT_START, end_time=job.get("end") or DEFAULT_END,
+                booking_date=job.get("date"), zone=job.get("zone"),
+            ))
+    except _JobTimeout:
+        result["error"] = f"timed out after {timeout}s"
+    except Exception as e:
+        result["error"] = str(e)
+    finally:
+        signal.alarm(0)
+        finish_run(result["ok"], driver)
+        try:
+            if driver:
+                driver.quit()
+        except Exception:
+            pass
+        shutil.rmtree(profile_dir, ignore_errors=True)
+        # artifact names are relative: write them before leaving the job directory
+        ARTIFACTS.flush()
+        os.chdir(workdir)
+        # pool workers exit without running atexit
+        log_pipeline.stop()
+    result["elapsed"] = round(time.monotonic() - started, 3)
+    return result
+
+
+def _run_http_jobs(jobs, concurrency):
+    """
+    Book jobs over the HTTP backend with one client per user. Returns
+    (results, jobs that need the browser fallback).
+    """
+    from flowscape_api import ApiError, FlowscapeApi
+
+    clients = {}
+    for ref in {job.get("user") for job in jobs}:
+        try:
+            clients[ref] = FlowscapeApi.from_session(_session_file_for(ref), pool_size=concurrency)
+        except ApiError as e:
+            logging.info("No HTTP session for user %s (%s); using the browser", ref, e)
+
+    def _book(job):
+        started = time.monotonic()
+        booking_date = job.get("date") or datetime.now().strftime("%Y-%m-%d")
+        # "seat" is a ranked list: try each seat in turn; zones are only expanded by the browser
+        for seat in [s.strip() for s in job["seat"].split(",") if s.strip()]:
+            try:
+                clients[job.get("user")].book(seat, booking_date, job.get("start") or DEFAULT_START,
+                                              job.get("end") or DEFAULT_END)
+                return {"id": job["id"], "user": job.get("user"), "seat": seat, "date": job.get("date"),
+                        "ok": True, "backend": "http", "elapsed": round(time.monotonic() - started, 3)}
+            except ApiError as e:
+                logging.info("HTTP booking of %s for job %s failed (%s)", seat, job["id"], e)
+            except Exception as e:
+                logging.error("HTTP booking of job %s failed: %s", job["id"], e)
+                return {"id": job["id"], "user": job.get("user"), "seat": job["seat"], "date": job.get("date"),
+                        "ok": False, "backend": "http", "error": str(e),
+                        "elapsed": round(time.monotonic() - started, 3)}
+        logging.info("No seat of job %s booked over HTTP; using the browser", job["id"])
+        return None
+
+    http_jobs = [job for job in jobs if job.get("user") in clients]
+    fallback = [job for job in jobs if job.get("user") not in clients]
+    results = []
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        for job, result in zip(http_jobs, pool.map(_book, http_jobs)):
+            if result is None:
+                fallback.append(job)
+            else:
+                results.append(result)
+    for client in clients.values():
+        client.close()
+    return results, fallback
+
+
+def run_batch(path, concurrency=4, job_timeout=180, headless=True, debug=True, report_path=REPORT_FILENAME,
+              backend="browser"):
+    """
+    Run every job in the file with at most `concurrency` browsers at once and
+    write an aggregated JSON report. With backend="http" jobs are first tried
+    over the Flowscape API and only the failures go to the browser pool.
+    Returns the report dict.
+    """
+    jobs = load_jobs(path)
+    logging.info("Batch: %d jobs from %s, concurrency=%d, timeout=%ds", len(jobs), path, concurrency, job_timeout)
+    started = time.monotonic()
+    results = []
+    if backend == "http":
+        results, jobs = _run_http_jobs(jobs, concurrency)
+    workers = max(1, min(concurrency, len(jobs)))
+    indices = multiprocessing.Queue()
+    for i in range(workers):
+        indices.put(i)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(indices,)) as pool:
+        futures = [(job, pool.submit(_run_job, job, headless, debug, job_timeout)) for job in jobs]
+        for job, future in futures:
+            try:
+                # the worker enforces the timeout itself; this only guards against a wedged worker
+                result = future.result(timeout=job_timeout + 30)
+            except FutureTimeout:
+                result = {"id": job["id"], "user": job.get("user"), "seat": job["seat"], "ok": False,
+                          "error": "worker did not return"}
+            except Exception as e:
+                result = {"id": job["id"], "user": job.get("user"), "seat": job["seat"], "ok": False, "error": str(e)}
+            logging.info("Job %s (%s, %s): %s%s", result["id"], result.get("user"), result["seat"],
+                         "OK" if result["ok"] else "FAILED",
+                         f" - {result['error']}" if result.get("error") else "")
+            results.append(result)
+
+    report = {
+        "jobs": len(results),
+        "succeeded": sum(1 for r in results if r["ok"]),
+        "failed": sum(1 for r in results if not r["ok"]),
+        "wall_time": round(time.monotonic() - started, 3),
+        "slowest_job": max((r.get("elapsed", 0) for r in results), default=0),
+        "results": results,
+    }
+    try:
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        logging.info("Wrote batch report %s", report_path)
+    except Exception as e:
+        logging.debug("Failed writing batch report %s: %s", report_path, e)
+    logging.info("Batch finished: %d/%d succeeded in %.1fs (slowest job %.1fs)",
+                 report["succeeded"], report["jobs"], report["wall_time"], report["slowest_job"])
+    return report
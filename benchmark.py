@@ -0,0 +1,131 @@
+"""
+Offline end-to-end benchmark of the booking flow.
+
+Starts mock_flowscape (Flowscape floor plan + Microsoft login stand-ins), points
+FLOWSCAPE_URL at it and runs login_flowscape for a number of iterations, with
+configurable latency and popup/iframe variants. Every iteration is recorded
+with run_metrics, and the per-step p50/p95 report is printed at the end:
+
+    python benchmark.py --iterations 20 --latency-ms 50 --booking-variant iframe
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import mock_flowscape
+
+BENCH_DIR = "bench_metrics"
+
+
+def _run(args, url):
+    # imported after FLOWSCAPE_URL is set: the target URL is read at import time
+    from artifacts import configure as configure_artifacts
+    from book_seat import driver_rss_bytes, login_flowscape, make_driver
+    from run_metrics import finish_run, report, sample_memory, start_run
+
+    configure_artifacts(args.artifacts)
+    history = os.path.join(args.output, "history.jsonl")
+    os.makedirs(args.output, exist_ok=True)
+    if os.path.exists(history):
+        os.remove(history)
+    session_dir = tempfile.mkdtemp(prefix="flowscape_bench_")
+    session_file = os.path.join(session_dir, "session.json") if args.session_cache else None
+    chrome_args = [f"--host-resolver-rules={mock_flowscape.HOST_RESOLVER_RULES}"]
+
+    results = []
+    driver = None
+    try:
+        for i in range(args.iterations):
+            started = time.perf_counter()
+            start_run(run_id=f"bench_{i:03d}", iteration=i, variant=args.booking_variant)
+            ok = False
+            try:
+                if driver is None:
+                    driver = make_driver(headless=not args.headed, enable_console_logs=False, extra_args=chrome_args,
+                                         lean=args.lean, backend=args.driver_backend)
+                elif not args.session_cache:
+                    driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+                sample_memory(lambda: driver_rss_bytes(driver))
+                ok = login_flowscape(driver, email="bench@example.test", password="bench",
+                                     seat_identifier=args.seat, debug=False, session_file=session_file,
+                                     zone=args.zone)
+            except Exception as e:
+                logging.error("Iteration %d failed: %s", i, e)
+            finally:
+                finish_run(ok, driver, metrics_dir=args.output)
+                if not args.reuse_driver and driver is not None:
+                    driver.quit()
+                    driver = None
+            elapsed = time.perf_counter() - started
+            results.append({"iteration": i, "ok": ok, "seconds": round(elapsed, 3)})
+            logging.info("Iteration %d: %s in %.2fs", i, "OK" if ok else "FAILED", elapsed)
+    finally:
+        if driver is not None:
+            driver.quit()
+        shutil.rmtree(session_dir, ignore_errors=True)
+
+    print(report(metrics_dir=args.output))
+    times = sorted(r["seconds"] for r in results if r["ok"])
+    summary = {
+        "url": url,
+        "iterations": args.iterations,
+        "succeeded": len(times),
+        "end_to_end_p50": times[len(times) // 2] if times else None,
+        "end_to_end_max": times[-1] if times else None,
+        "options": {k: v for k, v in vars(args).items() if k not in ("output",)},
+        "results": results,
+    }
+    with open(os.path.join(args.output, "summary.json"), "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=1)
+    print(f"\nend-to-end: {len(times)}/{args.iterations} succeeded, p50 {summary['end_to_end_p50']}s, "
+          f"max {summary['end_to_end_max']}s")
+    return len(times) == args.iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the booking flow against a local mock Flowscape")
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--seat", type=str, default="ID-6F-277 (UK)")
+    parser.add_argument("--zone", type=str, default=None, help="Accept any seat with this label prefix")
+    parser.add_argument("--taken", type=str, default="", help="Comma-separated seats the mock shows as occupied")
+    parser.add_argument("--latency-ms", type=int, default=0, help="Server latency added to every response")
+    parser.add_argument("--modal-delay-ms", type=int, default=0, help="Delay before the booking popup appears")
+    parser.add_argument("--login-popup", action="store_true", help="Microsoft login opens in a popup window")
+    parser.add_argument("--no-kmsi", action="store_true", help="Skip the 'Stay signed in?' prompt")
+    parser.add_argument("--booking-variant", choices=mock_flowscape.BOOKING_VARIANTS, default="modal")
+    parser.add_argument("--session-cache", action="store_true", help="Reuse the cached session between iterations")
+    parser.add_argument("--reuse-driver", action="store_true", help="Keep one Chrome for all iterations")
+    parser.add_argument("--headed", action="store_true", help="Show the browser")
+    parser.add_argument("--lean", action="store_true", help="Use the low-memory Chrome flag set")
+    parser.add_argument("--driver-backend", choices=("selenium", "cdp"), default="selenium", help="chromedriver or direct DevTools")
+    parser.add_argument("--artifacts", default="off", help="Artifact level during the benchmark")
+    parser.add_argument("--output", type=str, default=BENCH_DIR, help="Directory for per-run metrics and the summary")
+    parser.add_argument("--debug", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO,
+                        format="%(asctime)s %(levelname)s %(message)s")
+    server = mock_flowscape.make_server(
+        latency_ms=args.latency_ms, modal_delay_ms=args.modal_delay_ms, login_popup=args.login_popup,
+        kmsi=not args.no_kmsi, booking_variant=args.booking_variant,
+        taken=[s.strip() for s in args.taken.split(",") if s.strip()])
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = mock_flowscape.app_url(server)
+    os.environ["FLOWSCAPE_URL"] = url
+    logging.info("Mock Flowscape running at %s", url)
+    try:
+        ok = _run(args, url)
+    finally:
+        server.shutdown()
+        server.server_close()
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
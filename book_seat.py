@@ -1,9 +1,4 @@
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium import webdriver
-from selenium.common.exceptions import WebDriverException
-from selenium.webdriver.chrome.service import Service
+import atexit
 import logging
 import os
 import time
@@ -13,66 +8,105 @@ import argparse
 from datetime import datetime
 import shutil
 
-LOG_FILENAME = os.getenv("FLOWSCAPE_LOG", "booking.log")
+from dom_resolver import fill_and_book, resolve_booking_elements, seat_states
+from dom_waits import race, wait_for
+from artifacts import ARTIFACTS, LEVELS as ARTIFACT_LEVELS, configure as configure_artifacts
+from clock_sync import estimate_offset, parse_fire_time, record_timing, wait_until
+from network_profile import (
+    PROFILES as NETWORK_PROFILES, apply_profile, chrome_args as network_chrome_args, follow_window, load_profile,
+)
+from run_metrics import (
+    METRICS_ENABLED, drain_network_log, event, finish_run, report as metrics_report, sample_memory, span, start_run,
+    step, timed,
+)
+from selector_cache import SELECTOR_CACHE, page_fingerprint
+from session_cache import SESSION_FILENAME, clear_session, restore_session, save_session
 
+LOG_FILENAME = os.getenv("FLOWSCAPE_LOG", "booking.log")
+TARGET_URL = os.getenv("FLOWSCAPE_URL") or "https://wsp.flowscape.se/webapp/"
+DEFAULT_START = os.getenv("FLOWSCAPE_START", "08:00")
+DEFAULT_END = os.getenv("FLOWSCAPE_END", "18:00")
 
-def setup_logging(debug: bool):
-    level = logging.DEBUG if debug else logging.INFO
-    logging.basicConfig(
-        level=level,
-        format="%(asctime)s %(levelname)s %(message)s",
-        handlers=[
-            logging.FileHandler(LOG_FILENAME, mode="w", encoding="utf-8"),
-            logging.StreamHandler(sys.stdout),
-        ],
-    )
-    logging.info("Logging initialized. Debug=%s", debug)
 
+class By:
+    # WebDriver locator strategy names; Selenium itself is only imported by
+    # make_driver so --help, --dry-run, --submit and the pools start fast
+    ID = "id"
+    XPATH = "xpath"
+    TAG_NAME = "tag name"
+    CSS_SELECTOR = "css selector"
 
-def _safe_screenshot(driver, name):
-    try:
-        driver.save_screenshot(name)
-        logging.debug("Saved screenshot: %s", name)
-    except Exception as e:
-        logging.debug("Unable to save screenshot %s: %s", name, e)
+# generic dialog heuristic, one race condition per variant so the selector cache can learn the winner
+MODAL_CONDITIONS = [
+    {"name": "role_dialog", "xpath": "//*[@role='dialog']"},
+    {"name": "aria_modal", "xpath": "//*[@aria-modal='true']"},
+    {"name": "class_modal", "xpath": "//*[contains(@class,'modal')]"},
+    {"name": "class_dialog", "xpath": "//*[contains(@class,'Dialog')]"},
+    {"name": "class_popup", "xpath": "//*[contains(@class,'popup')]"},
+]
+# optional prompts after the password step, in order of preference; each only
+# counts once the password form is gone, and leaving the login host ends the race
+MS_PROMPT_CONDITIONS = [
+    {"name": "idBtn_Back", "css": "#idBtn_Back", "clickable": True, "unless": "input[name=passwd]"},
+    {"name": "idBtn_Accept", "css": "#idBtn_Accept", "clickable": True, "unless": "input[name=passwd]"},
+    {"name": "idSIButton9", "css": "#idSIButton9", "clickable": True, "unless": "input[name=passwd]"},
+    {"name": "left_login", "js": "!/microsoftonline|login\\.live/.test(location.hostname)"},
+]
+# seconds before a scheduled fire time at which the server clock is sampled
+CALIBRATION_LEAD = 30
+# estimate_offset needs about one second per tick; with less time left it is skipped
+CALIBRATION_MIN = 5
+# low-memory flag set for packing many browsers on one host: fewer renderer
+# processes, a capped V8 heap and no background services or extensions
+LEAN_CHROME_ARGS = [
+    "--window-size=1280,800",
+    "--disable-extensions",
+    "--disable-default-apps",
+    "--disable-background-networking",
+    "--disable-component-update",
+    "--disable-sync",
+    "--no-first-run",
+    "--mute-audio",
+    "--renderer-process-limit=2",
+    "--disable-site-isolation-trials",
+    "--disable-features=site-per-process,Translate,OptimizationHints,MediaRouter,BackForwardCache",
+    "--js-flags=--max-old-space-size=256",
+]
+# resumable booking stages, in order, and how many extra attempts each one gets
+STAGES = ("open", "auth", "seat", "modal", "times", "book", "confirm")
+STAGE_RETRIES = {"open": 1, "auth": 1, "seat": 2, "modal": 2, "times": 2, "book": 2, "confirm": 0}
+STAGE_RETRY_DELAY = 0.5
+MICROSOFT_BUTTON_XPATH = "//button[contains(., 'Microsoft') or contains(., 'Sign in with Microsoft')]"
 
 
-def _write_file(name, content):
-    try:
-        with open(name, "w", encoding="utf-8") as f:
-            f.write(content)
-        logging.debug("Wrote file: %s", name)
-    except Exception as e:
-        logging.debug("Failed writing file %s: %s", name, e)
+def setup_logging(debug: bool, rollover=True):
+    # queue-backed JSON lines to a rotated LOG_FILENAME plus text on stdout (see log_pipeline);
+    # only the process that owns the log rolls it over
+    from log_pipeline import configure
+    configure(debug, LOG_FILENAME, rollover=rollover)
+    # atexit runs the last registration first: re-register the artifact flush so it
+    # runs before log_pipeline's stop() and its messages still reach the log
+    atexit.unregister(ARTIFACTS.flush)
+    atexit.register(ARTIFACTS.flush)
+    logging.info("Logging initialized. Debug=%s", debug)
 
 
-def _dump_page_state(driver, prefix):
+def _dump_page_state(driver, prefix, failure=False):
     """
-    Save page_source, screenshot and browser console logs (if available).
+    Snapshot page_source, screenshot and browser console logs through the artifact
+    recorder; what is captured and when it is written depends on the artifact level.
     """
     try:
-        _safe_screenshot(driver, f"{prefix}.png")
-    except Exception:
-        pass
-    try:
-        _write_file(f"{prefix}.html", driver.page_source)
-    except Exception:
-        pass
-    # browser console logs (Chrome/Chromium)
-    try:
-        logs = []
-        for entry in driver.get_log("browser"):
-            logs.append(f"{entry.get('level')} {entry.get('source', '')} {entry.get('message')}")
-        _write_file(f"{prefix}_browser_console.log", "\n".join(logs))
-    except Exception:
-        logging.debug("No browser console logs available or get_log failed.")
+        ARTIFACTS.snapshot(driver, prefix, failure=failure)
+    except Exception as e:
+        logging.debug("Failed capturing page state %s: %s", prefix, e)
 
 
 def _log_exception(step_name: str, exc: Exception, driver=None):
     logging.exception("Exception during %s: %s", step_name, exc)
     try:
         suffix = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
-        _dump_page_state(driver, f"error_{step_name}_{suffix}") if driver is not None else None
+        _dump_page_state(driver, f"error_{step_name}_{suffix}", failure=True) if driver is not None else None
     except Exception:
         logging.debug("Failed dumping page state for %s", step_name)
 
@@ -109,79 +143,106 @@ def _set_input_value(driver, element, value):
         return False
 
 
-def _find_time_input_within(driver, container):
+def _set_date_value(driver, element, value):
+    """
+    Set a YYYY-MM-DD date and read it back: typed into input[type=date] the
+    digits often go to the wrong segments (the order follows the locale), so
+    fall back to the native value setter. Returns True only when the input
+    holds value.
+    """
+    _set_input_value(driver, element, value)
+    if element.get_attribute("value") == value:
+        return True
+    logging.debug("Typed date not accepted (input holds %r); setting it through the value setter",
+                  element.get_attribute("value"))
+    try:
+        driver.execute_script(
+            "var el = arguments[0];"
+            "Object.getOwnPropertyDescriptor(HTMLInputElement.prototype, 'value').set.call(el, arguments[1]);"
+            "['input', 'change', 'blur'].forEach(function(t) { el.dispatchEvent(new Event(t, {bubbles: true})); });",
+            element,
+            value,
+        )
+    except Exception as e:
+        logging.debug("Setting the date through the value setter failed: %s", e)
+    return element.get_attribute("value") == value
+
+
+def _find_time_input_within(driver, container, fingerprint=None):
     """
     Return dict with 'start' and 'end' input elements if found, else None entries.
+    With a page fingerprint the locator variants are tried in the order learned
+    by the selector cache.
     """
     result = {"start": None, "end": None}
     base = "." if container is not None else ""
-    start_xpaths = [
-        f"{base}//input[@type='time' and (contains(translate(@aria-label, 'ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz'), 'start') or contains(translate(@placeholder, 'ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz'), 'start'))]",
-        f"{base}//input[(contains(translate(@aria-label, 'ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz'), 'start') or contains(translate(@placeholder, 'ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz'), 'start') or contains(translate(@name, 'ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz'), 'start'))]",
-        f"{base}//label[contains(translate(., 'ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz'), 'start')]/following::input[1]",
-    ]
-    end_xpaths = [
-        f"{base}//input[@type='time' and (contains(translate(@aria-label, 'ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz'), 'end') or contains(translate(@placeholder, 'ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz'), 'end'))]",
-        f"{base}//input[(contains(translate(@aria-label, 'ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz'), 'end') or contains(translate(@placeholder, 'ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz'), 'end') or contains(translate(@name, 'ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz'), 'end'))]",
-        f"{base}//label[contains(translate(., 'ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz'), 'end')]/following::input[1]",
-    ]
+    scope = "modal" if container is not None else "global"
 
-    try:
-        for xp in start_xpaths:
-            elems = container.find_elements(By.XPATH, xp) if container is not None else driver.find_elements(By.XPATH, xp)
-            if elems:
-                result["start"] = elems[0]
+    def _xpaths(word):
+        return [
+            ("time_attr", f"{base}//input[@type='time' and (contains(translate(@aria-label, 'ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz'), '{word}') or contains(translate(@placeholder, 'ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz'), '{word}'))]"),
+            ("any_attr", f"{base}//input[(contains(translate(@aria-label, 'ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz'), '{word}') or contains(translate(@placeholder, 'ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz'), '{word}') or contains(translate(@name, 'ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz'), '{word}'))]"),
+            ("label", f"{base}//label[contains(translate(., 'ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz'), '{word}')]/following::input[1]"),
+        ]
+
+    def _first(xp):
+        elems = container.find_elements(By.XPATH, xp) if container is not None else driver.find_elements(By.XPATH, xp)
+        return elems[0] if elems else None
+
+    def _nth_time_input(index):
+        # fallback: first two input[type=time]
+        time_inputs = (container.find_elements(By.XPATH, ".//input[@type='time']") if container is not None else driver.find_elements(By.XPATH, "//input[@type='time']"))
+        return time_inputs[index] if len(time_inputs) >= 2 else None
+
+    for index, key in enumerate(("start", "end")):
+        strategies = [(name, lambda first, xp=xp: _first(xp)) for name, xp in _xpaths(key)]
+        strategies.append(("first_two_time", lambda first, i=index: _nth_time_input(i)))
+        if fingerprint:
+            result[key] = SELECTOR_CACHE.first_hit(fingerprint, f"{key}_input_{scope}", strategies)[1]
+            continue
+        for _, fn in strategies:
+            try:
+                result[key] = fn(False)
+            except Exception:
+                result[key] = None
+            if result[key]:
                 break
-    except Exception:
-        pass
 
+    return result
+
+
+def _find_date_input_within(driver, container):
+    """
+    Return the booking date input (input[type=date] or a date-labelled input) or None.
+    """
+    base = "." if container is not None else ""
+    xpaths = [
+        f"{base}//input[@type='date']",
+        f"{base}//input[contains(translate(@aria-label, 'ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz'), 'date') or contains(translate(@name, 'ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz'), 'date')]",
+    ]
     try:
-        for xp in end_xpaths:
+        for xp in xpaths:
             elems = container.find_elements(By.XPATH, xp) if container is not None else driver.find_elements(By.XPATH, xp)
             if elems:
-                result["end"] = elems[0]
-                break
+                return elems[0]
     except Exception:
         pass
+    return None
 
-    # fallback: first two input[type=time]
-    try:
-        if (not result["start"] or not result["end"]):
-            time_inputs = (container.find_elements(By.XPATH, ".//input[@type='time']") if container is not None else driver.find_elements(By.XPATH, "//input[@type='time']"))
-            if len(time_inputs) >= 2:
-                if not result["start"]:
-                    result["start"] = time_inputs[0]
-                if not result["end"]:
-                    result["end"] = time_inputs[1]
-    except Exception:
-        pass
 
-    return result
-
-
-def login_flowscape(driver, email=None, password=None, seat_identifier="ID-6F-280 (UK)", debug=True):
+@timed("sso")
+def _sso_login(driver, current_window, email=None, password=None):
     """
-    Full flow with extensive logging and state dumps. Returns True on success.
+    Microsoft SSO: click the sign-in button, fill credentials, dismiss the optional
+    prompts and switch back to the Flowscape window. Returns True on success.
     """
-    wait = WebDriverWait(driver, 30)
-    current_window = None
-    try:
-        logging.info("Opening target URL")
-        target_url = os.getenv("FLOWSCAPE_URL") or "https://wsp.flowscape.se/webapp/"
-        driver.get(target_url)
-        current_window = driver.current_window_handle
-        logging.info("Opened %s (handle=%s)", target_url, current_window)
-        _dump_page_state(driver, "after_open")
-    except Exception as e:
-        _log_exception("open_page", e, driver)
-        return False
-
     # 1. Click "Sign in with Microsoft"
+    step("click_microsoft")
     try:
         logging.info("Waiting for Microsoft sign-in button")
-        microsoft_btn = wait.until(
-            EC.element_to_be_clickable((By.XPATH, "//button[contains(., 'Microsoft') or contains(., 'Sign in with Microsoft')]"))
-        )
+        microsoft_btn = wait_for(driver, xpath=MICROSOFT_BUTTON_XPATH, timeout=30, clickable=True)
+        if microsoft_btn is None:
+            raise TimeoutError("Microsoft sign-in button did not appear")
         logging.info("Clicking Microsoft sign-in button")
         microsoft_btn.click()
         logging.debug("Clicked Microsoft sign-in")
@@ -189,15 +250,18 @@ def login_flowscape(driver, email=None, password=None, seat_identifier="ID-6F-28
         _log_exception("click_microsoft", e, driver)
         return False
 
-    # handle potential new window
+    # handle potential new window: race a popup against the login form appearing in place
+    step("login_window")
     try:
         logging.info("Checking for new login window")
-        WebDriverWait(driver, 5).until(lambda d: len(d.window_handles) > 1)
-        for handle in driver.window_handles:
-            if handle != current_window:
-                driver.switch_to.window(handle)
-                logging.info("Switched to login window: %s", handle)
-                break
+        name, handle = race(driver, [{"name": "login_form", "css": "input[name=loginfmt]"}], 5,
+                            watch_windows=True, known_handles={current_window})
+        if name == "window":
+            driver.switch_to.window(handle)
+            follow_window(driver)
+            logging.info("Switched to login window: %s", handle)
+        else:
+            logging.info("No new login window detected; continuing in same window")
     except Exception:
         logging.info("No new login window detected; continuing in same window")
 
@@ -206,10 +270,13 @@ def login_flowscape(driver, email=None, password=None, seat_identifier="ID-6F-28
     PASSWORD = password or os.getenv("FLOWSCAPE_PASS")
     logging.debug("Using username from env present=%s", bool(USERNAME))
 
+    step("email")
     try:
         # Enter email
         logging.info("Filling email")
-        email_field = WebDriverWait(driver, 30).until(EC.presence_of_element_located((By.NAME, "loginfmt")))
+        email_field = wait_for(driver, css="input[name=loginfmt]", timeout=30)
+        if email_field is None:
+            raise TimeoutError("email field did not appear")
         email_field.clear()
         email_field.send_keys(USERNAME)
         driver.find_element(By.ID, "idSIButton9").click()
@@ -218,33 +285,38 @@ def login_flowscape(driver, email=None, password=None, seat_identifier="ID-6F-28
         _log_exception("enter_email", e, driver)
         return False
 
+    step("password")
     try:
         logging.info("Filling password")
-        password_field = WebDriverWait(driver, 30).until(EC.element_to_be_clickable((By.NAME, "passwd")))
+        password_field = wait_for(driver, css="input[name=passwd]", timeout=30, clickable=True)
+        if password_field is None:
+            raise TimeoutError("password field did not appear")
         password_field.clear()
         password_field.send_keys(PASSWORD)
-        WebDriverWait(driver, 30).until(EC.element_to_be_clickable((By.ID, "idSIButton9"))).click()
+        sign_in = wait_for(driver, css="#idSIButton9", timeout=30, clickable=True)
+        if sign_in is None:
+            raise TimeoutError("sign-in button did not become clickable")
+        sign_in.click()
         logging.debug("Password entered and signed in")
     except Exception as e:
         _log_exception("enter_password", e, driver)
         return False
 
-    # handle optional MS prompts
+    # handle optional MS prompts: race every prompt against leaving the login pages
+    step("prompts")
     try:
         logging.info("Handling optional MS prompts (if any)")
-        time.sleep(1)
-        for btn_id in ("idBtn_Back", "idBtn_Accept", "idSIButton9"):
-            try:
-                btn = WebDriverWait(driver, 3).until(EC.element_to_be_clickable((By.ID, btn_id)))
-                btn.click()
-                logging.info("Clicked MS optional button %s", btn_id)
-                break
-            except Exception:
-                continue
+        name, btn = race(driver, MS_PROMPT_CONDITIONS, 5)
+        if name and btn is not None:
+            btn.click()
+            logging.info("Clicked MS optional button %s", name)
+        else:
+            logging.debug("No optional MS prompt (result=%s)", name)
     except Exception:
         logging.debug("No optional MS prompt handled")
 
     # switch back to flowscape main window
+    step("switch_back")
     try:
         logging.info("Switching back to main Flowscape window")
         main_handle = None
@@ -265,205 +337,632 @@ def login_flowscape(driver, email=None, password=None, seat_identifier="ID-6F-28
     except Exception as e:
         logging.debug("Error while switching back to main app: %s", e)
 
-    # find and click seat
-    try:
+    return True
+
+
+def _wait_for_app(driver, seat_identifier, timeout=15):
+    """
+    Wait until either the floor plan (seat element) or the Microsoft sign-in
+    button is present. Returns "app", "login" or None on timeout.
+    """
+    seat_prefix = seat_identifier.split()[0]
+    seat_xpath = f"//*[contains(@aria-label, \"{seat_prefix}\") or contains(@title, \"{seat_prefix}\")]"
+
+    name, _ = race(driver, [
+        {"name": "app", "xpath": seat_xpath},
+        {"name": "login", "xpath": MICROSOFT_BUTTON_XPATH},
+        {"name": "login", "css": "input[name=loginfmt]"},
+    ], timeout)
+    return name
+
+
+def _stage_retries():
+    """
+    STAGE_RETRIES overridden by FLOWSCAPE_STAGE_RETRIES ("seat=3,book=2").
+    """
+    retries = dict(STAGE_RETRIES)
+    for item in filter(None, os.getenv("FLOWSCAPE_STAGE_RETRIES", "").split(",")):
+        name, _, value = item.partition("=")
+        if name.strip() not in retries:
+            raise ValueError(f"unknown stage {name.strip()!r} in FLOWSCAPE_STAGE_RETRIES; expected one of {', '.join(STAGES)}")
+        retries[name.strip()] = int(value)
+    return retries
+
+
+class _Flow:
+    """
+    Everything the stages hand to each other, so a stage can be re-run on its own.
+    """
+    def __init__(self, driver, seat_identifier, window=None, email=None, password=None, session_file=None,
+                 start_time=DEFAULT_START, end_time=DEFAULT_END, booking_date=None, zone=None):
+        self.driver = driver
+        # seat_identifier may be a comma-separated ranked list; zone adds every seat with that prefix
+        self.candidates = [s.strip() for s in seat_identifier.split(",") if s.strip()]
+        self.zone = zone
+        self.seat_identifier = self.candidates[0] if self.candidates else zone
+        self.tried = set()
+        self.window = window
+        self.email = email
+        self.password = password
+        self.session_file = session_file
+        self.start_time = start_time
+        self.end_time = end_time
+        self.booking_date = booking_date
+        self.restore_attempted = False
+        self.restored = False
+        self.fingerprint = None
+        self.handles_before_click = None
+        self.modal = None
+        self.iframe_switched = False
+        self.popup_handle = None
+        self.clicked = False
+        self.failure = None
+        # watch mode only books seats the plan explicitly marks free
+        self.require_free = False
+
+
+def _stage_open(flow):
+    driver = flow.driver
+    if flow.session_file and not flow.restore_attempted:
+        flow.restore_attempted = True
+        flow.restored = restore_session(driver, flow.session_file)
+    logging.info("Opening target URL")
+    driver.get(TARGET_URL)
+    flow.window = driver.current_window_handle
+    logging.info("Opened %s (handle=%s)", TARGET_URL, flow.window)
+    _dump_page_state(driver, "after_open")
+    return True
+
+
+def _stage_auth(flow):
+    driver = flow.driver
+    state = _wait_for_app(driver, flow.seat_identifier)
+    if state == "app":
+        if flow.restored:
+            logging.info("Cached session accepted; skipping Microsoft SSO")
+        return True
+    if flow.restored:
+        logging.info("Cached session rejected (state=%s); falling back to Microsoft SSO", state)
+        clear_session(flow.session_file)
+        flow.restored = False
+    if not _sso_login(driver, flow.window, flow.email, flow.password):
+        return False
+    if flow.session_file and _wait_for_app(driver, flow.seat_identifier) == "app":
+        save_session(driver, flow.session_file)
+    return True
+
+
+def _pick_seat(flow):
+    """
+    Scan the availability of all candidate seats at once and return the
+    element of the best-ranked one that is not known to be taken (with
+    flow.require_free: that is marked free) and has not been tried yet in
+    this flow (None when there is none). The plan shows today's
+    availability, so for another booking date the states are ignored and
+    the candidates are tried in rank order.
+    """
+    driver = flow.driver
+    other_day = bool(flow.booking_date) and flow.booking_date != datetime.now().strftime("%Y-%m-%d")
+    prefixes = [s.split()[0] for s in flow.candidates] + ([flow.zone] if flow.zone else [])
+    plan_xpath = "//*[" + " or ".join(f"contains(@aria-label, \"{p}\") or contains(@title, \"{p}\")"
+                                      for p in prefixes) + "]"
+    if wait_for(driver, xpath=plan_xpath, timeout=15) is None:
+        return None
+    seats = seat_states(driver, flow.candidates, flow.zone)
+    logging.info("Seat scan: %s", ", ".join(f"{s['label']}={s['state']}" for s in seats) or "no candidates on the plan")
+    if other_day:
+        logging.info("Booking for %s: the plan shows today's availability, so seats are tried in rank order",
+                     flow.booking_date)
+        seats = [dict(seat, state="unknown") for seat in seats]
+    for seat in seats:
+        if seat["state"] == "taken" or seat["label"] in flow.tried:
+            continue
+        if flow.require_free and seat["state"] != "free":
+            continue
+        flow.tried.add(seat["label"])
+        flow.seat_identifier = seat["label"]
+        event("seat_chosen", seat=seat["label"], state=seat["state"], rank=seats.index(seat))
+        return seat["element"]
+    return None
+
+
+def _stage_seat(flow):
+    # find and click seat, trying the locator that worked last time first
+    driver, seat_identifier = flow.driver, flow.seat_identifier
+    flow.fingerprint = page_fingerprint(driver)
+    if len(flow.candidates) > 1 or flow.zone:
+        logging.info("Choosing among seats: %s%s", ", ".join(flow.candidates),
+                     f" + zone {flow.zone}" if flow.zone else "")
+        my_seat = _pick_seat(flow)
+        if not my_seat:
+            logging.error("No free candidate seat - dumping page")
+            _dump_page_state(driver, "no_free_seat", failure=True)
+            return False
+        logging.info("Found seat element (scan): %s", flow.seat_identifier)
+    else:
         logging.info("Locating seat: %s", seat_identifier)
         xpath_exact = f"//*[@aria-label=\"{seat_identifier}\" or @title=\"{seat_identifier}\"]"
-        xpath_contains = f"//*[contains(@aria-label, \"{seat_identifier.split()[0]}\") or contains(@title, \"{seat_identifier.split()[0]}\")]"
-        my_seat = None
-        try:
-            my_seat = WebDriverWait(driver, 15).until(EC.element_to_be_clickable((By.XPATH, xpath_exact)))
-            logging.info("Found exact seat element")
-        except Exception:
-            logging.info("Exact seat not found; trying contains fallback")
-            candidates = driver.find_elements(By.XPATH, xpath_contains)
-            for c in candidates:
-                try:
-                    aria = c.get_attribute("aria-label") or c.get_attribute("title") or c.text or ""
-                    if seat_identifier.split()[0] in aria:
-                        my_seat = c
-                        break
-                except Exception:
-                    continue
+        # the seat id followed by a suffix such as " (UK)": never a longer id like ID-6F-2770
+        seat_id = seat_identifier.split()[0]
+        xpath_contains = "//*[" + " or ".join(f"{attr}=\"{seat_id}\" or starts-with({attr}, \"{seat_id} \") or "
+                                              f"starts-with({attr}, \"{seat_id}(\")"
+                                              for attr in ("@aria-label", "@title")) + "]"
+        # exact always goes first: which element gets clicked must not depend on past misses
+        strategy, my_seat = SELECTOR_CACHE.first_hit(flow.fingerprint, "seat", [
+            ("exact", lambda first: wait_for(driver, xpath=xpath_exact, timeout=15 if first else 2, clickable=True)),
+            ("contains", lambda first: wait_for(driver, xpath=xpath_contains, timeout=15 if first else 2)),
+        ], pinned=("exact", "contains"))
         if not my_seat:
-            logging.error("Seat element not found - dumping page and returning")
-            _dump_page_state(driver, "seat_not_found")
+            logging.error("Seat element not found - dumping page")
+            _dump_page_state(driver, "seat_not_found", failure=True)
             return False
+        logging.info("Found seat element (%s)", strategy)
 
-        logging.info("Clicking seat element")
-        driver.execute_script("arguments[0].scrollIntoView({block: 'center'})", my_seat)
-        driver.execute_script("arguments[0].click();", my_seat)
-        _dump_page_state(driver, "after_seat_click")
-    except Exception as e:
-        _log_exception("click_seat", e, driver)
+    logging.info("Clicking seat element")
+    flow.handles_before_click = set(driver.window_handles)
+    driver.execute_script("arguments[0].scrollIntoView({block: 'center'})", my_seat)
+    driver.execute_script("arguments[0].click();", my_seat)
+    _dump_page_state(driver, "after_seat_click")
+    return True
+
+
+def _stage_modal(flow):
+    # detect popup/modal or new window for booking
+    driver, fingerprint = flow.driver, flow.fingerprint
+    flow.modal, flow.iframe_switched, flow.popup_handle = None, False, None
+    logging.info("Detecting booking popup/modal or window")
+    # race a separate popup window against an in-page modal
+    modal_order = SELECTOR_CACHE.order(fingerprint, "modal", [c["name"] for c in MODAL_CONDITIONS])
+    modal_conditions = sorted(MODAL_CONDITIONS, key=lambda c: modal_order.index(c["name"]))
+    started = time.monotonic()
+    name, found = race(driver, modal_conditions, 8, watch_windows=True, known_handles=flow.handles_before_click)
+    if name == "window":
+        flow.popup_handle = found
+        driver.switch_to.window(found)
+        follow_window(driver)
+        logging.info("Switched to popup window: %s", found)
+        started = time.monotonic()
+        name, found = race(driver, modal_conditions, 8)
+    else:
+        logging.debug("No separate popup window detected")
+    if name is not None:
+        flow.modal = found
+        SELECTOR_CACHE.record(fingerprint, "modal", name, True, (time.monotonic() - started) * 1000)
+        logging.info("Found modal element for booking (%s)", name)
+    else:
+        SELECTOR_CACHE.record(fingerprint, "modal", modal_order[0], False)
+        logging.debug("Modal not detected by role/class heuristics")
+
+    # if modal contains iframe, switch into it
+    try:
+        if flow.modal is not None:
+            iframes = flow.modal.find_elements(By.TAG_NAME, "iframe")
+            if iframes:
+                driver.switch_to.frame(iframes[0])
+                flow.iframe_switched = True
+                logging.info("Switched into iframe inside modal")
+    except Exception:
+        logging.debug("No iframe inside modal or switching failed")
+
+    _dump_page_state(driver, "popup_detected")
+    return True
+
+
+def _stage_times(flow):
+    # single call (resolve inputs and Book, then fill and click) or the step-by-step
+    # cascade, whichever has been working on this page
+    driver = flow.driver
+    modal = flow.modal if not flow.iframe_switched else None
+    flow.clicked = False
+    failures = []
+
+    def _single_call(first):
+        elements = resolve_booking_elements(driver, flow.seat_identifier, modal)
+        if not (elements.get("start") and elements.get("end") and elements.get("book")):
+            return False
+        logging.info("Setting start/end times %s-%s and clicking Book (single call)", flow.start_time, flow.end_time)
+        flow.clicked = fill_and_book(driver, elements, flow.start_time, flow.end_time, flow.booking_date)
+        return flow.clicked
+
+    def _step_by_step(first):
+        failure = _set_booking_times(driver, modal, flow.start_time, flow.end_time, flow.booking_date, flow.fingerprint)
+        if failure:
+            failures.append(failure)
+        return failure is None
+
+    strategy, filled = SELECTOR_CACHE.first_hit(flow.fingerprint, "fill_and_book", [
+        ("single_call", _single_call),
+        ("step_by_step", _step_by_step),
+    ])
+    if not filled:
+        flow.failure = failures[-1] if failures else "set_time_failed"
+        _dump_page_state(driver, flow.failure, failure=True)
+    return bool(filled)
+
+
+def _stage_book(flow):
+    driver = flow.driver
+    if not flow.clicked:
+        failure = _click_book_button(driver, flow.modal if not flow.iframe_switched else None)
+        if failure:
+            _dump_page_state(driver, failure, failure=True)
+            return False
+        flow.clicked = True
+
+    # restore contexts before waiting for the confirmation
+    try:
+        if flow.iframe_switched:
+            driver.switch_to.default_content()
+            flow.iframe_switched = False
+        if flow.popup_handle:
+            # give the popup up to a second to close itself before closing it
+            deadline = time.monotonic() + 1
+            while flow.popup_handle in driver.window_handles and time.monotonic() < deadline:
+                time.sleep(0.05)
+            if flow.popup_handle in driver.window_handles:
+                try:
+                    driver.close()
+                except Exception:
+                    pass
+            flow.popup_handle = None
+            driver.switch_to.window(flow.window)
+    except Exception:
+        logging.debug("Failed restoring windows/frames after clicking Book")
+    return True
+
+
+def _stage_confirm(flow):
+    driver = flow.driver
+    logging.info("Waiting for booking confirmation indicator")
+    success_xpath = "//*[contains(translate(., 'ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz'), 'confirmed') or contains(translate(., 'ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz'), 'booked') or contains(translate(., 'ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz'), 'success') or contains(translate(., 'ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz'), 'reservation')]"
+    if wait_for(driver, xpath=success_xpath, timeout=15) is None:
+        logging.warning("No explicit confirmation found after booking click. Dumping final state.")
+        _dump_page_state(driver, "booking_no_confirmation", failure=True)
         return False
+    logging.info("Booking appears successful (confirmation found)")
+    _dump_page_state(driver, "booking_success")
+    return True
+
+
+_STAGE_FUNCS = {
+    "open": _stage_open,
+    "auth": _stage_auth,
+    "seat": _stage_seat,
+    "modal": _stage_modal,
+    "times": _stage_times,
+    "book": _stage_book,
+    "confirm": _stage_confirm,
+}
 
-    # detect popup/modal or new window for booking and fill Start/End times
-    popup_handle_switched = False
-    iframe_switched = False
-    modal = None
+
+def _resume_stage(flow, failed):
+    """
+    Look at the page after a failed stage and return the stage to resume from:
+    the failed one if its inputs are still in place, otherwise the earliest
+    stage whose result has been lost (the modal closed, the session expired,
+    the window died).
+    """
+    if failed in ("open", "confirm"):
+        # re-clicking Book after an unconfirmed booking could book twice
+        return failed
+    driver = flow.driver
+    modal_alive = False
     try:
-        logging.info("Detecting booking popup/modal or window")
-        # short time to allow popup window to appear
-        try:
-            WebDriverWait(driver, 3).until(lambda d: len(d.window_handles) > 1)
-            for handle in driver.window_handles:
-                if handle != driver.current_window_handle:
-                    popup_handle_switched = True
-                    driver.switch_to.window(handle)
-                    logging.info("Switched to popup window: %s", handle)
-                    break
-        except Exception:
-            logging.debug("No separate popup window detected")
+        handles = driver.window_handles
+        if failed in ("times", "book"):
+            if flow.popup_handle:
+                modal_alive = flow.popup_handle in handles
+            elif flow.modal is not None:
+                driver.switch_to.default_content()
+                modal_alive = flow.modal.is_displayed()
+        if modal_alive:
+            # re-detect the modal, which also re-enters its window and iframe
+            driver.switch_to.default_content()
+            driver.switch_to.window(flow.window)
+            return "modal"
+        for handle in handles:
+            if handle != flow.window and handle not in (flow.handles_before_click or ()):
+                driver.switch_to.window(handle)
+                driver.close()
+        if flow.window not in driver.window_handles:
+            driver.switch_to.new_window("tab")
+            flow.window = driver.current_window_handle
+            return "open"
+        driver.switch_to.window(flow.window)
+        driver.switch_to.default_content()
+    except Exception as e:
+        logging.debug("Could not restore the main window (%s); reopening", e)
+        return "open"
+    flow.modal, flow.iframe_switched, flow.popup_handle = None, False, None
+    state = _wait_for_app(driver, flow.seat_identifier, timeout=5)
+    if state == "login":
+        return "auth"
+    if state is None:
+        return "open"
+    return "seat"
 
-        # try to find modal
-        try:
-            modal = WebDriverWait(driver, 8).until(
-                EC.presence_of_element_located((By.XPATH, "//*[@role='dialog' or @aria-modal='true' or contains(@class,'modal') or contains(@class,'Dialog') or contains(@class,'popup')]"))
-            )
-            logging.info("Found modal element for booking")
-        except Exception:
-            logging.debug("Modal not detected by role/class heuristics")
 
-        # if modal contains iframe, switch into it
+def _run_stages(flow, first, last):
+    """
+    Run the stages first..last in order. A failed stage is retried up to its
+    STAGE_RETRIES budget, resuming from whatever _resume_stage() finds on the
+    page instead of restarting the whole flow. Returns True when last completed.
+    """
+    retries = _stage_retries()
+    failures = {}
+    index, end = STAGES.index(first), STAGES.index(last)
+    while index <= end:
+        stage = STAGES[index]
+        # streams the previous stage's requests to the network trace (no-op unless tracing)
+        drain_network_log(flow.driver)
+        step(stage)
         try:
-            if modal is not None:
-                iframes = modal.find_elements(By.TAG_NAME, "iframe")
-                if iframes:
-                    driver.switch_to.frame(iframes[0])
-                    iframe_switched = True
-                    logging.info("Switched into iframe inside modal")
-        except Exception:
-            logging.debug("No iframe inside modal or switching failed")
+            ok = _STAGE_FUNCS[stage](flow)
+        except Exception as e:
+            _log_exception(stage, e, flow.driver)
+            ok = False
+        if ok:
+            index += 1
+            continue
+        failures[stage] = failures.get(stage, 0) + 1
+        if failures[stage] > retries[stage]:
+            logging.error("Stage %s failed %d time(s); giving up", stage, failures[stage])
+            _restore_contexts(flow.driver, flow.iframe_switched, flow.popup_handle is not None, flow.window)
+            return False
+        resume = _resume_stage(flow, stage)
+        index = min(STAGES.index(resume), index)
+        logging.warning("Stage %s failed (attempt %d of %d); resuming at %s", stage, failures[stage],
+                        retries[stage] + 1, STAGES[index])
+        event("stage_retry", stage=stage, resume=STAGES[index], attempt=failures[stage])
+        time.sleep(STAGE_RETRY_DELAY)
+    return True
 
-        # dump state now
-        _dump_page_state(driver, "popup_detected")
-    except Exception as e:
-        _log_exception("detect_popup", e, driver)
-        return False
 
-    # locate time inputs
+@timed("authenticate")
+def open_and_authenticate(driver, email=None, password=None, seat_identifier="ID-6F-280 (UK)",
+                          session_file=SESSION_FILENAME, zone=None):
+    """
+    Open the Flowscape web app and make sure the session is authenticated.
+    When session_file is set, a cached session is restored before opening the
+    target URL and the Microsoft SSO path only runs if that session is rejected.
+    Returns the main window handle on success, None on failure.
+    """
+    flow = _Flow(driver, seat_identifier, email=email, password=password, session_file=session_file, zone=zone)
+    return flow.window if _run_stages(flow, "open", "auth") else None
+
+
+def _restore_contexts(driver, iframe_switched, popup_handle_switched, current_window):
     try:
-        inputs = _find_time_input_within(driver, modal if not iframe_switched else None)
+        if iframe_switched:
+            driver.switch_to.default_content()
+        if popup_handle_switched:
+            try:
+                driver.close()
+            except Exception:
+                pass
+            driver.switch_to.window(current_window)
+    except Exception:
+        logging.debug("Failed restoring windows/frames")
+
+
+def _set_booking_times(driver, modal, start_time, end_time, booking_date=None, fingerprint=None):
+    """
+    Step-by-step path: locate the time inputs with the XPath cascade and set
+    them one by one. Returns None on success, otherwise the name of the
+    failure dump.
+    """
+    try:
+        inputs = _find_time_input_within(driver, modal, fingerprint)
         if not inputs["start"] or not inputs["end"]:
             logging.info("Primary selectors didn't find start/end; trying global search")
-            inputs = _find_time_input_within(driver, None)
+            inputs = _find_time_input_within(driver, None, fingerprint)
 
         if not inputs["start"] or not inputs["end"]:
-            logging.error("Start/end inputs not found - dumping and returning")
-            _dump_page_state(driver, "time_inputs_not_found")
-            # restore contexts
-            if iframe_switched:
-                driver.switch_to.default_content()
-            if popup_handle_switched:
-                try:
-                    driver.close()
-                except Exception:
-                    pass
-                driver.switch_to.window(current_window)
-            return False
+            logging.error("Start/end inputs not found")
+            return "time_inputs_not_found"
 
-        logging.info("Setting start/end times")
-        if not _set_input_value(driver, inputs["start"], "08:00") or not _set_input_value(driver, inputs["end"], "18:00"):
+        if booking_date:
+            date_input = _find_date_input_within(driver, modal)
+            if date_input is None:
+                logging.error("No date input found in booking popup; not booking %s", booking_date)
+                return "date_input_not_found"
+            if not _set_date_value(driver, date_input, booking_date):
+                logging.error("Failed to set booking date %s", booking_date)
+                return "set_date_failed"
+            logging.info("Set booking date %s", booking_date)
+
+        logging.info("Setting start/end times %s-%s", start_time, end_time)
+        if not _set_input_value(driver, inputs["start"], start_time) or not _set_input_value(driver, inputs["end"], end_time):
             logging.error("Failed to set start/end values")
-            _dump_page_state(driver, "set_time_failed")
-            if iframe_switched:
-                driver.switch_to.default_content()
-            if popup_handle_switched:
-                try:
-                    driver.close()
-                except Exception:
-                    pass
-                driver.switch_to.window(current_window)
-            return False
+            return "set_time_failed"
         _dump_page_state(driver, "after_setting_times")
+        return None
     except Exception as e:
         _log_exception("set_times", e, driver)
-        return False
+        return "set_time_failed"
 
-    # click Book button
+
+def _click_book_button(driver, modal):
+    """
+    Click the first usable Book/Confirm button, in the modal first. Returns
+    None on success, otherwise the name of the failure dump.
+    """
     try:
         logging.info("Attempting to click Book/Confirm button")
         book_btn_candidates = []
-        if modal is not None and not iframe_switched:
+        if modal is not None:
             book_btn_candidates = modal.find_elements(By.XPATH, ".//button[contains(., 'Book') or contains(., 'BOOK') or contains(., 'Book now') or contains(., 'Confirm') or contains(., 'OK') or contains(., 'Ok') or contains(., 'Yes')]")
         if not book_btn_candidates:
             book_btn_candidates = driver.find_elements(By.XPATH, "//button[contains(., 'Book') or contains(., 'BOOK') or contains(., 'Book now') or contains(., 'Confirm') or contains(., 'OK') or contains(., 'Ok') or contains(., 'Yes')]")
 
-        clicked = False
         for btn in book_btn_candidates:
             try:
                 if btn.is_displayed() and btn.is_enabled():
                     driver.execute_script("arguments[0].scrollIntoView({block: 'center'})", btn)
                     driver.execute_script("arguments[0].click();", btn)
-                    clicked = True
                     logging.info("Clicked a Book/Confirm button candidate")
-                    break
-            except Exception:
+                    return None
+            except Exception as e:
+                logging.debug("Book candidate skipped: %s", e, extra={"sample": True})
                 continue
 
-        if not clicked:
-            logging.error("Could not find or click the Book button")
-            _dump_page_state(driver, "book_button_not_clicked")
-            if iframe_switched:
-                driver.switch_to.default_content()
-            if popup_handle_switched:
-                try:
-                    driver.close()
-                except Exception:
-                    pass
-                driver.switch_to.window(current_window)
-            return False
+        logging.error("Could not find or click the Book button")
+        return "book_button_not_clicked"
     except Exception as e:
         _log_exception("click_book", e, driver)
-        return False
+        return "book_button_not_clicked"
 
-    # restore contexts and wait for confirmation
-    try:
-        if iframe_switched:
-            driver.switch_to.default_content()
-        if popup_handle_switched:
-            time.sleep(1)
-            try:
-                driver.close()
-            except Exception:
-                pass
-            driver.switch_to.window(current_window)
-    except Exception:
-        logging.debug("Failed restoring windows/frames after clicking Book")
 
+def book_on_page(driver, seat_identifier, current_window, debug=True, start_time=DEFAULT_START,
+                 end_time=DEFAULT_END, booking_date=None, flow=None, zone=None):
+    """
+    Click the seat on an authenticated floor plan, fill the booking popup and
+    wait for the confirmation. seat_identifier may be a comma-separated ranked
+    list, extended by every seat starting with zone; the best free one is
+    booked. booking_date (YYYY-MM-DD) is set in the booking popup; if the
+    popup has no date input that accepts it, nothing is booked. A flow left by open_and_authenticate-style
+    callers lets a lost session be re-authenticated mid-booking. Returns True
+    on success.
+    """
+    if flow is None:
+        flow = _Flow(driver, seat_identifier, window=current_window, zone=zone)
+    flow.start_time, flow.end_time, flow.booking_date = start_time, end_time, booking_date
     try:
-        logging.info("Waiting for booking confirmation indicator")
-        success_xpath = "//*[contains(translate(., 'ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz'), 'confirmed') or contains(translate(., 'ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz'), 'booked') or contains(translate(., 'ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz'), 'success') or contains(translate(., 'ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz'), 'reservation')]"
-        WebDriverWait(driver, 15).until(EC.presence_of_element_located((By.XPATH, success_xpath)))
-        logging.info("Booking appears successful (confirmation found)")
-        _dump_page_state(driver, "booking_success")
-        return True
-    except Exception:
-        logging.warning("No explicit confirmation found after booking click. Dumping final state.")
-        _dump_page_state(driver, "booking_no_confirmation")
+        return _book_on_page(flow)
+    finally:
+        SELECTOR_CACHE.save()
+
+
+@timed("book")
+def _book_on_page(flow):
+    return _run_stages(flow, "seat", "confirm")
+
+
+def login_flowscape(driver, email=None, password=None, seat_identifier="ID-6F-280 (UK)", debug=True,
+                    session_file=SESSION_FILENAME, start_time=DEFAULT_START, end_time=DEFAULT_END, booking_date=None,
+                    zone=None):
+    """
+    Full flow with extensive logging and state dumps. Returns True on success.
+    """
+    flow = _Flow(driver, seat_identifier, email=email, password=password, session_file=session_file, zone=zone)
+    with span("authenticate"):
+        if not _run_stages(flow, "open", "auth"):
+            return False
+    return book_on_page(driver, seat_identifier, flow.window, debug, start_time, end_time, booking_date, flow=flow)
+
+
+def scheduled_booking(driver, fire_at, seat_identifier, debug=True, session_file=SESSION_FILENAME,
+                      start_time=DEFAULT_START, end_time=DEFAULT_END, booking_date=None, zone=None):
+    """
+    Log in and park on the floor plan ahead of time, calibrate against the
+    Flowscape server clock, then run the booking at fire_at (server epoch
+    seconds). The achieved timing error is appended to the timing log.
+    """
+    current_window = open_and_authenticate(driver, seat_identifier=seat_identifier, session_file=session_file,
+                                           zone=zone)
+    if current_window is None:
         return False
 
+    # calibrate close to the target so local clock drift does not matter
+    calibrate_at = fire_at - CALIBRATION_LEAD
+    step("calibrate")
+    if calibrate_at > time.time():
+        logging.info("Parked on floor plan; calibrating clock at %s", datetime.fromtimestamp(calibrate_at).strftime("%H:%M:%S"))
+        time.sleep(calibrate_at - time.time())
+    if fire_at - time.time() < CALIBRATION_MIN:
+        # calibrating takes a few seconds, which a late run cannot spare
+        logging.warning("Only %.1fs left before the target; firing on the local clock without calibration",
+                        fire_at - time.time())
+        offset, uncertainty = 0.0, None
+    else:
+        try:
+            offset, uncertainty = estimate_offset(TARGET_URL)
+        except Exception as e:
+            logging.warning("Clock calibration failed (%s); firing on the local clock", e)
+            offset, uncertainty = 0.0, None
+
+    logging.info("Waiting to fire at %s (server time)", datetime.fromtimestamp(fire_at).strftime("%H:%M:%S.%f")[:-3])
+    step("wait_fire")
+    fire_error = wait_until(fire_at, offset)
+    step("fire")
+    fired = time.time()
+    success = book_on_page(driver, seat_identifier, current_window, debug, start_time, end_time, booking_date,
+                           zone=zone)
+    logging.info("Fired %.1f ms after target; booking took %.2fs", fire_error * 1000, time.time() - fired)
+    record_timing({
+        "target": fire_at,
+        "offset_ms": round(offset * 1000, 1),
+        "offset_uncertainty_ms": round(uncertainty * 1000, 1) if uncertainty is not None else None,
+        "fire_error_ms": round(fire_error * 1000, 2),
+        "booking_seconds": round(time.time() - fired, 3),
+        "seat": seat_identifier,
+        "success": bool(success),
+    })
+    return success
 
-def make_driver(headless=True, enable_console_logs=True):
+
+@timed("make_driver")
+def make_driver(headless=True, enable_console_logs=True, user_data_dir=None, extra_args=(), network_profile=None,
+                lean=None, backend=None, cache_key=None):
     """
     Create a Chrome WebDriver with optional browser console logging enabled.
     Uses Selenium 4+ style (Service + options) and sets logging prefs on options.
+    user_data_dir gives the browser its own isolated profile directory;
+    extra_args are appended to the Chrome command line. network_profile is a
+    network_profile name or JSON path (default: env FLOWSCAPE_NETWORK_PROFILE).
+    lean (default: env FLOWSCAPE_LEAN) switches to LEAN_CHROME_ARGS and drops
+    browser console logging. backend (default: env FLOWSCAPE_DRIVER_BACKEND)
+    is "selenium" or "cdp"; cdp drives Chrome over DevTools without
+    chromedriver (see cdp_driver). cache_key gives a browser that runs next to
+    others its own persistent disk cache (see network_profile.chrome_args).
     """
-    options = webdriver.ChromeOptions()
+    if lean is None:
+        lean = os.getenv("FLOWSCAPE_LEAN", "0") == "1"
+    backend = backend or os.getenv("FLOWSCAPE_DRIVER_BACKEND", "selenium")
+    profile = load_profile(network_profile or os.getenv("FLOWSCAPE_NETWORK_PROFILE"))
+    chrome_args = []
     if headless:
         # use new headless mode flag where available
-        options.add_argument("--headless=new")
-        options.add_argument("--disable-gpu")
-    options.add_argument("--no-sandbox")
-    options.add_argument("--disable-dev-shm-usage")
-    # Ensure window-size so screenshots look consistent
-    options.add_argument("--window-size=1920,1080")
-
-    # Enable browser console logs (Chrome) via capabilities set on options
+        chrome_args += ["--headless=new", "--disable-gpu"]
+    chrome_args += ["--no-sandbox", "--disable-dev-shm-usage"]
+    if lean:
+        chrome_args += LEAN_CHROME_ARGS
+        enable_console_logs = False
+    else:
+        # Ensure window-size so screenshots look consistent
+        chrome_args.append("--window-size=1920,1080")
+    if user_data_dir:
+        chrome_args.append(f"--user-data-dir={user_data_dir}")
+    chrome_args += list(extra_args) + network_chrome_args(profile, cache_key)
+
+    if backend == "cdp":
+        from cdp_driver import CDPDriver
+
+        driver = CDPDriver.launch(chrome_args, capture_console=enable_console_logs,
+                                  capture_network=METRICS_ENABLED)
+        logging.info("Launched Chrome over DevTools (headless=%s, lean=%s)", headless, lean)
+        apply_profile(driver, profile)
+        return driver
+
+    from selenium import webdriver
+    from selenium.common.exceptions import WebDriverException
+    from selenium.webdriver.chrome.service import Service
+
+    options = webdriver.ChromeOptions()
+    for arg in chrome_args:
+        options.add_argument(arg)
+
+    # Enable browser console logs (Chrome) via capabilities set on options; the
+    # performance log feeds the network timings in the run metrics
+    logging_prefs = {}
     if enable_console_logs:
+        logging_prefs["browser"] = "ALL"
+    # only drained into a run, so without metrics it would just pile up in chromedriver
+    if METRICS_ENABLED:
+        logging_prefs["performance"] = "ALL"
+    if logging_prefs:
         try:
-            options.set_capability("goog:loggingPrefs", {"browser": "ALL"})
+            options.set_capability("goog:loggingPrefs", logging_prefs)
         except Exception:
             # fallback: older selenium might still accept desired_capabilities but we prefer set_capability
             pass
@@ -474,30 +973,118 @@ def make_driver(headless=True, enable_console_logs=True):
 
     try:
         driver = webdriver.Chrome(service=service, options=options)
-        logging.info("Launched Chrome WebDriver (headless=%s)", headless)
-        return driver
+        logging.info("Launched Chrome WebDriver (headless=%s, lean=%s)", headless, lean)
     except TypeError as e:
         # back-compat fallback: try without service argument (some environments)
         logging.warning("webdriver.Chrome(service=..., options=...) failed: %s. Retrying without service.", e)
         try:
             driver = webdriver.Chrome(options=options)
             logging.info("Launched Chrome WebDriver (fallback without service) (headless=%s)", headless)
-            return driver
         except Exception as ex:
             logging.exception("Failed to launch Chrome WebDriver in fallback: %s", ex)
             raise
     except WebDriverException as e:
         logging.exception("Failed to launch Chrome WebDriver: %s", e)
         raise
+    apply_profile(driver, profile)
+    return driver
+
+
+def _process_tree_pids(root_pid):
+    """
+    Return root_pid and all of its descendants, read from /proc (Linux only).
+    """
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", encoding="utf-8") as f:
+                stat = f.read()
+            # the comm field may contain spaces; ppid is the second field after ")"
+            ppid = int(stat.rsplit(")", 1)[1].split()[1])
+            children.setdefault(ppid, []).append(int(entry))
+        except Exception:
+            continue
+    pids, stack = [], [root_pid]
+    while stack:
+        pid = stack.pop()
+        pids.append(pid)
+        stack.extend(children.get(pid, []))
+    return pids
+
+
+def driver_rss_bytes(driver):
+    """
+    Resident memory of chromedriver plus the Chrome process tree it spawned,
+    in bytes. Returns None when it cannot be determined.
+    """
+    try:
+        root_pid = driver.service.process.pid
+    except Exception:
+        return None
+    total = 0
+    for pid in _process_tree_pids(root_pid):
+        try:
+            with open(f"/proc/{pid}/status", encoding="utf-8") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+                        break
+        except Exception:
+            continue
+    return total
+
+
+def http_backend_conflicts(args):
+    """
+    Flags a plain --backend http run cannot honour: the API path books the
+    named seats immediately, without a daemon, schedule, watch, date list or
+    zone.
+    """
+    return [flag for flag, value in (("--daemon", args.daemon), ("--at", args.at), ("--watch", args.watch),
+                                     ("--dates", args.dates), ("--weeks", args.weeks), ("--zone", args.zone))
+            if value]
 
 
 def main():
     parser = argparse.ArgumentParser(description="Flowscape seat booker with verbose logging")
     parser.add_argument("--debug", action="store_true", help="Enable debug logging and save debug artifacts")
     parser.add_argument("--headless", action="store_true", help="Run Chrome in headless mode (default: env HEADLESS or True)")
-    parser.add_argument("--seat", type=str, default=os.getenv("FLOWSCAPE_SEAT", "ID-6F-277 (UK)"), help="Seat identifier to book")
+    parser.add_argument("--seat", type=str, default=os.getenv("FLOWSCAPE_SEAT", "ID-6F-277 (UK)"), help="Seat to book, or a comma-separated ranked list of acceptable seats")
+    parser.add_argument("--zone", type=str, default=os.getenv("FLOWSCAPE_ZONE"), help="Also accept any seat whose label starts with this prefix (e.g. ID-6F-), after the --seat list")
+    parser.add_argument("--session-file", type=str, default=SESSION_FILENAME, help="Cached login session file (default: env FLOWSCAPE_SESSION_FILE)")
+    parser.add_argument("--no-session-cache", action="store_true", help="Always run the full Microsoft SSO login")
+    parser.add_argument("--start", type=str, default=DEFAULT_START, help="Booking start time HH:MM (default: env FLOWSCAPE_START or 08:00)")
+    parser.add_argument("--end", type=str, default=DEFAULT_END, help="Booking end time HH:MM (default: env FLOWSCAPE_END or 18:00)")
+    parser.add_argument("--date", type=str, default=None, help="Booking date YYYY-MM-DD (default: the date shown in the app)")
+    parser.add_argument("--dates", type=str, default=None, help="Book several dates in one session: YYYY-MM-DD list and/or YYYY-MM-DD..YYYY-MM-DD ranges, comma separated")
+    parser.add_argument("--weeks", type=int, default=0, help="Also book the --weekdays of the next N weeks (starting tomorrow)")
+    parser.add_argument("--weekdays", type=str, default=os.getenv("FLOWSCAPE_WEEKDAYS", "mon-fri"), help="Weekdays kept by --weeks and date ranges, e.g. mon-fri or mon,wed")
+    parser.add_argument("--watch", action="store_true", help="Keep the floor plan open and book as soon as a watched seat (--seat list / --zone) is released")
+    parser.add_argument("--watch-until", type=str, default=os.getenv("FLOWSCAPE_WATCH_UNTIL"), help="Stop watching at this local time (HH:MM or ISO datetime; default: until booked)")
+    parser.add_argument("--backend", choices=("browser", "http"), default=os.getenv("FLOWSCAPE_BACKEND", "browser"), help="Book through the browser or directly over the Flowscape HTTP API (falls back to the browser)")
+    parser.add_argument("--at", type=str, default=os.getenv("FLOWSCAPE_FIRE_AT"), help="Log in early and book at this server time (HH:MM[:SS[.fff]] local, or ISO datetime)")
+    parser.add_argument("--artifacts", choices=ARTIFACT_LEVELS, default=None, help="Debug artifact capture: off, on-failure, ring (last steps flushed on failure) or full (default: env FLOWSCAPE_ARTIFACTS or ring)")
+    parser.add_argument("--network-profile", type=str, default=os.getenv("FLOWSCAPE_NETWORK_PROFILE"), help=f"Block resources / cache bundles: {', '.join(NETWORK_PROFILES)} or a JSON profile path")
+    parser.add_argument("--driver-backend", choices=("selenium", "cdp"), default=os.getenv("FLOWSCAPE_DRIVER_BACKEND", "selenium"), help="Drive Chrome through chromedriver (selenium) or directly over the DevTools protocol (cdp)")
+    parser.add_argument("--lean", action="store_true", default=os.getenv("FLOWSCAPE_LEAN", "0") == "1", help="Low-memory Chrome flags for running many browsers per host (default: env FLOWSCAPE_LEAN)")
+    parser.add_argument("--dry-run", action="store_true", help="Resolve and check the configuration (env, seats, times, chromedriver, credentials) and exit without launching Chrome")
+    parser.add_argument("--trace", action="store_true", default=os.getenv("FLOWSCAPE_TRACE", "0") == "1", help="Record a compressed network trace per run under traces/ (analyse with network_trace.py)")
+    parser.add_argument("--metrics-report", action="store_true", help="Print p50/p95 step timings and the time-to-booked histogram from past runs and exit")
+    parser.add_argument("--daemon", action="store_true", help="Run a booking daemon that keeps warm, logged-in drivers")
+    parser.add_argument("--pool-size", type=int, default=int(os.getenv("FLOWSCAPE_POOL_SIZE", "2")), help="Number of warm drivers in daemon mode")
+    parser.add_argument("--submit", action="store_true", help="Hand the booking to a running daemon instead of launching Chrome")
+    parser.add_argument("--batch", type=str, default=None, help="Job file (JSON list or JSON lines) of bookings to run concurrently")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("FLOWSCAPE_CONCURRENCY", "4")), help="Maximum concurrent browsers in batch mode")
+    parser.add_argument("--job-timeout", type=int, default=int(os.getenv("FLOWSCAPE_JOB_TIMEOUT", "180")), help="Per-job timeout in seconds in batch mode")
+    parser.add_argument("--daemon-port", type=int, default=int(os.getenv("FLOWSCAPE_DAEMON_PORT", "8765")), help="Local port of the booking daemon")
     args = parser.parse_args()
 
+    if args.metrics_report:
+        print(metrics_report())
+        sys.exit(0)
+
     debug = args.debug or os.getenv("FLOWSCAPE_DEBUG", "1") == "1"
     # default headless True unless explicitly set
     headless_env = os.getenv("HEADLESS")
@@ -506,12 +1093,123 @@ def main():
     else:
         headless = True if not args.headless else True
 
-    setup_logging(debug)
+    if args.dry_run:
+        # before setup_logging, which rolls the previous run's log over
+        from preflight import check, report
+        text, errors = report(check(args, headless, debug, None if args.no_session_cache else args.session_file))
+        print(text)
+        sys.exit(3 if errors else 0)
+
+    # a --submit client appends to the daemon's live log instead of rotating it
+    setup_logging(debug, rollover=not args.submit)
+    configure_artifacts(args.artifacts)
+    # batch workers and daemon slots create their drivers from the environment
+    if args.lean:
+        os.environ["FLOWSCAPE_LEAN"] = "1"
+    if args.network_profile:
+        os.environ["FLOWSCAPE_NETWORK_PROFILE"] = args.network_profile
+    os.environ["FLOWSCAPE_DRIVER_BACKEND"] = args.driver_backend
+    if args.trace:
+        os.environ["FLOWSCAPE_TRACE"] = "1"
+    session_file = None if args.no_session_cache else args.session_file
+
+    if args.submit:
+        from booking_daemon import submit_job
+        job = {"seat": args.seat, "zone": args.zone, "start": args.start, "end": args.end, "date": args.date,
+               "debug": debug}
+        try:
+            result = submit_job(job, port=args.daemon_port)
+        except OSError as e:
+            logging.error("Booking daemon not running at 127.0.0.1:%d (%s); start it with --daemon",
+                          args.daemon_port, e)
+            sys.exit(3)
+        except ValueError as e:
+            logging.error("Booking daemon at 127.0.0.1:%d sent no valid result: %s", args.daemon_port, e)
+            sys.exit(3)
+        logging.info("Daemon result: %s", result)
+        sys.exit(0 if result.get("ok") else 2)
+    if args.backend == "http" and not args.batch:
+        unsupported = http_backend_conflicts(args)
+        if unsupported:
+            logging.error("--backend http books named seats right away; it cannot be combined with %s",
+                          ", ".join(unsupported))
+            sys.exit(3)
+    if args.backend == "http" and session_file and not args.batch:
+        from flowscape_api import book_via_api
+        booking_date = args.date or datetime.now().strftime("%Y-%m-%d")
+        # the seats are tried in rank order; anything else is left to the browser flow below
+        for seat in [s.strip() for s in args.seat.split(",") if s.strip()]:
+            if book_via_api(seat, booking_date, args.start, args.end, session_file=session_file):
+                logging.info("Seat booking flow completed: SUCCESS (http backend)")
+                sys.exit(0)
+    if args.batch:
+        from batch_booking import run_batch
+        report = run_batch(args.batch, concurrency=args.concurrency, job_timeout=args.job_timeout,
+                           headless=headless, debug=debug, backend=args.backend)
+        sys.exit(0 if report["failed"] == 0 else 2)
+    if args.daemon:
+        from booking_daemon import serve
+        serve(pool_size=args.pool_size, port=args.daemon_port, headless=headless, seat_identifier=args.seat,
+              session_file=session_file)
+        sys.exit(0)
+
+    fire_at = None
+    if args.at:
+        try:
+            fire_at = parse_fire_time(args.at)
+        except ValueError as e:
+            logging.error("Invalid --at: %s", e)
+            sys.exit(3)
+    if args.watch and args.date and args.date != datetime.now().strftime("%Y-%m-%d"):
+        # the plan, and with it the release the watch waits for, shows today's seats
+        logging.error("--watch only watches today's floor plan; it cannot book for --date %s", args.date)
+        sys.exit(3)
+    watch_until = None
+    if args.watch and args.watch_until:
+        try:
+            watch_until = parse_fire_time(args.watch_until)
+        except ValueError as e:
+            logging.error("Invalid --watch-until: %s", e)
+            sys.exit(3)
+    dates = None
+    if args.dates or args.weeks:
+        from multi_date import expand_dates
+        try:
+            dates = expand_dates(args.dates, args.weeks, args.weekdays)
+        except ValueError as e:
+            logging.error("Invalid dates: %s", e)
+            sys.exit(3)
+        logging.info("Booking %d dates in one session: %s", len(dates), ", ".join(dates))
 
     driver = None
+    success = False
+    start_run(seat=args.seat, scheduled=fire_at is not None)
     try:
-        driver = make_driver(headless=headless, enable_console_logs=True)
-        success = login_flowscape(driver, email=None, password=None, seat_identifier=args.seat, debug=debug)
+        driver = make_driver(headless=headless, enable_console_logs=True, network_profile=args.network_profile,
+                             lean=args.lean)
+        sample_memory(lambda: driver_rss_bytes(driver))
+        if args.watch:
+            from seat_watch import watch_and_book
+            success = watch_and_book(driver, args.seat, zone=args.zone, until=watch_until, session_file=session_file,
+                                     start_time=args.start, end_time=args.end, booking_date=args.date)
+            logging.info("Seat watch completed: %s", "SUCCESS" if success else "FAILURE")
+            sys.exit(0 if success else 2)
+        if dates:
+            from multi_date import book_dates
+            results = book_dates(driver, args.seat, dates, session_file=session_file, start_time=args.start,
+                                 end_time=args.end, zone=args.zone)
+            success = bool(results) and all(r["ok"] for r in results)
+            logging.info("Multi-date booking completed: %s", "SUCCESS" if success else "FAILURE")
+            sys.exit(0 if success else 2)
+        if fire_at is not None:
+            success = scheduled_booking(driver, fire_at, args.seat, debug=debug, session_file=session_file,
+                                        start_time=args.start, end_time=args.end, booking_date=args.date,
+                                        zone=args.zone)
+            logging.info("Scheduled booking completed: %s", "SUCCESS" if success else "FAILURE")
+            sys.exit(0 if success else 2)
+        success = login_flowscape(driver, email=None, password=None, seat_identifier=args.seat, debug=debug,
+                                  session_file=session_file, start_time=args.start, end_time=args.end,
+                                  booking_date=args.date, zone=args.zone)
         if success:
             logging.info("Seat booking flow completed: SUCCESS")
             sys.exit(0)
@@ -520,9 +1218,10 @@ def main():
             sys.exit(2)
     except Exception as e:
         logging.exception("Unhandled exception in main: %s", e)
-        _dump_page_state(driver, "fatal_error") if driver is not None else None
+        _dump_page_state(driver, "fatal_error", failure=True) if driver is not None else None
         sys.exit(3)
     finally:
+        finish_run(success, driver)
         try:
             if driver:
                 driver.quit()
@@ -0,0 +1,253 @@
+"""
+Long-running booking daemon with a pool of pre-warmed, logged-in Chrome drivers.
+
+Each pool slot holds a driver that is already authenticated and parked on the
+Flowscape floor plan. Jobs arrive as one JSON line over a local TCP socket and
+are handed to an idle slot; the result is sent back as one JSON line.
+Idle slots are health checked and recycled after a maximum age or once their
+Chrome process tree exceeds a memory ceiling.
+"""
+import json
+import logging
+import os
+import shutil
+import socket
+import socketserver
+import tempfile
+import threading
+import time
+
+from book_seat import (
+    DEFAULT_END,
+    DEFAULT_START,
+    TARGET_URL,
+    _wait_for_app,
+    book_on_page,
+    driver_rss_bytes,
+    make_driver,
+    open_and_authenticate,
+)
+from artifacts import ARTIFACTS
+from run_metrics import finish_run, sample_memory, start_run
+from session_cache import SESSION_FILENAME
+
+DAEMON_HOST = "127.0.0.1"
+DAEMON_PORT = int(os.getenv("FLOWSCAPE_DAEMON_PORT", "8765"))
+POOL_MAX_AGE = int(os.getenv("FLOWSCAPE_POOL_MAX_AGE", str(2 * 3600)))
+POOL_MAX_RSS_MB = int(os.getenv("FLOWSCAPE_POOL_MAX_RSS_MB", "1024"))
+HEALTH_INTERVAL = 30
+
+
+class _Slot:
+    def __init__(self, index):
+        self.index = index
+        self.driver = None
+        self.window = None
+        self.profile_dir = None
+        self.created = 0.0
+        self.jobs = 0
+        self.busy = False
+
+
+class DriverPool:
+    """
+    Fixed-size pool of warm drivers. acquire()/release() hand out idle slots;
+    a background thread keeps idle slots healthy.
+    """
+
+    def __init__(self, size, headless=True, seat_identifier="ID-6F-277 (UK)", session_file=SESSION_FILENAME,
+                 max_age=POOL_MAX_AGE, max_rss_mb=POOL_MAX_RSS_MB):
+        self.slots = [_Slot(i) for i in range(size)]
+        self.headless = headless
+        self.seat_identifier = seat_identifier
+        self.session_file = session_file
+        self.max_age = max_age
+        self.max_rss = max_rss_mb * 1024 * 1024
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+
+    def start(self):
+        threads = [threading.Thread(target=self._warm, args=(slot,), daemon=True) for slot in self.slots]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        threading.Thread(target=self._health_loop, daemon=True).start()
+        logging.info("Driver pool ready: %d/%d slots warm", sum(1 for s in self.slots if s.driver), len(self.slots))
+
+    def stop(self):
+        self._stop.set()
+        for slot in self.slots:
+            self._discard(slot)
+
+    def _warm(self, slot):
+        try:
+            # the browsers run side by side: a throwaway profile per slot, and a disk cache
+            # per slot that outlives recycling
+            slot.profile_dir = tempfile.mkdtemp(prefix=f"flowscape_slot{slot.index}_")
+            slot.driver = make_driver(headless=self.headless, enable_console_logs=True, user_data_dir=slot.profile_dir,
+                                      cache_key=f"slot{slot.index}")
+            slot.created = time.time()
+            slot.jobs = 0
+            with ARTIFACTS.namespace(f"slot{slot.index}_warm"):
+                slot.window = open_and_authenticate(slot.driver, seat_identifier=self.seat_identifier,
+                                                    session_file=self.session_file)
+            if slot.window is None:
+                raise RuntimeError("login failed")
+            logging.info("Slot %d warm", slot.index)
+        except Exception as e:
+            logging.error("Failed warming slot %d: %s", slot.index, e)
+            self._discard(slot)
+
+    def _discard(self, slot):
+        try:
+            if slot.driver:
+                slot.driver.quit()
+        except Exception:
+            pass
+        if slot.profile_dir:
+            shutil.rmtree(slot.profile_dir, ignore_errors=True)
+        slot.driver = None
+        slot.window = None
+        slot.profile_dir = None
+
+    def _needs_recycle(self, slot):
+        if slot.driver is None:
+            return "not running"
+        if time.time() - slot.created > self.max_age:
+            return "max age"
+        rss = driver_rss_bytes(slot.driver)
+        if rss is not None and rss > self.max_rss:
+            return f"rss {rss // (1024 * 1024)} MB"
+        try:
+            slot.driver.execute_script("return document.readyState")
+        except Exception as e:
+            return f"unresponsive ({e.__class__.__name__})"
+        return None
+
+    def _health_loop(self):
+        while not self._stop.wait(HEALTH_INTERVAL):
+            for slot in self.slots:
+                with self._cond:
+                    if slot.busy:
+                        continue
+                    slot.busy = True
+                try:
+                    reason = self._needs_recycle(slot)
+                    if reason:
+                        logging.info("Recycling slot %d: %s", slot.index, reason)
+                        self._discard(slot)
+                        self._warm(slot)
+                finally:
+                    self.release(slot)
+
+    def acquire(self, timeout=60):
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                for slot in self.slots:
+                    if not slot.busy and slot.driver is not None:
+                        slot.busy = True
+                        return slot
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+
+    def release(self, slot):
+        with self._cond:
+            slot.busy = False
+            self._cond.notify()
+
+    def _repark(self, slot):
+        """
+        Navigate back to the floor plan after a job, logging in again if needed.
+        """
+        try:
+            slot.driver.switch_to.window(slot.window)
+            slot.driver.get(TARGET_URL)
+            if _wait_for_app(slot.driver, self.seat_identifier) == "app":
+                return
+        except Exception as e:
+            logging.debug("Re-park of slot %d failed: %s", slot.index, e)
+        self._discard(slot)
+        self._warm(slot)
+
+    def run_job(self, job):
+        seat = job.get("seat") or self.seat_identifier
+        start = time.monotonic()
+        slot = self.acquire(timeout=job.get("wait_timeout", 60))
+        if slot is None:
+            return {"ok": False, "seat": seat, "error": "no idle driver"}
+        ok = False
+        start_run(seat=seat, slot=slot.index, daemon=True)
+        driver = slot.driver
+        sample_memory(lambda: driver_rss_bytes(driver))
+        try:
+            logging.info("Slot %d booking seat %s", slot.index, seat)
+            # slots book concurrently: keep their snapshots and rings apart
+            with ARTIFACTS.namespace(f"slot{slot.index}_{time.strftime('%H%M%S')}"):
+                ok = book_on_page(slot.driver, seat, slot.window, debug=job.get("debug", True),
+                                  start_time=job.get("start") or DEFAULT_START,
+                                  end_time=job.get("end") or DEFAULT_END,
+                                  booking_date=job.get("date"), zone=job.get("zone"))
+            slot.jobs += 1
+            return {"ok": bool(ok), "seat": seat, "slot": slot.index, "elapsed": round(time.monotonic() - start, 3)}
+        except Exception as e:
+            logging.exception("Job for seat %s failed on slot %d: %s", seat, slot.index, e)
+            return {"ok": False, "seat": seat, "slot": slot.index, "error": str(e)}
+        finally:
+            finish_run(ok, slot.driver)
+            self._repark(slot)
+            self.release(slot)
+
+
+class _JobHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        # malformed requests are answered with an HTTP-style 400 status in the result
+        try:
+            job = json.loads(self.rfile.readline().decode("utf-8") or "{}")
+        except ValueError as e:
+            result = {"ok": False, "status": 400, "error": f"bad request: {e}"}
+        else:
+            if isinstance(job, dict):
+                result = self.server.pool.run_job(job)
+            else:
+                result = {"ok": False, "status": 400,
+                          "error": f"bad request: expected a JSON object, got {type(job).__name__}"}
+        self.wfile.write((json.dumps(result) + "\n").encode("utf-8"))
+
+
+class _DaemonServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+def serve(pool_size=2, port=DAEMON_PORT, headless=True, seat_identifier="ID-6F-277 (UK)",
+          session_file=SESSION_FILENAME):
+    """
+    Warm the pool and serve booking jobs until interrupted.
+    """
+    pool = DriverPool(pool_size, headless=headless, seat_identifier=seat_identifier, session_file=session_file)
+    pool.start()
+    # only listen on loopback: any client that can connect can book seats
+    server = _DaemonServer((DAEMON_HOST, port), _JobHandler)
+    server.pool = pool
+    logging.info("Booking daemon listening on %s:%d", DAEMON_HOST, port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logging.info("Booking daemon interrupted; shutting down")
+    finally:
+        server.server_close()
+        pool.stop()
+
+
+def submit_job(job, port=DAEMON_PORT, timeout=180):
+    """
+    Send one job to a running daemon and return its result dict.
+    """
+    with socket.create_connection((DAEMON_HOST, port), timeout=timeout) as sock:
+        sock.sendall((json.dumps(job) + "\n").encode("utf-8"))
+        with sock.makefile("r", encoding="utf-8") as f:
+            return json.loads(f.readline())
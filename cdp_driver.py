@@ -0,0 +1,767 @@
+"""
+WebDriver-free Chrome backend speaking the DevTools Protocol directly.
+
+CDPDriver launches Chrome with --remote-debugging-port and talks to it over a
+single persistent websocket (a small RFC 6455 client on the standard library),
+so there is no chromedriver process and no HTTP hop per command. Commands are
+pipelined: send() returns immediately and responses are matched by id on a
+reader thread, so independent commands (domain enables, focus + insertText,
+mouse press + release) go out back to back without waiting on each other.
+
+The facade covers what the booking flow uses from Selenium: get, window
+handles and switch_to (window / frame / default_content / new_window),
+execute_script / execute_async_script, find_element(s) with By strings,
+element click / send_keys / clear / is_displayed / is_enabled / get_attribute,
+page_source, screenshots, cookies, get_log("browser" / "performance") and
+execute_cdp_cmd. Elements are kept in a per-document registry in the page and
+referenced by index, so a script returning elements still costs one round-trip.
+Cross-origin iframes (separate renderer targets) are not supported.
+"""
+import base64
+import collections
+import hashlib
+import itertools
+import json
+import logging
+import os
+import shutil
+import socket
+import struct
+import subprocess
+import tempfile
+import threading
+import time
+import urllib.parse
+
+CHROME_BINARIES = ("google-chrome", "google-chrome-stable", "chromium", "chromium-browser", "chrome")
+COMMAND_TIMEOUT = 60
+LOG_BUFFER = 10000
+_WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+# wraps every script: unwraps element references in the arguments, runs the
+# body and replaces DOM nodes in the result with registry references. Nodes
+# that have left the document can only raise a stale reference, so they are
+# dropped from the registry whenever it has doubled since the last sweep.
+_WRAPPER_JS = """(function(fn, args, isAsync) {
+  var R = window.__flowscapeNodes || (window.__flowscapeNodes = {nodes: new Map(), ids: new WeakMap(), next: 0, sweepAt: 256});
+  if (R.nodes.size >= R.sweepAt) {
+    R.nodes.forEach(function(n, id) { if (!n.isConnected) { R.nodes.delete(id); R.ids.delete(n); } });
+    R.sweepAt = Math.max(256, R.nodes.size * 2);
+  }
+  function unwrap(v) {
+    if (v && typeof v === 'object') {
+      if (typeof v.__cdp_node__ === 'number') {
+        var n = R.nodes.get(v.__cdp_node__);
+        if (!n || !n.isConnected) { throw new Error('stale element reference'); }
+        return n;
+      }
+      if (Array.isArray(v)) { return v.map(unwrap); }
+      var o = {};
+      for (var k in v) { o[k] = unwrap(v[k]); }
+      return o;
+    }
+    return v;
+  }
+  function wrap(v, depth) {
+    if (v === undefined || v === null || depth > 8) { return null; }
+    if (v instanceof Node) {
+      var id = R.ids.get(v);
+      if (id === undefined) { id = R.next++; R.nodes.set(id, v); R.ids.set(v, id); }
+      return {__cdp_node__: id};
+    }
+    if (Array.isArray(v) || v instanceof NodeList || v instanceof HTMLCollection) {
+      return Array.prototype.map.call(v, function(x) { return wrap(x, depth + 1); });
+    }
+    if (typeof v === 'object') {
+      if (v === window) { return null; }
+      var o = {};
+      for (var k in v) { if (Object.prototype.hasOwnProperty.call(v, k)) { o[k] = wrap(v[k], depth + 1); } }
+      return o;
+    }
+    return v;
+  }
+  var a = unwrap(args);
+  if (!isAsync) { return wrap(fn.apply(null, a), 0); }
+  return new Promise(function(resolve, reject) {
+    a.push(function(result) { resolve(wrap(result, 0)); });
+    try { fn.apply(null, a); } catch (e) { reject(e); }
+  });
+})"""
+
+_FIND_JS = {
+    "xpath": """var root = arguments[1] || document, out = [];
+var snap = document.evaluate(arguments[0], root, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+for (var i = 0; i < snap.snapshotLength; i++) { out.push(snap.snapshotItem(i)); }
+return out;""",
+    "css selector": "return (arguments[1] || document).querySelectorAll(arguments[0]);",
+}
+
+_IS_DISPLAYED_JS = """var el = arguments[0], style = getComputedStyle(el);
+return el.getClientRects().length > 0 && style.visibility !== 'hidden' && style.display !== 'none';"""
+
+_GET_ATTRIBUTE_JS = """var el = arguments[0], name = arguments[1], prop = el[name];
+if (prop !== undefined && prop !== null && typeof prop !== 'object' && typeof prop !== 'function') { return String(prop); }
+return el.getAttribute(name);"""
+
+_CLEAR_JS = """var el = arguments[0];
+var proto = el instanceof HTMLTextAreaElement ? HTMLTextAreaElement.prototype : HTMLInputElement.prototype;
+Object.getOwnPropertyDescriptor(proto, 'value').set.call(el, '');
+el.dispatchEvent(new Event('input', {bubbles: true}));
+el.dispatchEvent(new Event('change', {bubbles: true}));"""
+
+# scroll into view and return the click point, or click in script when the
+# element is in a frame (mouse coordinates are relative to the top viewport)
+_CLICK_POINT_JS = """var el = arguments[0], inFrame = arguments[1];
+el.scrollIntoView({block: 'center', inline: 'center'});
+var r = el.getBoundingClientRect();
+if (inFrame || !r.width || !r.height) { el.click(); return null; }
+return {x: r.left + r.width / 2, y: r.top + r.height / 2};"""
+
+_CONSOLE_LEVELS = {"error": "SEVERE", "assert": "SEVERE", "warning": "WARNING", "debug": "DEBUG"}
+
+
+class CDPError(Exception):
+    pass
+
+
+class NoSuchElementError(CDPError):
+    pass
+
+
+class _WebSocket:
+    """
+    Minimal client side of RFC 6455: text frames out (masked), text/continuation
+    frames in, ping answered with pong.
+    """
+    def __init__(self, url, timeout=10):
+        parsed = urllib.parse.urlsplit(url)
+        self._sock = socket.create_connection((parsed.hostname, parsed.port), timeout=timeout)
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._file = self._sock.makefile("rb")
+        self._send_lock = threading.Lock()
+        key = base64.b64encode(os.urandom(16)).decode()
+        self._sock.sendall((
+            f"GET {parsed.path or '/'} HTTP/1.1\r\nHost: {parsed.hostname}:{parsed.port}\r\n"
+            f"Upgrade: websocket\r\nConnection: Upgrade\r\nSec-WebSocket-Key: {key}\r\n"
+            "Sec-WebSocket-Version: 13\r\n\r\n").encode())
+        status = self._file.readline().decode("latin-1")
+        headers = {}
+        while True:
+            line = self._file.readline().decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        accept = base64.b64encode(hashlib.sha1((key + _WS_GUID).encode()).digest()).decode()
+        if " 101 " not in status or headers.get("sec-websocket-accept") != accept:
+            raise CDPError(f"websocket handshake with {url} failed: {status.strip()}")
+        self._sock.settimeout(None)
+
+    def _send_frame(self, opcode, payload):
+        length = len(payload)
+        if length < 126:
+            header = struct.pack("!BB", 0x80 | opcode, 0x80 | length)
+        elif length < 65536:
+            header = struct.pack("!BBH", 0x80 | opcode, 0x80 | 126, length)
+        else:
+            header = struct.pack("!BBQ", 0x80 | opcode, 0x80 | 127, length)
+        mask = os.urandom(4)
+        masked = (int.from_bytes(payload, "big") ^ int.from_bytes((mask * (length // 4 + 1))[:length], "big"))
+        with self._send_lock:
+            self._sock.sendall(header + mask + masked.to_bytes(length, "big"))
+
+    def send(self, text):
+        self._send_frame(0x1, text.encode("utf-8"))
+
+    def _read_exact(self, n):
+        data = self._file.read(n)
+        if len(data) < n:
+            raise ConnectionError("websocket closed")
+        return data
+
+    def recv(self):
+        """
+        Return the next text message, or None when the connection closes.
+        """
+        parts = []
+        while True:
+            b0, b1 = self._read_exact(2)
+            opcode, length = b0 & 0x0F, b1 & 0x7F
+            if length == 126:
+                length = struct.unpack("!H", self._read_exact(2))[0]
+            elif length == 127:
+                length = struct.unpack("!Q", self._read_exact(8))[0]
+            mask = self._read_exact(4) if b1 & 0x80 else None
+            payload = self._read_exact(length)
+            if mask:
+                payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+            if opcode == 0x8:
+                return None
+            if opcode == 0x9:
+                self._send_frame(0xA, payload)
+                continue
+            if opcode == 0xA:
+                continue
+            parts.append(payload)
+            if b0 & 0x80:
+                return b"".join(parts).decode("utf-8")
+
+    def close(self):
+        try:
+            self._send_frame(0x8, b"")
+        except Exception:
+            pass
+        try:
+            self._sock.close()
+        except Exception:
+            pass
+
+
+class _Pending:
+    def __init__(self, method):
+        self.method = method
+        self._event = threading.Event()
+        self._value = None
+        self._error = None
+
+    def resolve(self, value):
+        self._value = value
+        self._event.set()
+
+    def fail(self, error):
+        self._error = error
+        self._event.set()
+
+    def result(self, timeout=COMMAND_TIMEOUT):
+        if not self._event.wait(timeout):
+            raise CDPError(f"{self.method} timed out after {timeout}s")
+        if self._error is not None:
+            raise self._error
+        return self._value
+
+
+class CDPConnection:
+    """
+    One websocket to the browser. Commands for page targets carry the flat
+    session id from Target.attachToTarget.
+    """
+    def __init__(self, url):
+        self._ws = _WebSocket(url)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._waiters = []
+        self._listeners = []
+        self.closed = False
+        threading.Thread(target=self._read_loop, name="cdp-reader", daemon=True).start()
+
+    def add_listener(self, callback):
+        """
+        callback(method, params, session_id) for every event; runs on the
+        reader thread and must not wait for command results.
+        """
+        self._listeners.append(callback)
+
+    def send(self, method, params=None, session_id=None):
+        """
+        Send a command without waiting; returns a pending result.
+        """
+        if self.closed:
+            raise CDPError("DevTools connection closed")
+        msg_id = next(self._ids)
+        pending = _Pending(method)
+        with self._lock:
+            self._pending[msg_id] = pending
+        message = {"id": msg_id, "method": method, "params": params or {}}
+        if session_id:
+            message["sessionId"] = session_id
+        self._ws.send(json.dumps(message))
+        return pending
+
+    def call(self, method, params=None, session_id=None, timeout=COMMAND_TIMEOUT):
+        return self.send(method, params, session_id).result(timeout)
+
+    def pipeline(self, commands, session_id=None, timeout=COMMAND_TIMEOUT):
+        """
+        Send all (method, params) commands back to back, then collect the results.
+        """
+        pending = [self.send(method, params, session_id) for method, params in commands]
+        return [p.result(timeout) for p in pending]
+
+    def expect(self, method, session_id=None):
+        """
+        Register for the next `method` event before triggering it; returns a
+        pending result resolved with the event params.
+        """
+        pending = _Pending(method)
+        with self._lock:
+            self._waiters.append((method, session_id, pending))
+        return pending
+
+    def _read_loop(self):
+        try:
+            while True:
+                text = self._ws.recv()
+                if text is None:
+                    break
+                message = json.loads(text)
+                if "id" in message:
+                    with self._lock:
+                        pending = self._pending.pop(message["id"], None)
+                    if pending is None:
+                        continue
+                    if "error" in message:
+                        pending.fail(CDPError(f"{pending.method}: {message['error'].get('message')}"))
+                    else:
+                        pending.resolve(message.get("result", {}))
+                else:
+                    self._dispatch(message.get("method"), message.get("params", {}), message.get("sessionId"))
+        except Exception as e:
+            logging.debug("DevTools connection ended: %s", e)
+        finally:
+            self.closed = True
+            with self._lock:
+                pending, self._pending = list(self._pending.values()), {}
+            for p in pending:
+                p.fail(CDPError("DevTools connection closed"))
+
+    def _dispatch(self, method, params, session_id):
+        with self._lock:
+            matched = [w for w in self._waiters if w[0] == method and w[1] in (None, session_id)]
+            self._waiters = [w for w in self._waiters if w not in matched]
+        for _, _, pending in matched:
+            pending.resolve(params)
+        for callback in self._listeners:
+            try:
+                callback(method, params, session_id)
+            except Exception as e:
+                logging.debug("CDP listener failed on %s: %s", method, e, extra={"sample": True})
+
+    def close(self):
+        self._ws.close()
+
+
+class _Process:
+    # driver_rss_bytes() reads driver.service.process.pid
+    def __init__(self, process):
+        self.process = process
+
+
+class _SwitchTo:
+    def __init__(self, driver):
+        self._driver = driver
+
+    def window(self, handle):
+        self._driver._switch_window(handle)
+
+    def frame(self, element):
+        self._driver._switch_frame(element)
+
+    def default_content(self):
+        self._driver._frame = None
+
+    def new_window(self, type_hint="tab"):
+        result = self._driver._conn.call("Target.createTarget", {"url": "about:blank",
+                                                                 "newWindow": type_hint == "window"})
+        self._driver._switch_window(result["targetId"])
+
+
+class CDPElement:
+    def __init__(self, driver, node_id, target, frame):
+        self._driver = driver
+        self.id = node_id
+        self._target = target
+        self._frame = frame
+
+    def __eq__(self, other):
+        return isinstance(other, CDPElement) and (self.id, self._target, self._frame) == (other.id, other._target, other._frame)
+
+    def __hash__(self):
+        return hash((self.id, self._target, self._frame))
+
+    def _call(self, body, *args):
+        return self._driver._run(body, (self,) + args, target=self._target, frame=self._frame)
+
+    def find_elements(self, by, value):
+        return self._driver._find(by, value, self)
+
+    def find_element(self, by, value):
+        found = self.find_elements(by, value)
+        if not found:
+            raise NoSuchElementError(f"no element for {by}={value!r}")
+        return found[0]
+
+    def is_displayed(self):
+        return bool(self._call(_IS_DISPLAYED_JS))
+
+    def is_enabled(self):
+        return bool(self._call("return !arguments[0].disabled;"))
+
+    def get_attribute(self, name):
+        return self._call(_GET_ATTRIBUTE_JS, name)
+
+    @property
+    def text(self):
+        return self._call("return arguments[0].innerText || arguments[0].textContent || '';")
+
+    @property
+    def tag_name(self):
+        return self._call("return arguments[0].tagName.toLowerCase();")
+
+    def clear(self):
+        self._call(_CLEAR_JS)
+
+    def click(self):
+        point = self._call(_CLICK_POINT_JS, self._frame is not None)
+        if point is None:
+            return
+        mouse = {"x": point["x"], "y": point["y"], "button": "left", "clickCount": 1}
+        self._driver.pipeline([
+            ("Input.dispatchMouseEvent", dict(mouse, type="mouseMoved", button="none")),
+            ("Input.dispatchMouseEvent", dict(mouse, type="mousePressed")),
+            ("Input.dispatchMouseEvent", dict(mouse, type="mouseReleased")),
+        ])
+
+    def send_keys(self, *values):
+        text = "".join(str(v) for v in values)
+        commands = [self._driver._evaluate_command("arguments[0].focus();", (self,), self._target, self._frame)]
+        for i, chunk in enumerate(text.split("\n")):
+            if i:
+                enter = {"key": "Enter", "code": "Enter", "windowsVirtualKeyCode": 13}
+                commands.append(("Input.dispatchKeyEvent", dict(enter, type="keyDown", text="\r")))
+                commands.append(("Input.dispatchKeyEvent", dict(enter, type="keyUp")))
+            if chunk:
+                commands.append(("Input.insertText", {"text": chunk}))
+        results = self._driver.pipeline(commands, target=self._target)
+        self._driver._check_evaluation(results[0])
+
+
+class CDPDriver:
+    """
+    Selenium-like driver over a direct DevTools connection. Use launch().
+    """
+    def __init__(self, process, conn, owned_profile=None, capture_console=True, capture_network=False):
+        self.service = _Process(process)
+        self.switch_to = _SwitchTo(self)
+        self._conn = conn
+        self._owned_profile = owned_profile
+        self._capture_console = capture_console
+        self._capture_network = capture_network
+        self._blocked_urls = None
+        self._sessions = {}
+        self._contexts = {}
+        self._current = None
+        self._frame = None
+        self._script_timeout = 30
+        self._page_load_timeout = 300
+        self._logs = {"browser": collections.deque(maxlen=LOG_BUFFER),
+                      "performance": collections.deque(maxlen=LOG_BUFFER)}
+        conn.add_listener(self._on_event)
+        self._switch_window(self.window_handles[0])
+
+    @classmethod
+    def launch(cls, args=(), capture_console=True, capture_network=False, binary=None, timeout=20):
+        """
+        Start Chrome with the given command-line flags and connect to it.
+        A temporary profile is created (and removed on quit) unless args
+        contain --user-data-dir.
+        """
+        binary = binary or find_chrome()
+        if not binary:
+            raise CDPError("Chrome not found; install it or set FLOWSCAPE_CHROME_BINARY")
+        args = list(args)
+        profile = next((a.split("=", 1)[1] for a in args if a.startswith("--user-data-dir=")), None)
+        owned = None
+        if profile is None:
+            profile = owned = tempfile.mkdtemp(prefix="flowscape_cdp_")
+            args.append(f"--user-data-dir={profile}")
+        port_file = os.path.join(profile, "DevToolsActivePort")
+        if os.path.exists(port_file):
+            os.remove(port_file)
+        process = subprocess.Popen(
+            [binary, "--remote-debugging-port=0", "--no-first-run", "--no-default-browser-check"] + args + ["about:blank"],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.monotonic() + timeout
+        lines = []
+        while len(lines) < 2:
+            if process.poll() is not None:
+                raise CDPError(f"Chrome exited with code {process.returncode} during startup")
+            if time.monotonic() > deadline:
+                process.kill()
+                raise CDPError(f"Chrome did not open a DevTools port within {timeout}s")
+            time.sleep(0.05)
+            try:
+                with open(port_file, encoding="utf-8") as f:
+                    lines = f.read().split()
+            except FileNotFoundError:
+                continue
+        conn = CDPConnection(f"ws://127.0.0.1:{lines[0]}{lines[1]}")
+        return cls(process, conn, owned, capture_console, capture_network)
+
+    # --- events ----------------------------------------------------------
+
+    def _on_event(self, method, params, session_id):
+        if method == "Runtime.executionContextCreated":
+            aux = params["context"].get("auxData", {})
+            if aux.get("isDefault"):
+                self._contexts[(session_id, aux.get("frameId"))] = params["context"]["id"]
+        elif method == "Runtime.executionContextDestroyed":
+            for key, ctx in list(self._contexts.items()):
+                if ctx == params.get("executionContextId"):
+                    self._contexts.pop(key, None)
+        elif method == "Runtime.executionContextsCleared":
+            for key in [k for k in self._contexts if k[0] == session_id]:
+                self._contexts.pop(key, None)
+        elif method == "Target.detachedFromTarget":
+            for target, sid in list(self._sessions.items()):
+                if sid == params.get("sessionId"):
+                    self._sessions.pop(target, None)
+        elif method == "Runtime.consoleAPICalled" and self._capture_console:
+            message = " ".join(str(a.get("value", a.get("description", ""))) for a in params.get("args", []))
+            self._logs["browser"].append({"level": _CONSOLE_LEVELS.get(params.get("type"), "INFO"),
+                                          "source": "console-api", "message": message,
+                                          "timestamp": params.get("timestamp")})
+        elif method == "Log.entryAdded" and self._capture_console:
+            entry = params.get("entry", {})
+            self._logs["browser"].append({"level": _CONSOLE_LEVELS.get(entry.get("level"), "INFO"),
+                                          "source": entry.get("source", ""),
+                                          "message": f"{entry.get('url', '')} {entry.get('text', '')}".strip(),
+                                          "timestamp": entry.get("timestamp")})
+        elif method.startswith("Network.") and self._capture_network:
+            self._logs["performance"].append({"message": json.dumps({"message": {"method": method, "params": params}}),
+                                              "timestamp": time.time() * 1000})
+
+    # --- targets, sessions and contexts ------------------------------------
+
+    def _session(self, target=None):
+        target = target or self._current
+        session_id = self._sessions.get(target)
+        if session_id is None:
+            session_id = self._conn.call("Target.attachToTarget", {"targetId": target, "flatten": True})["sessionId"]
+            self._sessions[target] = session_id
+            commands = [("Page.enable", {}), ("Runtime.enable", {})]
+            if self._capture_console:
+                commands.append(("Log.enable", {}))
+            if self._capture_network or self._blocked_urls:
+                commands.append(("Network.enable", {}))
+            if self._blocked_urls:
+                commands.append(("Network.setBlockedURLs", {"urls": self._blocked_urls}))
+            self._conn.pipeline(commands, session_id)
+        return session_id
+
+    def _switch_window(self, handle):
+        self._session(handle)
+        self._current, self._frame = handle, None
+        # background tabs get throttled timers; fire and forget
+        self._conn.send("Target.activateTarget", {"targetId": handle})
+
+    def _switch_frame(self, element):
+        session_id = self._session(element._target)
+        remote = self._conn.call("Runtime.evaluate", dict(
+            {"expression": f"window.__flowscapeNodes.nodes.get({int(element.id)})"},
+            **self._context_param(session_id, element._frame)), session_id)
+        node = self._conn.call("DOM.describeNode", {"objectId": remote["result"]["objectId"]}, session_id)["node"]
+        frame_id = node.get("frameId")
+        if not frame_id:
+            raise CDPError("element is not a frame")
+        deadline = time.monotonic() + 2
+        while (session_id, frame_id) not in self._contexts:
+            if time.monotonic() > deadline:
+                raise CDPError("frame has no script context in this page (cross-origin iframe?)")
+            time.sleep(0.02)
+        self._frame = frame_id
+
+    def _context_param(self, session_id, frame):
+        if frame is None:
+            return {}
+        context = self._contexts.get((session_id, frame))
+        if context is None:
+            raise CDPError("frame is gone")
+        return {"contextId": context}
+
+    # --- scripts -----------------------------------------------------------
+
+    def _marshal(self, value):
+        if isinstance(value, CDPElement):
+            return {"__cdp_node__": value.id}
+        if isinstance(value, (list, tuple)):
+            return [self._marshal(v) for v in value]
+        if isinstance(value, dict):
+            return {k: self._marshal(v) for k, v in value.items()}
+        return value
+
+    def _unmarshal(self, value, target, frame):
+        if isinstance(value, dict):
+            if set(value) == {"__cdp_node__"}:
+                return CDPElement(self, value["__cdp_node__"], target, frame)
+            return {k: self._unmarshal(v, target, frame) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self._unmarshal(v, target, frame) for v in value]
+        return value
+
+    def _evaluate_command(self, body, args, target=None, frame=None, is_async=False):
+        session_id = self._session(target)
+        expression = (f"{_WRAPPER_JS}(function() {{\n{body}\n}}, {json.dumps(self._marshal(list(args)))}, "
+                      f"{'true' if is_async else 'false'})")
+        params = {"expression": expression, "returnByValue": True, "awaitPromise": is_async, "userGesture": True}
+        params.update(self._context_param(session_id, frame))
+        return "Runtime.evaluate", params
+
+    def _check_evaluation(self, result):
+        if "exceptionDetails" in result:
+            details = result["exceptionDetails"]
+            raise CDPError((details.get("exception") or {}).get("description") or details.get("text", "script error"))
+        return result.get("result", {}).get("value")
+
+    def _run(self, body, args=(), target=None, frame=None, is_async=False):
+        target = target or self._current
+        frame = self._frame if target == self._current and frame is None else frame
+        method, params = self._evaluate_command(body, args, target, frame, is_async)
+        timeout = self._script_timeout if is_async else COMMAND_TIMEOUT
+        result = self._conn.call(method, params, self._session(target), timeout=timeout)
+        return self._unmarshal(self._check_evaluation(result), target, frame)
+
+    def execute_script(self, script, *args):
+        return self._run(script, args)
+
+    def execute_async_script(self, script, *args):
+        return self._run(script, args, is_async=True)
+
+    def set_script_timeout(self, seconds):
+        self._script_timeout = seconds
+
+    def set_page_load_timeout(self, seconds):
+        self._page_load_timeout = seconds
+
+    def implicitly_wait(self, seconds):
+        pass
+
+    def pipeline(self, commands, target=None):
+        """
+        Send raw (method, params) CDP commands to the current page back to
+        back and return all results.
+        """
+        return self._conn.pipeline(commands, self._session(target))
+
+    def execute_cdp_cmd(self, cmd, cmd_args):
+        return self._conn.call(cmd, cmd_args, self._session())
+
+    def block_urls(self, patterns):
+        """
+        Block URL patterns in every page this driver attaches to: the pages
+        attached so far and each popup or tab when it is first switched to.
+        """
+        self._blocked_urls = list(patterns)
+        for session_id in list(self._sessions.values()):
+            self._conn.pipeline([("Network.enable", {}), ("Network.setBlockedURLs", {"urls": self._blocked_urls})],
+                                session_id)
+
+    # --- elements ------------------------------------------------------------
+
+    def _find(self, by, value, root=None):
+        if by == "id":
+            by, value = "css selector", f"[id={json.dumps(value)}]"
+        elif by == "name":
+            by, value = "css selector", f"[name={json.dumps(value)}]"
+        elif by == "tag name":
+            by = "css selector"
+        elif by == "class name":
+            by, value = "css selector", f".{value}"
+        if by not in _FIND_JS:
+            raise CDPError(f"unsupported locator strategy {by!r}")
+        if root is not None:
+            return self._run(_FIND_JS[by], (value, root), target=root._target, frame=root._frame) or []
+        return self._run(_FIND_JS[by], (value, None)) or []
+
+    def find_elements(self, by, value):
+        return self._find(by, value)
+
+    def find_element(self, by, value):
+        found = self._find(by, value)
+        if not found:
+            raise NoSuchElementError(f"no element for {by}={value!r}")
+        return found[0]
+
+    # --- navigation and windows ----------------------------------------------
+
+    def get(self, url):
+        session_id = self._session()
+        loaded = self._conn.expect("Page.loadEventFired", session_id)
+        result = self._conn.call("Page.navigate", {"url": url}, session_id)
+        if result.get("errorText"):
+            raise CDPError(f"navigation to {url} failed: {result['errorText']}")
+        self._frame = None
+        if result.get("loaderId"):
+            loaded.result(self._page_load_timeout)
+
+    @property
+    def window_handles(self):
+        targets = self._conn.call("Target.getTargets")["targetInfos"]
+        return [t["targetId"] for t in targets
+                if t["type"] == "page" and not t.get("url", "").startswith(("devtools://", "chrome-extension://"))]
+
+    @property
+    def current_window_handle(self):
+        if self._current is None:
+            raise CDPError("no current window")
+        return self._current
+
+    @property
+    def current_url(self):
+        return self._conn.call("Target.getTargetInfo", {"targetId": self._current})["targetInfo"]["url"]
+
+    @property
+    def title(self):
+        return self._run("return document.title;", target=self._current, frame=None)
+
+    @property
+    def page_source(self):
+        return self._run("var d = document.doctype;"
+                         "return (d ? new XMLSerializer().serializeToString(d) : '') + document.documentElement.outerHTML;")
+
+    def get_screenshot_as_png(self):
+        return base64.b64decode(self._conn.call("Page.captureScreenshot", {"format": "png"}, self._session())["data"])
+
+    def get_cookies(self):
+        cookies = self._conn.call("Network.getCookies", {}, self._session()).get("cookies", [])
+        return [dict({k: c[k] for k in ("name", "value", "domain", "path", "secure", "httpOnly") if k in c},
+                     **({"expiry": int(c["expires"])} if c.get("expires", -1) > 0 else {})) for c in cookies]
+
+    def get_log(self, log_type):
+        buffer = self._logs.get(log_type)
+        if buffer is None:
+            raise CDPError(f"unknown log type {log_type!r}")
+        entries = list(buffer)
+        buffer.clear()
+        return entries
+
+    def close(self):
+        target = self.current_window_handle
+        self._conn.call("Target.closeTarget", {"targetId": target})
+        self._sessions.pop(target, None)
+        self._current, self._frame = None, None
+
+    def quit(self):
+        try:
+            self._conn.call("Browser.close", timeout=5)
+        except Exception:
+            pass
+        self._conn.close()
+        process = self.service.process
+        try:
+            process.wait(5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+        if self._owned_profile:
+            shutil.rmtree(self._owned_profile, ignore_errors=True)
+
+
+def find_chrome():
+    """
+    Chrome binary from FLOWSCAPE_CHROME_BINARY or the first known name on PATH.
+    """
+    configured = os.getenv("FLOWSCAPE_CHROME_BINARY")
+    if configured:
+        return configured
+    return next((path for path in map(shutil.which, CHROME_BINARIES) if path), None)
@@ -0,0 +1,170 @@
+"""
+Server clock-offset calibration and precise scheduled firing.
+
+The HTTP Date header only has one-second resolution, so the offset is measured
+at the instant the server's second ticks over: requests are sent back to back
+around the predicted tick, and the tick is placed between the last response
+stamped with the old second and the first one stamped with the new second.
+With a keep-alive connection this brackets the tick to roughly one round trip.
+"""
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from urllib.parse import urlparse
+
+TIMING_LOG = os.getenv("FLOWSCAPE_TIMING_LOG", "schedule_timing.jsonl")
+# spin (instead of sleeping) for the last stretch before the target instant
+SPIN_WINDOW = 0.02
+# an HH:MM time passed by at most this much is a late start (fire now); older means tomorrow
+LATE_GRACE = float(os.getenv("FLOWSCAPE_LATE_GRACE", "3600"))
+
+
+class _Prober:
+    def __init__(self, url, timeout=5):
+        # http.client (ssl, email) is only needed for scheduled runs
+        import http.client
+
+        parts = urlparse(url)
+        conn_cls = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+        self.conn = conn_cls(parts.hostname, parts.port, timeout=timeout)
+        self.path = parts.path or "/"
+
+    def sample(self):
+        """
+        Return (local send time, local receive time, server Date as epoch seconds).
+        """
+        from email.utils import parsedate_to_datetime
+
+        t_send = time.time()
+        self.conn.request("HEAD", self.path, headers={"Connection": "keep-alive", "Cache-Control": "no-cache"})
+        resp = self.conn.getresponse()
+        resp.read()
+        t_recv = time.time()
+        date = resp.getheader("Date")
+        if resp.will_close:
+            self.conn.close()
+        if not date:
+            raise ValueError("server response has no Date header")
+        return t_send, t_recv, parsedate_to_datetime(date).timestamp()
+
+    def close(self):
+        self.conn.close()
+
+
+def _measure_tick(prober, offset_guess, max_wait=3.0):
+    """
+    Sample rapidly around the next predicted server tick. Returns
+    (offset, uncertainty) or None if no tick was observed.
+    """
+    next_tick = int(time.time() + offset_guess) + 1
+    lead = next_tick - offset_guess - time.time() - 0.15
+    if lead > 0:
+        time.sleep(lead)
+    prev = prober.sample()
+    deadline = time.time() + max_wait
+    while time.time() < deadline:
+        cur = prober.sample()
+        if cur[2] > prev[2]:
+            # the tick happened after prev's server stamp and before cur's
+            lo, hi = prev[0], cur[1]
+            tick_local = ((prev[0] + prev[1]) / 2 + (cur[0] + cur[1]) / 2) / 2
+            return cur[2] - tick_local, (hi - lo) / 2
+        prev = cur
+    return None
+
+
+def estimate_offset(url, ticks=3):
+    """
+    Estimate server_time - local_time in seconds. Returns (offset, uncertainty);
+    uncertainty is the half-width of the tightest bracket observed.
+    """
+    from statistics import median
+
+    prober = _Prober(url)
+    try:
+        t_send, t_recv, server = prober.sample()
+        # Date truncates to the second: the true server time is up to 1 s later
+        offset_guess = server + 0.5 - (t_send + t_recv) / 2
+        measurements = []
+        for _ in range(ticks):
+            m = _measure_tick(prober, offset_guess)
+            if m:
+                measurements.append(m)
+                offset_guess = m[0]
+        if not measurements:
+            logging.warning("Clock calibration saw no server tick; using coarse offset %.3fs", offset_guess)
+            return offset_guess, 0.5
+        offset = median(m[0] for m in measurements)
+        uncertainty = min(m[1] for m in measurements)
+        logging.info("Server clock offset %.1f ms (+/- %.1f ms, %d ticks)", offset * 1000, uncertainty * 1000,
+                     len(measurements))
+        return offset, uncertainty
+    finally:
+        prober.close()
+
+
+def parse_fire_time(value, now=None):
+    """
+    Parse --at: an ISO datetime, or HH:MM[:SS[.fff]] meaning the next such
+    local time. Returns epoch seconds. A time that passed at most LATE_GRACE
+    seconds ago (a late cron start), or an ISO datetime in the past, logs a
+    warning and returns now, so the caller fires immediately; an HH:MM time
+    that passed longer ago means tomorrow (e.g. --at 00:05 in the evening).
+    """
+    now = now or datetime.now()
+    try:
+        target = datetime.fromisoformat(value)
+    except ValueError:
+        target = None
+    if target is not None:
+        if target.tzinfo is not None:
+            target = target.astimezone().replace(tzinfo=None)
+        return _not_before(value, target, now)
+    for fmt in ("%H:%M:%S.%f", "%H:%M:%S", "%H:%M"):
+        try:
+            t = datetime.strptime(value, fmt).time()
+            break
+        except ValueError:
+            continue
+    else:
+        raise ValueError(f"unrecognised time {value!r}; use HH:MM[:SS[.fff]] or an ISO datetime")
+    target = datetime.combine(now.date(), t)
+    if (now - target).total_seconds() > LATE_GRACE:
+        target += timedelta(days=1)
+    return _not_before(value, target, now)
+
+
+def _not_before(value, target, now):
+    if target <= now:
+        logging.warning("%s has already passed (%.0fs ago); using the current time", value,
+                        (now - target).total_seconds())
+        return now.timestamp()
+    return target.timestamp()
+
+
+def wait_until(target_server_time, offset):
+    """
+    Block until the server clock reads target_server_time. Sleeps coarsely and
+    spins for the final SPIN_WINDOW. Returns the achieved error in seconds
+    (positive = late).
+    """
+    local_target = target_server_time - offset
+    while True:
+        remaining = local_target - time.time()
+        if remaining <= SPIN_WINDOW:
+            break
+        time.sleep(min(remaining - SPIN_WINDOW, 1.0))
+    while time.time() < local_target:
+        pass
+    return time.time() - local_target
+
+
+def record_timing(entry, path=TIMING_LOG):
+    try:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+        logging.debug("Appended timing record to %s", path)
+    except Exception as e:
+        logging.debug("Failed writing timing record %s: %s", path, e)
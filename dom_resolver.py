@@ -0,0 +1,242 @@
+"""
+Single-round-trip DOM resolution for the booking popup.
+
+resolve_booking_elements() runs one injected routine that locates the seat,
+the booking modal, the start/end (and date) inputs and the enabled Book button
+with the same heuristics as the XPath cascade in book_seat, and returns all
+handles from a single execute_script call. fill_and_book() then sets the
+values and clicks Book in one more call. Together they replace dozens of
+chromedriver round-trips per booking. seat_states() reads the availability of
+every candidate seat on the floor plan in one scan, and seat_free_condition()
+lets an in-page observer wait for one of them to be released.
+"""
+import json
+import logging
+
+_RESOLVE_JS = """
+var seatId = arguments[0], modal = arguments[1];
+var prefix = seatId.split(/\\s+/)[0];
+function lc(s) { return (s || '').toLowerCase(); }
+function visible(el) { return el.getClientRects().length > 0; }
+
+function findSeat() {
+  var labelled = document.querySelectorAll('[aria-label], [title]');
+  var i, el;
+  for (i = 0; i < labelled.length; i++) {
+    el = labelled[i];
+    if (el.getAttribute('aria-label') === seatId || el.getAttribute('title') === seatId) { return el; }
+  }
+  for (i = 0; i < labelled.length; i++) {
+    el = labelled[i];
+    if ((el.getAttribute('aria-label') || el.getAttribute('title') || '').indexOf(prefix) !== -1) { return el; }
+  }
+  return null;
+}
+
+function findModal() {
+  return document.querySelector(
+    "[role='dialog'], [aria-modal='true'], [class*='modal'], [class*='Dialog'], [class*='popup']");
+}
+
+function inputAfterLabel(scope, word) {
+  var labels = scope.querySelectorAll('label');
+  for (var i = 0; i < labels.length; i++) {
+    if (lc(labels[i].textContent).indexOf(word) === -1) { continue; }
+    if (labels[i].control) { return labels[i].control; }
+    var all = document.querySelectorAll('input');
+    for (var j = 0; j < all.length; j++) {
+      if (labels[i].compareDocumentPosition(all[j]) & Node.DOCUMENT_POSITION_FOLLOWING) { return all[j]; }
+    }
+  }
+  return null;
+}
+
+function findInput(scope, word) {
+  var inputs = scope.querySelectorAll('input'), i, el;
+  for (i = 0; i < inputs.length; i++) {
+    el = inputs[i];
+    if (el.type === 'time' && (lc(el.getAttribute('aria-label')).indexOf(word) !== -1 ||
+                               lc(el.getAttribute('placeholder')).indexOf(word) !== -1)) { return el; }
+  }
+  for (i = 0; i < inputs.length; i++) {
+    el = inputs[i];
+    if (lc(el.getAttribute('aria-label')).indexOf(word) !== -1 || lc(el.getAttribute('placeholder')).indexOf(word) !== -1 ||
+        lc(el.getAttribute('name')).indexOf(word) !== -1) { return el; }
+  }
+  return inputAfterLabel(scope, word);
+}
+
+function findTimes(scope) {
+  var start = findInput(scope, 'start'), end = findInput(scope, 'end');
+  if (!start || !end) {
+    var times = scope.querySelectorAll("input[type='time']");
+    if (times.length >= 2) { start = start || times[0]; end = end || times[1]; }
+  }
+  return [start, end];
+}
+
+function findDate(scope) {
+  var el = scope.querySelector("input[type='date']");
+  if (el) { return el; }
+  var inputs = scope.querySelectorAll('input');
+  for (var i = 0; i < inputs.length; i++) {
+    if (lc(inputs[i].getAttribute('aria-label')).indexOf('date') !== -1 || lc(inputs[i].getAttribute('name')).indexOf('date') !== -1) {
+      return inputs[i];
+    }
+  }
+  return null;
+}
+
+function findBook(scope) {
+  var words = ['Book', 'BOOK', 'Book now', 'Confirm', 'OK', 'Ok', 'Yes'];
+  var buttons = scope.querySelectorAll('button');
+  for (var i = 0; i < buttons.length; i++) {
+    var b = buttons[i], text = b.textContent || '';
+    if (b.disabled || !visible(b)) { continue; }
+    for (var j = 0; j < words.length; j++) {
+      if (text.indexOf(words[j]) !== -1) { return b; }
+    }
+  }
+  return null;
+}
+
+modal = modal || findModal();
+var scope = modal || document;
+var times = findTimes(scope);
+if ((!times[0] || !times[1]) && scope !== document) { times = findTimes(document); }
+return {
+  seat: findSeat(),
+  modal: modal,
+  start: times[0],
+  end: times[1],
+  date: findDate(scope) || (scope !== document ? findDate(document) : null),
+  book: findBook(scope) || (scope !== document ? findBook(document) : null)
+};
+"""
+
+_FILL_AND_BOOK_JS = """
+var start = arguments[0], end = arguments[1], startValue = arguments[2], endValue = arguments[3];
+var date = arguments[4], dateValue = arguments[5], book = arguments[6];
+// go through the native setter so framework-controlled inputs see the change
+var setter = Object.getOwnPropertyDescriptor(HTMLInputElement.prototype, 'value').set;
+function setValue(el, value) {
+  el.focus();
+  setter.call(el, value);
+  ['input', 'change', 'blur'].forEach(function(t) { el.dispatchEvent(new Event(t, {bubbles: true})); });
+  return el.value === value;
+}
+// a requested date that cannot be applied must not turn into a booking for the date shown
+if (dateValue && !(date && setValue(date, dateValue))) {
+  return {ok: false, reason: date ? 'date not accepted' : 'no date input', date: date ? date.value : null};
+}
+if (!setValue(start, startValue) || !setValue(end, endValue)) {
+  return {ok: false, reason: 'values not accepted', start: start.value, end: end.value};
+}
+if (book.disabled) { return {ok: false, reason: 'book button disabled after setting times'}; }
+book.scrollIntoView({block: 'center'});
+book.click();
+return {ok: true};
+"""
+
+# shared by seat_states() and seat_free_condition(): label/state of a seat and
+# the ranked candidate elements for a seat list plus zone prefix
+_SEAT_FNS = """
+// "unavailable" contains "available", so the taken markers are checked first
+var TAKEN = /booked|occupied|unavailable|taken|reserved|busy/;
+var FREE = /available|free|vacant|bookable/;
+function label(el) { return (el.getAttribute('aria-label') || el.getAttribute('title') || '').trim(); }
+// "ID-6F-277" names "ID-6F-277" and "ID-6F-277 (UK)", never "ID-6F-2770"
+function sameSeat(text, id) {
+  return text === id || (text.indexOf(id) === 0 && /[\s(]/.test(text.charAt(id.length)));
+}
+function state(el) {
+  if (el.disabled || el.getAttribute('aria-disabled') === 'true') { return 'taken'; }
+  var text = [el.getAttribute('class'), el.getAttribute('data-status'), el.getAttribute('data-state'),
+              label(el)].join(' ').toLowerCase();
+  if (TAKEN.test(text)) { return 'taken'; }
+  if (FREE.test(text)) { return 'free'; }
+  return 'unknown';
+}
+function candidates(ids, zone) {
+  var labelled = document.querySelectorAll('[aria-label], [title]'), out = [], i, j, text;
+  for (j = 0; j < ids.length; j++) {
+    for (i = 0; i < labelled.length; i++) {
+      text = label(labelled[i]);
+      if (sameSeat(text, ids[j]) && out.indexOf(labelled[i]) === -1) {
+        out.push(labelled[i]);
+        break;
+      }
+    }
+  }
+  if (zone) {
+    var zoned = [];
+    for (i = 0; i < labelled.length; i++) {
+      if (label(labelled[i]).indexOf(zone) === 0 && out.indexOf(labelled[i]) === -1) { zoned.push(labelled[i]); }
+    }
+    zoned.sort(function(a, b) { return label(a).localeCompare(label(b), undefined, {numeric: true}); });
+    out = out.concat(zoned);
+  }
+  return out;
+}
+"""
+
+_SEAT_STATES_JS = "var ids = arguments[0], zone = arguments[1];" + _SEAT_FNS + """
+return candidates(ids, zone).map(function(el) { return {label: label(el), state: state(el), element: el}; });
+"""
+
+
+def resolve_booking_elements(driver, seat_identifier, modal=None):
+    """
+    Return a dict with "seat", "modal", "start", "end", "date" and "book"
+    element handles (None where not found) from one execute_script call.
+    """
+    try:
+        return driver.execute_script(_RESOLVE_JS, seat_identifier, modal) or {}
+    except Exception as e:
+        logging.debug("DOM resolver failed: %s", e)
+        return {}
+
+
+def fill_and_book(driver, elements, start_time, end_time, booking_date=None):
+    """
+    Set the date/start/end values and click Book in one call. Returns True when
+    the values (including booking_date, if given) stuck and Book was clicked.
+    """
+    try:
+        result = driver.execute_script(_FILL_AND_BOOK_JS, elements["start"], elements["end"], start_time, end_time,
+                                       elements.get("date"), booking_date, elements["book"])
+    except Exception as e:
+        logging.debug("fill_and_book failed: %s", e)
+        return False
+    if not result or not result.get("ok"):
+        logging.info("Single-call fill/book not accepted (%s); using step-by-step path", (result or {}).get("reason"))
+        return False
+    return True
+
+
+def seat_states(driver, seat_identifiers, zone=None):
+    """
+    Return [{"label", "state", "element"}] for the ranked seat_identifiers
+    found on the floor plan, followed by every other seat whose label starts
+    with zone (in natural label order). state is "free", "taken" or
+    "unknown", read from classes, data-status/data-state, aria-disabled and
+    the label text in one execute_script call.
+    """
+    try:
+        return driver.execute_script(_SEAT_STATES_JS, list(seat_identifiers), zone) or []
+    except Exception as e:
+        logging.debug("Seat state scan failed: %s", e, extra={"sample": True})
+        return []
+
+
+def seat_free_condition(seat_identifiers, zone=None):
+    """
+    A dom_waits.race() "js" expression that is true while any candidate seat
+    is on the plan and explicitly marked free, so an in-page observer can wait
+    for a release. Elements in "unknown" state (a label that merely starts
+    with the seat name, a seat the plan draws without availability) never
+    satisfy it.
+    """
+    return ("(function(ids, zone) {" + _SEAT_FNS +
+            "return candidates(ids, zone).some(function(el) { return state(el) === 'free'; });"
+            f"}})({json.dumps(list(seat_identifiers))}, {json.dumps(zone)})")
@@ -0,0 +1,159 @@
+"""
+Event-driven waits built on in-page MutationObserver promises.
+
+race() evaluates a list of candidate conditions inside the page and, if none
+matches yet, installs a MutationObserver that resolves as soon as one does.
+All candidates are raced in a single execute_async_script call, so a step
+finishes as soon as the DOM is ready rather than after a fixed sleep or a
+sequence of polling timeouts. New browser windows cannot be observed from the
+page, so when watch_windows is set the window handles are checked between
+short observer slices.
+
+A condition is a dict with a "name" and one of:
+    css / xpath   element selector (first match is returned)
+    js            boolean expression evaluated in the page
+and optionally:
+    clickable     element must be visible and enabled
+    unless        css selector that must be absent for the condition to count
+Conditions are checked in list order, so earlier entries win ties.
+
+The conditions are re-checked once per burst of mutations, on a timer after
+the burst, rather than once per mutation record. Long waits on a busy page
+(the seat watch) pass a longer throttle and an attribute_filter so the observer
+only wakes for the attributes their conditions read.
+"""
+import logging
+import time
+
+# slice length for one observer round trip when windows must also be watched
+WINDOW_POLL_SLICE = 0.25
+
+_RACE_JS = """
+var conditions = arguments[0], sliceMs = arguments[1], throttleMs = arguments[2], attributeFilter = arguments[3];
+var done = arguments[arguments.length - 1];
+
+function usable(el, c) {
+  if (!c.clickable) { return true; }
+  if (el.disabled || el.getAttribute('aria-disabled') === 'true') { return false; }
+  return el.getClientRects().length > 0;
+}
+
+function check() {
+  for (var i = 0; i < conditions.length; i++) {
+    var c = conditions[i], el = null;
+    try {
+      if (c.unless && document.querySelector(c.unless)) { continue; }
+      if (c.js) {
+        if (eval(c.js)) { return {name: c.name, element: null}; }
+        continue;
+      }
+      if (c.css) {
+        el = document.querySelector(c.css);
+      } else if (c.xpath) {
+        el = document.evaluate(c.xpath, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+      }
+      if (el && usable(el, c)) { return {name: c.name, element: el}; }
+    } catch (e) {}
+  }
+  return null;
+}
+
+var hit = check();
+if (hit) { done(hit); return; }
+var finished = false, observer = null, pending = null;
+function finish(result) {
+  if (finished) { return; }
+  finished = true;
+  if (observer) { observer.disconnect(); }
+  if (pending) { clearTimeout(pending); }
+  done(result);
+}
+observer = new MutationObserver(function() {
+  // one check per burst of mutations
+  if (pending || finished) { return; }
+  pending = setTimeout(function() {
+    pending = null;
+    var h = check();
+    if (h) { finish(h); }
+  }, throttleMs);
+});
+var options = {childList: true, subtree: true, attributes: true, characterData: !attributeFilter};
+if (attributeFilter) { options.attributeFilter = attributeFilter; }
+observer.observe(document.documentElement || document, options);
+setTimeout(function() { finish(null); }, sliceMs);
+"""
+
+
+def _script_timeout(driver):
+    """
+    The driver's current async script timeout in seconds, or None if unknown.
+    """
+    try:
+        return driver.timeouts.script
+    except Exception:
+        # the CDP backend keeps it as a plain attribute
+        return getattr(driver, "_script_timeout", None)
+
+
+def race(driver, conditions, timeout, watch_windows=False, known_handles=None, throttle=0.0,
+         attribute_filter=None):
+    """
+    Wait for the first matching condition. Returns (name, element); name is
+    "window" (element is the new handle) when a new window appears, and
+    (None, None) on timeout. throttle (seconds) is the delay between a burst
+    of mutations and the re-check; attribute_filter limits the attribute
+    mutations observed (and drops text changes).
+    """
+    deadline = time.monotonic() + timeout
+    if watch_windows and known_handles is None:
+        known_handles = set(driver.window_handles)
+    # the driver is shared with the rest of the flow: put its timeout back afterwards
+    previous = _script_timeout(driver)
+    try:
+        driver.set_script_timeout(timeout + 5)
+    except Exception:
+        pass
+    try:
+        return _race_loop(driver, conditions, deadline, watch_windows, known_handles, throttle, attribute_filter)
+    finally:
+        if previous is not None:
+            try:
+                driver.set_script_timeout(previous)
+            except Exception as e:
+                logging.debug("Could not restore the script timeout: %s", e)
+
+
+def _race_loop(driver, conditions, deadline, watch_windows, known_handles, throttle, attribute_filter):
+    while True:
+        remaining = deadline - time.monotonic()
+        if watch_windows:
+            try:
+                new = [h for h in driver.window_handles if h not in known_handles]
+                if new:
+                    return "window", new[0]
+            except Exception as e:
+                logging.debug("window_handles failed during race: %s", e, extra={"sample": True})
+        if remaining <= 0:
+            return None, None
+        slice_s = min(remaining, WINDOW_POLL_SLICE) if watch_windows else remaining
+        try:
+            hit = driver.execute_async_script(_RACE_JS, conditions, int(slice_s * 1000), int(throttle * 1000),
+                                              attribute_filter)
+            if hit:
+                return hit["name"], hit.get("element")
+        except Exception as e:
+            # navigation destroys the page the observer lives in; retry on the new document
+            logging.debug("Observer interrupted (%s); retrying", e.__class__.__name__, extra={"sample": True})
+            time.sleep(0.05)
+
+
+def wait_for(driver, css=None, xpath=None, timeout=30, clickable=False):
+    """
+    Wait for a single element. Returns the element, or None on timeout.
+    """
+    cond = {"name": "target", "clickable": clickable}
+    if css:
+        cond["css"] = css
+    else:
+        cond["xpath"] = xpath
+    return race(driver, [cond], timeout)[1]
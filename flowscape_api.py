@@ -0,0 +1,225 @@
+"""
+Browserless booking backend that replays the Flowscape web-app API.
+
+The auth token is taken from a session captured by the browser flow (see
+session_cache): a bearer token found in the cached localStorage when there is
+one, otherwise the cached Flowscape cookies. Requests go over a small pool of
+keep-alive connections, so one process can run many bookings concurrently.
+
+The web-app API is not publicly documented; the endpoint paths below match the
+calls the web app makes and can be overridden through the environment if the
+app changes them. mock_flowscape.py serves the same endpoints for local tests.
+"""
+import http.client
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+from urllib.parse import quote, urlparse
+
+from session_cache import SESSION_FILENAME, load_session
+
+API_BASE = os.getenv("FLOWSCAPE_API_BASE") or "https://wsp.flowscape.se/api"
+SEATS_PATH = os.getenv("FLOWSCAPE_API_SEATS_PATH", "/seats?search={query}")
+BOOK_PATH = os.getenv("FLOWSCAPE_API_BOOK_PATH", "/reservations")
+API_TIMEOUT = float(os.getenv("FLOWSCAPE_API_TIMEOUT", "10"))
+
+_JWT_RE = re.compile(r"eyJ[\w-]+\.[\w-]+\.[\w-]+")
+_TOKEN_KEY_RE = re.compile(r"token|auth|msal", re.I)
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+def _find_token(session):
+    """
+    Look for a bearer token in the cached localStorage. MSAL stores JSON blobs,
+    so search values for anything shaped like a JWT.
+    """
+    for entries in (session.get("local_storage") or {}).values():
+        for key, value in entries.items():
+            if not value or not _TOKEN_KEY_RE.search(key):
+                continue
+            match = _JWT_RE.search(value)
+            if match:
+                return match.group(0)
+    return None
+
+
+def _cookie_header(session, host):
+    pairs = []
+    for c in session.get("cookies", []):
+        domain = (c.get("domain") or "").lstrip(".")
+        if domain and (host == domain or host.endswith("." + domain)):
+            pairs.append(f"{c['name']}={c['value']}")
+    return "; ".join(pairs)
+
+
+class FlowscapeApi:
+    """
+    Minimal Flowscape API client with a keep-alive connection pool.
+    """
+
+    def __init__(self, base_url=API_BASE, token=None, cookies="", pool_size=8, timeout=API_TIMEOUT):
+        parts = urlparse(base_url)
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port
+        self.prefix = parts.path.rstrip("/")
+        self.token = token
+        self.cookies = cookies
+        self.timeout = timeout
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+        self._seat_ids = {}
+        self._seat_lock = threading.Lock()
+
+    @classmethod
+    def from_session(cls, session_file=SESSION_FILENAME, base_url=API_BASE, **kwargs):
+        """
+        Build a client from a cached browser session. Raises ApiError when no
+        usable session is cached.
+        """
+        session = load_session(session_file)
+        if not session:
+            raise ApiError(f"no cached session in {session_file}; run the browser flow once first")
+        token = _find_token(session)
+        cookies = _cookie_header(session, urlparse(base_url).hostname or "")
+        if not token and not cookies:
+            raise ApiError("cached session has neither a bearer token nor Flowscape cookies")
+        return cls(base_url, token=token, cookies=cookies, **kwargs)
+
+    def _connection(self):
+        """
+        Return (connection, reused): an idle pooled connection or a new one.
+        """
+        try:
+            return self._pool.get_nowait(), True
+        except queue.Empty:
+            conn_cls = http.client.HTTPSConnection if self.scheme == "https" else http.client.HTTPConnection
+            return conn_cls(self.host, self.port, timeout=self.timeout), False
+
+    def _release(self, conn):
+        try:
+            self._pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close(self):
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def request(self, method, path, body=None):
+        """
+        Send one API call and return the decoded JSON body. Anything but a 2xx
+        JSON response with a body (an SSO redirect, a login page served with
+        200, a dropped connection) raises ApiError.
+        """
+        headers = {"Accept": "application/json", "Connection": "keep-alive"}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        if self.cookies:
+            headers["Cookie"] = self.cookies
+        payload = None
+        if body is not None:
+            payload = json.dumps(body).encode("utf-8")
+            headers["Content-Type"] = "application/json"
+
+        # one retry, only when an idle keep-alive connection turns out to have been closed by
+        # the server: while sending, or (idempotent methods only) before any response byte.
+        # A POST that may have reached the server and any timeout are never repeated, so a
+        # reservation cannot be made twice.
+        for attempt in range(2):
+            conn, reused = self._connection()
+            sent = False
+            try:
+                conn.request(method, self.prefix + path, body=payload, headers=headers)
+                sent = True
+                resp = conn.getresponse()
+                data = resp.read()
+            except (http.client.HTTPException, OSError) as e:
+                conn.close()
+                stale = reused and attempt == 0 and (
+                    isinstance(e, (BrokenPipeError, ConnectionResetError)) and not sent
+                    or isinstance(e, http.client.RemoteDisconnected) and method in ("GET", "HEAD"))
+                if stale:
+                    logging.debug("API %s %s failed on pooled connection (%s); retrying", method, path, e)
+                    continue
+                raise ApiError(f"{method} {path}: {e}")
+            if resp.will_close:
+                conn.close()
+            else:
+                self._release(conn)
+            if not 200 <= resp.status < 300:
+                raise ApiError(f"{method} {path}: HTTP {resp.status} {data[:200]!r}", resp.status)
+            content_type = resp.getheader("Content-Type") or ""
+            if "json" not in content_type.lower():
+                raise ApiError(f"{method} {path}: expected JSON, got {content_type or 'no content type'} "
+                               f"{data[:200]!r}", resp.status)
+            if not data.strip():
+                raise ApiError(f"{method} {path}: empty response body", resp.status)
+            try:
+                return json.loads(data)
+            except ValueError as e:
+                raise ApiError(f"{method} {path}: invalid JSON ({e})", resp.status)
+
+    def seat_id(self, seat_identifier):
+        """
+        Resolve the identifier passed to --seat (e.g. "ID-6F-277 (UK)") to the
+        backend seat ID. Only an exact name match counts: "ID-6F-277" must not
+        resolve to "ID-6F-2770".
+        """
+        with self._seat_lock:
+            if seat_identifier in self._seat_ids:
+                return self._seat_ids[seat_identifier]
+        prefix = seat_identifier.split()[0]
+        seats = self.request("GET", SEATS_PATH.format(query=quote(prefix)))
+        if not isinstance(seats, list):
+            raise ApiError(f"seat search for {prefix!r} returned {type(seats).__name__}, not a list")
+        match = next((s for s in seats if isinstance(s, dict) and s.get("name") == seat_identifier), None)
+        if match is None or match.get("id") is None:
+            raise ApiError(f"seat {seat_identifier!r} not found", 404)
+        with self._seat_lock:
+            self._seat_ids[seat_identifier] = match["id"]
+        return match["id"]
+
+    def book(self, seat_identifier, booking_date, start_time, end_time):
+        """
+        Reserve the seat. Returns the reservation returned by the backend.
+        """
+        body = {
+            "seatId": self.seat_id(seat_identifier),
+            "date": booking_date,
+            "start": start_time,
+            "end": end_time,
+        }
+        return self.request("POST", BOOK_PATH, body)
+
+
+def book_via_api(seat_identifier, booking_date, start_time, end_time, session_file=SESSION_FILENAME, api=None):
+    """
+    Book one seat over HTTP. Returns True on success, False when the caller
+    should fall back to the browser flow.
+    """
+    started = time.monotonic()
+    try:
+        api = api or FlowscapeApi.from_session(session_file)
+        reservation = api.book(seat_identifier, booking_date, start_time, end_time)
+        logging.info("Booked %s over HTTP in %.0f ms (reservation=%s)", seat_identifier,
+                     (time.monotonic() - started) * 1000, (reservation or {}).get("id"))
+        return True
+    except ApiError as e:
+        logging.warning("HTTP booking failed (%s); falling back to the browser flow", e)
+        return False
+    except Exception as e:
+        logging.warning("HTTP booking failed unexpectedly (%s: %s); falling back to the browser flow",
+                        type(e).__name__, e)
+        return False
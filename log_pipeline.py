@@ -0,0 +1,150 @@
+"""
+Non-blocking structured logging.
+
+configure() puts a single QueueHandler on the root logger. The booking thread
+only stamps the record with the current run id, job and step (from
+run_metrics) and enqueues it; formatting and all file / stdout I/O happen on a
+QueueListener thread:
+
+- JSON lines ({"ts", "level", "msg", "run", "job", "step", ...}) to the log
+  file, which rotates by size (FLOWSCAPE_LOG_MAX_BYTES, FLOWSCAPE_LOG_BACKUPS)
+  and is rolled over at start by the process that owns it (a normal run or
+  the daemon), so each run begins a fresh booking.log while earlier runs are
+  kept as booking.log.1, .2, ...; a --submit client only appends, and batch
+  workers log to one file per job instead;
+- the usual human-readable lines to stdout.
+
+DEBUG records from call sites marked as hot loops (seat scans, selector
+strategies, observer retries) with extra={"sample": True} are sampled per call site:
+the first FLOWSCAPE_LOG_SAMPLE_BURST from one line are kept, then one in
+FLOWSCAPE_LOG_SAMPLE_EVERY, so such a line cannot flood the queue. Kept records
+after the burst carry "sampled": N. Every other record is always logged.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+
+from run_metrics import current_run
+
+LOG_MAX_BYTES = int(os.getenv("FLOWSCAPE_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUPS = int(os.getenv("FLOWSCAPE_LOG_BACKUPS", "5"))
+SAMPLE_BURST = int(os.getenv("FLOWSCAPE_LOG_SAMPLE_BURST", "20"))
+SAMPLE_EVERY = int(os.getenv("FLOWSCAPE_LOG_SAMPLE_EVERY", "50"))
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(message)s"
+
+_listener = None
+_queue_handler = None
+_handlers = []
+
+
+class _ContextFilter(logging.Filter):
+    """
+    Runs on the calling thread, before the record is queued: samples marked
+    DEBUG call sites and stamps the run id, job and step, which are
+    thread-local in run_metrics.
+    """
+    def __init__(self):
+        super().__init__()
+        self._counts = {}
+
+    def filter(self, record):
+        if record.levelno <= logging.DEBUG and SAMPLE_EVERY > 1 and getattr(record, "sample", False):
+            key = (record.pathname, record.lineno)
+            self._counts[key] = count = self._counts.get(key, 0) + 1
+            if count > SAMPLE_BURST:
+                if (count - SAMPLE_BURST) % SAMPLE_EVERY:
+                    return False
+                record.sampled = SAMPLE_EVERY
+        run = current_run()
+        if run is not None:
+            record.run_id = run.id
+            record.job = run.meta.get("job")
+            record.step = ".".join(entry["name"] for entry in run.stack) or None
+        return True
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        # merge the args now, while they still hold their current values, and
+        # render the traceback; the formatters themselves run on the listener
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "msg": record.getMessage(),
+            "run": getattr(record, "run_id", None),
+            "job": getattr(record, "job", None),
+            "step": getattr(record, "step", None),
+            "logger": record.name if record.name != "root" else None,
+            "thread": record.threadName if record.threadName != "MainThread" else None,
+            "sampled": getattr(record, "sampled", None),
+            "exc": record.exc_text,
+        }
+        return json.dumps({k: v for k, v in entry.items() if v is not None}, default=str)
+
+
+def configure(debug, path, rollover=True, console=True):
+    """
+    Route all logging through the queue to a JSON-lines file at path (and
+    stdout). Replaces any existing handlers, including ones inherited by a
+    forked worker whose listener thread did not survive the fork. With
+    rollover=False the file is appended to and never rotated, so a client
+    does not rotate the log of the process that owns it.
+    """
+    stop()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    file_handler = logging.handlers.RotatingFileHandler(path, maxBytes=LOG_MAX_BYTES if rollover else 0,
+                                                        backupCount=LOG_BACKUPS, encoding="utf-8")
+    if rollover and os.path.getsize(path) > 0:
+        file_handler.doRollover()
+    file_handler.setFormatter(JsonFormatter())
+    _handlers[:] = [file_handler]
+    if console:
+        stream_handler = logging.StreamHandler(sys.stdout)
+        stream_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+        _handlers.append(stream_handler)
+
+    global _listener, _queue_handler
+    log_queue = queue.SimpleQueue()
+    _queue_handler = _QueueHandler(log_queue)
+    _queue_handler.addFilter(_ContextFilter())
+    root.addHandler(_queue_handler)
+    root.setLevel(logging.DEBUG if debug else logging.INFO)
+    _listener = logging.handlers.QueueListener(log_queue, *_handlers)
+    _listener.start()
+
+
+def stop():
+    """
+    Drain the queue and close the files. Registered with atexit; call it
+    explicitly where atexit does not run (process pool workers).
+    """
+    global _listener, _queue_handler
+    if _listener is None:
+        return
+    logging.getLogger().removeHandler(_queue_handler)
+    _listener.stop()
+    _listener, _queue_handler = None, None
+    for handler in _handlers:
+        handler.close()
+    _handlers.clear()
+
+
+atexit.register(stop)
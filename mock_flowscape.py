@@ -0,0 +1,337 @@
+"""
+Local stand-in for Flowscape and the Microsoft login, for exercising the booking
+flow and the HTTP backend without the real services.
+
+One server answers for two host names, selected by the Host header:
+
+    wsp.flowscape.test           floor plan (/webapp/), seat booking popup, API (/api/...)
+    login.microsoftonline.test   loginfmt -> passwd -> optional "Stay signed in?" prompt
+
+Chrome reaches both through --host-resolver-rules (see HOST_RESOLVER_RULES), so
+the flow's host checks behave as they do against the real services:
+
+    python mock_flowscape.py --port 8089 --token test-token
+    FLOWSCAPE_URL=http://wsp.flowscape.test:8089/webapp/ ...
+    FLOWSCAPE_API_BASE=http://127.0.0.1:8089/api python book_seat.py --backend http
+
+Options inject server latency, a delay before the booking popup appears, a
+login popup window, the optional prompt, and the booking form variant
+(in-page modal, modal with an iframe, or a separate window).
+"""
+import argparse
+import json
+import logging
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, urlparse
+
+DEFAULT_SEATS = [f"ID-6F-{n} (UK)" for n in range(270, 290)]
+FLOWSCAPE_HOST = "wsp.flowscape.test"
+LOGIN_HOST = "login.microsoftonline.test"
+HOST_RESOLVER_RULES = "MAP *.test 127.0.0.1"
+BOOKING_VARIANTS = ("modal", "iframe", "window")
+
+_FORM_HTML = """
+<label>Date <input type="date" aria-label="Date" name="date"></label>
+<label>Start <input type="time" aria-label="Start time" name="start"></label>
+<label>End <input type="time" aria-label="End time" name="end"></label>
+<button type="button" onclick="submitBooking(this)">Book</button>
+"""
+
+# served as /webapp/app.js; must not contain the confirmation words the flow
+# waits for, so the message text comes from the server response
+_APP_JS = """
+var FORM_HTML = %(form)s;
+function topDocument() {
+  if (window.opener) { return window.opener.document; }
+  return window.parent.document;
+}
+function openBooking(el) {
+  var seat = el.getAttribute('aria-label');
+  var url = '/webapp/booking-form?seat=' + encodeURIComponent(seat);
+  setTimeout(function() {
+    if (VARIANT === 'window') { window.open(url, 'booking', 'width=640,height=480'); return; }
+    var dlg = document.createElement('div');
+    dlg.setAttribute('role', 'dialog');
+    dlg.className = 'modal';
+    dlg.setAttribute('data-seat', seat);
+    dlg.innerHTML = VARIANT === 'iframe' ? '<iframe src="' + url + '"></iframe>' : FORM_HTML;
+    document.body.appendChild(dlg);
+  }, MODAL_DELAY);
+}
+function submitBooking(btn) {
+  var scope = btn.parentNode;
+  var seat = scope.getAttribute('data-seat') || new URLSearchParams(location.search).get('seat');
+  var body = {seat: seat};
+  ['date', 'start', 'end'].forEach(function(n) { body[n] = scope.querySelector('[name=' + n + ']').value; });
+  fetch('/webapp/book', {method: 'POST', body: JSON.stringify(body)})
+    .then(function(r) { return r.json(); })
+    .then(function(d) {
+      var doc = (window.opener || window.parent !== window) ? topDocument() : document;
+      var toast = doc.createElement('div');
+      toast.className = 'toast';
+      toast.textContent = d.message;
+      doc.body.appendChild(toast);
+      if (window.opener) { window.close(); }
+    });
+}
+"""
+
+_PAGE = """<!doctype html>
+<html><head><title>%(title)s</title></head><body>%(body)s</body></html>"""
+
+
+class _State:
+    def __init__(self, seats, token, options=None):
+        self.seats = [{"id": 1000 + i, "name": name} for i, name in enumerate(seats)]
+        self.token = token
+        self.reservations = {}
+        self.sessions = set()
+        self.bookings = []
+        self.lock = threading.Lock()
+        self.options = {"latency_ms": 0, "modal_delay_ms": 0, "login_popup": False, "kmsi": True,
+                        "booking_variant": "modal", "taken": ()}
+        self.options.update(options or {})
+
+
+class MockFlowscapeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, fmt, *args):
+        logging.debug("mock: " + fmt, *args)
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def _delay(self):
+        latency = self.state.options["latency_ms"]
+        if latency:
+            time.sleep(latency / 1000)
+
+    def _send(self, status, body, content_type="text/html; charset=utf-8", headers=()):
+        data = body.encode("utf-8") if isinstance(body, str) else body
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Cache-Control", "no-store")
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_json(self, status, payload):
+        self._send(status, json.dumps(payload), "application/json")
+
+    def _redirect(self, location, headers=()):
+        self._send(303, "", headers=[("Location", location)] + list(headers))
+
+    def _page(self, title, body):
+        self._send(200, _PAGE % {"title": title, "body": body})
+
+    def _host(self):
+        return (self.headers.get("Host") or "").split(":")[0]
+
+    def _origin(self, host):
+        return f"http://{host}:{self.server.server_address[1]}"
+
+    def _form(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return {k: v[0] for k, v in parse_qs(self.rfile.read(length).decode("utf-8")).items()}
+
+    def _authorized(self):
+        # the API takes the bearer token or the session cookie the mock login sets, like the web app
+        return self.headers.get("Authorization") == f"Bearer {self.state.token}" or self._session() is not None
+
+    def _session(self):
+        for part in (self.headers.get("Cookie") or "").split(";"):
+            name, _, value = part.strip().partition("=")
+            if name == "fs_session" and value in self.state.sessions:
+                return value
+        return None
+
+    def do_GET(self):
+        self._delay()
+        url = urlparse(self.path)
+        if url.path.startswith("/api/"):
+            return self._api_get(url)
+        if self._host() == LOGIN_HOST:
+            return self._login_get(url)
+        return self._app_get(url)
+
+    def do_POST(self):
+        self._delay()
+        url = urlparse(self.path)
+        if url.path.startswith("/api/"):
+            return self._api_post(url)
+        if self._host() == LOGIN_HOST:
+            return self._login_post(url)
+        if url.path == "/webapp/book":
+            return self._app_book()
+        self._send_json(404, {"error": "not found"})
+
+    # --- Flowscape web app ---------------------------------------------------
+
+    def _app_get(self, url):
+        opts = self.state.options
+        query = parse_qs(url.query)
+        if url.path == "/webapp/app.js":
+            return self._send(200, _APP_JS % {"form": json.dumps(_FORM_HTML)}, "application/javascript")
+        if url.path == "/webapp/auth":
+            # end of the login: set the session cookie on the Flowscape host
+            token = query.get("token", [""])[0]
+            cookie = ("Set-Cookie", f"fs_session={token}; Path=/; Max-Age=3600")
+            if query.get("popup"):
+                return self._send(200, _PAGE % {"title": "Signed in", "body": (
+                    "<script>if (window.opener) { window.opener.location.reload(); } window.close();</script>")},
+                    headers=[cookie])
+            return self._redirect("/webapp/", [cookie])
+        if url.path == "/webapp/booking-form":
+            if not self._session():
+                return self._send(401, "unauthorized", "text/plain")
+            return self._page("Book seat", _FORM_HTML + '<script src="/webapp/app.js"></script>')
+        if url.path != "/webapp/":
+            return self._send(404, "not found", "text/plain")
+
+        if not self._session():
+            target = f"{self._origin(LOGIN_HOST)}/common/login"
+            if opts["login_popup"]:
+                action = f"window.open('{target}?popup=1', 'login', 'width=500,height=600')"
+            else:
+                action = f"location.href = '{target}'"
+            return self._page("Flowscape", f'<button onclick="{action}">Sign in with Microsoft</button>')
+
+        seats = "".join(
+            f'<div class="seat {"seat--occupied" if s["name"] in opts["taken"] else "seat--available"}" role="button" '
+            f'aria-label="{s["name"]}" title="{s["name"]}" onclick="openBooking(this)">{s["name"].split()[0]}</div>'
+            for s in self.state.seats
+        )
+        config = (f"<script>var VARIANT = {json.dumps(opts['booking_variant'])}, "
+                  f"MODAL_DELAY = {int(opts['modal_delay_ms'])};</script>")
+        self._page("Flowscape", f'<div id="plan">{seats}</div>{config}<script src="/webapp/app.js"></script>')
+
+    def _app_book(self):
+        if not self._session():
+            return self._send_json(401, {"error": "unauthorized"})
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        with self.state.lock:
+            self.state.bookings.append(body)
+        self._send_json(200, {"message": f"Booking confirmed: {body.get('seat')} {body.get('start')}-{body.get('end')}"})
+
+    # --- Microsoft login -----------------------------------------------------
+
+    def _login_get(self, url):
+        query = parse_qs(url.query)
+        popup = "1" if query.get("popup") else ""
+        if url.path == "/common/login":
+            return self._page("Sign in to your account", (
+                f'<form method="post" action="/common/login?popup={popup}">'
+                '<input type="email" name="loginfmt" placeholder="Email">'
+                '<input type="submit" id="idSIButton9" value="Next"></form>'))
+        if url.path == "/common/password":
+            return self._page("Enter password", (
+                f'<form method="post" action="/common/password?popup={popup}">'
+                '<input type="password" name="passwd" placeholder="Password">'
+                '<input type="submit" id="idSIButton9" value="Sign in"></form>'))
+        if url.path == "/common/kmsi":
+            return self._page("Stay signed in?", (
+                f'<form method="post" action="/common/kmsi?popup={popup}">'
+                '<p>Stay signed in?</p>'
+                '<input type="submit" id="idBtn_Back" name="choice" value="No">'
+                '<input type="submit" id="idSIButton9" name="choice" value="Yes"></form>'))
+        self._send(404, "not found", "text/plain")
+
+    def _login_post(self, url):
+        popup = "1" if parse_qs(url.query).get("popup") else ""
+        form = self._form()
+        if url.path == "/common/login":
+            if not form.get("loginfmt"):
+                return self._redirect(f"/common/login?popup={popup}")
+            return self._redirect(f"/common/password?popup={popup}")
+        if url.path == "/common/password":
+            if not form.get("passwd"):
+                return self._redirect(f"/common/password?popup={popup}")
+            if self.state.options["kmsi"]:
+                return self._redirect(f"/common/kmsi?popup={popup}")
+        elif url.path != "/common/kmsi":
+            return self._send(404, "not found", "text/plain")
+        token = uuid.uuid4().hex
+        with self.state.lock:
+            self.state.sessions.add(token)
+        self._redirect(f"{self._origin(FLOWSCAPE_HOST)}/webapp/auth?token={quote(token)}&popup={popup}")
+
+    # --- REST API used by flowscape_api ---------------------------------------
+
+    def _api_get(self, url):
+        if url.path != "/api/seats":
+            return self._send_json(404, {"error": "not found"})
+        if not self._authorized():
+            return self._send_json(401, {"error": "unauthorized"})
+        query = parse_qs(url.query).get("search", [""])[0]
+        self._send_json(200, [s for s in self.state.seats if query in s["name"]])
+
+    def _api_post(self, url):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if url.path != "/api/reservations":
+            return self._send_json(404, {"error": "not found"})
+        if not self._authorized():
+            return self._send_json(401, {"error": "unauthorized"})
+        state = self.state
+        key = (body.get("seatId"), body.get("date"))
+        with state.lock:
+            if not any(s["id"] == key[0] for s in state.seats):
+                return self._send_json(404, {"error": "unknown seat"})
+            if key in state.reservations:
+                return self._send_json(409, {"error": "seat already booked"})
+            reservation = dict(body, id=len(state.reservations) + 1)
+            state.reservations[key] = reservation
+        self._send_json(201, reservation)
+
+
+def make_server(port=0, token="test-token", seats=DEFAULT_SEATS, **options):
+    """
+    Create (but do not start) a mock server; port 0 picks a free port.
+    Keyword options: latency_ms, modal_delay_ms, login_popup, kmsi, booking_variant,
+    taken (seat names drawn as occupied).
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), MockFlowscapeHandler)
+    server.daemon_threads = True
+    server.state = _State(seats, token, options)
+    return server
+
+
+def app_url(server):
+    return f"http://{FLOWSCAPE_HOST}:{server.server_address[1]}/webapp/"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local mock of Flowscape and the Microsoft login")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--token", type=str, default="test-token",
+                        help="Bearer token the API accepts (as well as a session cookie from the mock login)")
+    parser.add_argument("--latency-ms", type=int, default=0, help="Delay added to every response")
+    parser.add_argument("--modal-delay-ms", type=int, default=0, help="Delay before the booking popup appears")
+    parser.add_argument("--login-popup", action="store_true", help="Open the Microsoft login in a popup window")
+    parser.add_argument("--no-kmsi", action="store_true", help="Skip the 'Stay signed in?' prompt")
+    parser.add_argument("--booking-variant", choices=BOOKING_VARIANTS, default="modal")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    server = make_server(args.port, args.token, latency_ms=args.latency_ms, modal_delay_ms=args.modal_delay_ms,
+                         login_popup=args.login_popup, kmsi=not args.no_kmsi, booking_variant=args.booking_variant)
+    logging.info("Mock Flowscape at %s (API http://127.0.0.1:%d/api); Chrome needs --host-resolver-rules=\"%s\"",
+                 app_url(server), server.server_address[1], HOST_RESOLVER_RULES)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""
+Book one seat for several dates in a single authenticated browser.
+
+Dates come from an explicit list/range and/or a weekly recurrence:
+
+    --dates 2026-10-19,2026-10-21          single dates
+    --dates 2026-10-19..2026-10-30         a range, filtered by --weekdays
+    --weeks 2 --weekdays mon,wed           recurrence starting tomorrow
+
+The flow logs in once, then opens one tab per date with window.open so the
+floor plans load in parallel. WebDriver drives one window at a time, so the
+seat/modal/times/book stages run tab by tab, but every tab is already loaded
+when its turn comes and the confirmations are collected only after all tabs
+have clicked Book, so the server round-trips overlap. Every tab opens the same
+floor plan; the date is applied in that tab's booking popup, and a date the
+popup does not accept is reported FAILED instead of being booked for the date
+the plan shows.
+"""
+import json
+import logging
+import os
+import time
+from datetime import date, datetime, timedelta
+
+from book_seat import DEFAULT_END, DEFAULT_START, SELECTOR_CACHE, TARGET_URL, _Flow, _run_stages
+from network_profile import follow_window
+from run_metrics import event, span, step, timed
+from session_cache import SESSION_FILENAME
+
+REPORT_FILENAME = os.getenv("FLOWSCAPE_MULTI_DATE_REPORT", "multi_date_report.json")
+MAX_TABS = int(os.getenv("FLOWSCAPE_MAX_TABS", "5"))
+WEEKDAY_NAMES = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+
+
+def parse_weekdays(spec):
+    """
+    "mon-fri" or "mon,wed,fri" -> set of weekday numbers (Monday = 0).
+    """
+    days = set()
+    for part in filter(None, (p.strip().lower() for p in spec.split(","))):
+        try:
+            bounds = [WEEKDAY_NAMES.index(name.strip()[:3]) for name in part.split("-", 1)]
+        except ValueError:
+            raise ValueError(f"unknown weekday in {part!r}; expected names like {', '.join(WEEKDAY_NAMES)}")
+        days.update(range(bounds[0], bounds[-1] + 1))
+    return days
+
+
+def expand_dates(spec=None, weeks=0, weekdays="mon-fri", today=None):
+    """
+    Return the sorted, de-duplicated YYYY-MM-DD dates for an explicit list /
+    range spec plus `weeks` weeks of recurrence starting tomorrow. Ranges and
+    the recurrence only keep the given weekdays; single dates are kept as-is.
+    """
+    days = parse_weekdays(weekdays)
+    today = today or date.today()
+    result = set()
+    for item in filter(None, (i.strip() for i in (spec or "").split(","))):
+        try:
+            if ".." in item:
+                first, last = (datetime.strptime(d.strip(), "%Y-%m-%d").date() for d in item.split("..", 1))
+                result.update(first + timedelta(n) for n in range((last - first).days + 1)
+                              if (first + timedelta(n)).weekday() in days)
+            else:
+                result.add(datetime.strptime(item, "%Y-%m-%d").date())
+        except ValueError:
+            raise ValueError(f"invalid date or range {item!r}; expected YYYY-MM-DD or YYYY-MM-DD..YYYY-MM-DD")
+    for n in range(1, weeks * 7 + 1):
+        day = today + timedelta(n)
+        if day.weekday() in days:
+            result.add(day)
+    return [d.isoformat() for d in sorted(result)]
+
+
+def _open_tabs(driver, count, timeout=2):
+    """
+    Open `count` tabs on the target URL without waiting for them to load.
+    Returns their window handles.
+    """
+    before = set(driver.window_handles)
+    for _ in range(count):
+        driver.execute_script("window.open(arguments[0], '_blank');", TARGET_URL)
+    deadline = time.monotonic() + timeout
+    handles = [h for h in driver.window_handles if h not in before]
+    while len(handles) < count and time.monotonic() < deadline:
+        time.sleep(0.05)
+        handles = [h for h in driver.window_handles if h not in before]
+    while len(handles) < count:
+        # popup blocked: open the rest one blocking load at a time
+        logging.info("window.open opened %d of %d tabs; opening the rest directly", len(handles), count)
+        driver.switch_to.new_window("tab")
+        driver.get(TARGET_URL)
+        handles.append(driver.current_window_handle)
+    return handles
+
+
+def _book_tabs(driver, flows):
+    for flow in flows:
+        try:
+            driver.switch_to.window(flow.window)
+            follow_window(driver)
+            flow.ok = _run_stages(flow, "seat", "book")
+            if not flow.ok:
+                flow.error = flow.failure or "booking stages failed"
+        except Exception as e:
+            logging.error("Booking %s failed: %s", flow.booking_date, e)
+            flow.ok, flow.error = False, str(e)
+    # the confirmations have been on their way while the other tabs were filled
+    for flow in flows:
+        if not flow.ok:
+            continue
+        try:
+            driver.switch_to.window(flow.window)
+            flow.ok = _run_stages(flow, "confirm", "confirm")
+            if not flow.ok:
+                flow.error = "no booking confirmation"
+        except Exception as e:
+            logging.error("Confirming %s failed: %s", flow.booking_date, e)
+            flow.ok, flow.error = False, str(e)
+        flow.elapsed = round(time.monotonic() - flow.started, 3)
+
+
+@timed("book_dates")
+def book_dates(driver, seat_identifier, dates, email=None, password=None, session_file=SESSION_FILENAME,
+               start_time=DEFAULT_START, end_time=DEFAULT_END, report_path=REPORT_FILENAME, zone=None):
+    """
+    Log in once and book seat_identifier for every date, MAX_TABS tabs at a
+    time. Writes a JSON report and returns the per-date results.
+    """
+    started = time.monotonic()
+    results = []
+    auth = _Flow(driver, seat_identifier, email=email, password=password, session_file=session_file, zone=zone)
+    try:
+        with span("authenticate"):
+            authenticated = _run_stages(auth, "open", "auth")
+        if not authenticated:
+            results = [{"date": d, "ok": False, "error": "login failed"} for d in dates]
+        for i in range(0, len(dates) if authenticated else 0, MAX_TABS):
+            chunk = dates[i:i + MAX_TABS]
+            step("open_tabs")
+            driver.switch_to.window(auth.window)
+            tabs = _open_tabs(driver, len(chunk))
+            logging.info("Opened %d tabs for %s", len(tabs), ", ".join(chunk))
+            flows = []
+            for tab, booking_date in zip(tabs, chunk):
+                flow = _Flow(driver, seat_identifier, window=tab, email=email, password=password,
+                             session_file=session_file, start_time=start_time, end_time=end_time,
+                             booking_date=booking_date, zone=zone)
+                # keeps the sibling tabs from being closed as stray popups on a retry
+                flow.handles_before_click = set(driver.window_handles)
+                flow.started, flow.ok, flow.error, flow.elapsed = time.monotonic(), False, None, None
+                flows.append(flow)
+            _book_tabs(driver, flows)
+            for flow in flows:
+                results.append({"date": flow.booking_date, "ok": bool(flow.ok), "error": flow.error,
+                                "elapsed": flow.elapsed})
+                event("date_booked", date=flow.booking_date, ok=bool(flow.ok))
+                logging.info("Date %s: %s", flow.booking_date, "OK" if flow.ok else "FAILED")
+                try:
+                    driver.switch_to.window(flow.window)
+                    driver.close()
+                except Exception:
+                    pass
+            driver.switch_to.window(auth.window)
+    finally:
+        SELECTOR_CACHE.save()
+
+    report = {
+        "seat": seat_identifier,
+        "zone": zone,
+        "dates": len(results),
+        "succeeded": sum(1 for r in results if r["ok"]),
+        "failed": sum(1 for r in results if not r["ok"]),
+        "wall_time": round(time.monotonic() - started, 3),
+        "results": results,
+    }
+    try:
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        logging.info("Wrote multi-date report %s", report_path)
+    except Exception as e:
+        logging.debug("Failed writing multi-date report %s: %s", report_path, e)
+    logging.info("Multi-date booking finished: %d/%d dates booked in %.1fs",
+                 report["succeeded"], report["dates"], report["wall_time"])
+    return results
@@ -0,0 +1,137 @@
+"""
+Network interception profiles for faster page loads.
+
+A profile blocks URL patterns and resource types through the Chrome DevTools
+Protocol (Network.setBlockedURLs) and can point Chrome at a persistent disk
+cache, so static bundles are served locally on the next run instead of being
+downloaded again. Selenium's execute_cdp_cmd cannot receive CDP events, so
+resource types are expressed as URL patterns rather than intercepted with
+Fetch.requestPaused.
+
+A profile is a built-in name (see PROFILES) or a path to a JSON file:
+
+    {"block_types": ["image", "font"], "block_patterns": ["*hotjar*"],
+     "disk_cache_dir": ".chrome-cache", "disk_cache_size_mb": 200}
+
+Savings are read back from the performance log by run_metrics (blocked
+requests, requests and bytes served from cache).
+
+Network.setBlockedURLs only applies to the page target it is sent to. The CDP
+backend installs it on every page it attaches to; with Selenium the flow calls
+follow_window() after switching to a popup or tab it opened. Either way a new
+window's blocklist arrives after it started loading, so its first requests are
+not blocked. Browsers that run side by side (daemon slots, batch workers)
+pass a cache_key and get their own persistent cache directory below
+disk_cache_dir, kept outside their throwaway profiles so it is still warm for
+the next job; Chrome does not support two browsers sharing one cache.
+"""
+import json
+import logging
+import os
+import re
+
+# svg is left out on purpose: the floor plan may be drawn with it
+RESOURCE_TYPE_PATTERNS = {
+    "image": ["*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.ico", "*.bmp", "*.png?*", "*.jpg?*", "*.webp?*"],
+    "font": ["*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot", "*.woff2?*", "*.woff?*"],
+    "media": ["*.mp4", "*.webm", "*.mp3", "*.ogg", "*.wav"],
+    "tile": ["*/tiles/*", "*tile.openstreetmap.org*", "*virtualearth.net*", "*api.mapbox.com*"],
+}
+
+ANALYTICS_PATTERNS = [
+    "*google-analytics.com*",
+    "*googletagmanager.com*",
+    "*doubleclick.net*",
+    "*applicationinsights.azure.com*",
+    "*dc.services.visualstudio.com*",
+    "*browser.events.data.microsoft.com*",
+    "*clarity.ms*",
+    "*hotjar.com*",
+    "*segment.io*",
+    "*sentry.io*",
+]
+
+PROFILES = {
+    "off": {},
+    # safe for the booking flow: nothing the seat map or login forms need
+    "lean": {"block_types": ["font", "media"], "block_patterns": ANALYTICS_PATTERNS,
+             "disk_cache_dir": ".chrome-cache"},
+    # also drops images and map tiles; seats are still located by their labels
+    "aggressive": {"block_types": ["image", "font", "media", "tile"], "block_patterns": ANALYTICS_PATTERNS,
+                   "disk_cache_dir": ".chrome-cache"},
+}
+
+
+def load_profile(spec):
+    """
+    Return the profile dict for a built-in name or JSON file path (None/"" -> off).
+    """
+    if not spec:
+        return {}
+    if spec in PROFILES:
+        return dict(PROFILES[spec])
+    with open(spec, encoding="utf-8") as f:
+        profile = json.load(f)
+    unknown = set(profile.get("block_types", [])) - set(RESOURCE_TYPE_PATTERNS)
+    if unknown:
+        raise ValueError(f"unknown resource types in {spec}: {', '.join(sorted(unknown))}")
+    return profile
+
+
+def blocked_patterns(profile):
+    patterns = list(profile.get("block_patterns", []))
+    for resource_type in profile.get("block_types", []):
+        patterns.extend(RESOURCE_TYPE_PATTERNS[resource_type])
+    return patterns
+
+
+def chrome_args(profile, cache_key=None):
+    """
+    Command-line flags needed before Chrome starts (persistent disk cache).
+    cache_key (e.g. "slot0", "worker1") selects a subdirectory of its own for
+    a browser that runs alongside others.
+    """
+    args = []
+    if profile.get("disk_cache_dir"):
+        cache_dir = os.path.abspath(profile["disk_cache_dir"])
+        if cache_key:
+            cache_dir = os.path.join(cache_dir, re.sub(r"[^\w.-]", "_", str(cache_key)))
+        os.makedirs(cache_dir, exist_ok=True)
+        args.append(f"--disk-cache-dir={cache_dir}")
+        args.append(f"--disk-cache-size={int(profile.get('disk_cache_size_mb', 200)) * 1024 * 1024}")
+    return args
+
+
+def apply_profile(driver, profile):
+    """
+    Install the URL blocklist on the driver's current target (with the CDP
+    backend: on every target). Call before the first navigation.
+    """
+    patterns = blocked_patterns(profile)
+    if not patterns:
+        return
+    try:
+        if hasattr(driver, "block_urls"):
+            driver.block_urls(patterns)
+        else:
+            driver.execute_cdp_cmd("Network.enable", {})
+            driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": patterns})
+            driver.flowscape_blocked_urls = patterns
+        logging.info("Network profile active: blocking %d URL patterns", len(patterns))
+    except Exception as e:
+        logging.warning("Could not apply network profile: %s", e)
+
+
+def follow_window(driver):
+    """
+    Install the blocklist from apply_profile() on the window a Selenium driver
+    has just switched to. No-op without a profile and for the CDP backend.
+    """
+    patterns = getattr(driver, "flowscape_blocked_urls", None)
+    if not patterns:
+        return
+    try:
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": patterns})
+    except Exception as e:
+        logging.debug("Could not apply network profile to the new window: %s", e)
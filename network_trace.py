@@ -0,0 +1,332 @@
+"""
+Compact network trace recording and offline analysis.
+
+With FLOWSCAPE_TRACE=1 (or book_seat.py --trace) every metrics run streams
+its Chrome network events to traces/trace_<run id>.jsonl.gz: one small JSON
+record per request / response / finish / failure, plus a marker whenever the
+flow enters a new step. Headers, bodies and initiator stacks are dropped. The
+performance log is drained at each stage boundary and the gzip stream is
+flushed, so a run killed by a timeout still leaves a readable trace.
+
+Offline:
+
+    python network_trace.py traces/trace_20261017_070001_ab12cd.jsonl.gz
+    python network_trace.py TRACE --step seat --top 20
+
+rebuilds per step the request waterfall (DNS / connect / TLS / wait / download),
+the critical path (the last request of the step and the chain of requests that
+initiated it), how much of the step the network was busy, and the slowest
+requests of the run.
+"""
+import argparse
+import gzip
+import json
+import logging
+import os
+import statistics
+import time
+import zlib
+
+TRACE_DIR = os.getenv("FLOWSCAPE_TRACE_DIR", "traces")
+TRACE_VERSION = 1
+_PAGE_EVENTS = {"Page.domContentEventFired": "dcl", "Page.loadEventFired": "load"}
+
+
+class TraceRecorder:
+    """
+    Streams compact network records of one run to a gzip JSON-lines file.
+    """
+    def __init__(self, run_id, meta=None, trace_dir=TRACE_DIR):
+        os.makedirs(trace_dir, exist_ok=True)
+        self.path = os.path.join(trace_dir, f"trace_{run_id}.jsonl.gz")
+        self._file = gzip.open(self.path, "wt", encoding="utf-8", compresslevel=6)
+        self._write({"t": "meta", "v": TRACE_VERSION, "run": run_id, "wall": time.time(), "meta": meta or {}})
+        self._file.flush()
+
+    def _write(self, record):
+        self._file.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+    def mark(self, name, parent=None):
+        self._write({"t": "step", "name": name, "parent": parent, "wall": time.time()})
+
+    def write_entries(self, entries):
+        """
+        Convert raw performance-log entries to compact records and flush.
+        """
+        for entry in entries:
+            try:
+                msg = json.loads(entry["message"])["message"]
+            except Exception:
+                continue
+            record = _compact(msg.get("method"), msg.get("params", {}))
+            if record:
+                self._write(record)
+        self._file.flush()
+
+    def close(self, ok=None):
+        try:
+            self._write({"t": "end", "wall": time.time(), "ok": ok})
+            self._file.close()
+            logging.info("Network trace written to %s", self.path)
+        except Exception as e:
+            logging.debug("Failed closing network trace %s: %s", self.path, e)
+
+
+def _compact(method, params):
+    rid = params.get("requestId")
+    if method == "Network.requestWillBeSent":
+        request, initiator = params.get("request", {}), params.get("initiator", {})
+        init_url = initiator.get("url")
+        if not init_url:
+            frames = (initiator.get("stack") or {}).get("callFrames") or []
+            init_url = frames[0].get("url") if frames else None
+        return {"t": "req", "id": rid, "ts": params.get("timestamp"), "wall": params.get("wallTime"),
+                "url": request.get("url", "")[:300], "method": request.get("method"), "type": params.get("type"),
+                "init": init_url or params.get("documentURL"), "init_type": initiator.get("type"),
+                "redirect": bool(params.get("redirectResponse"))}
+    if method == "Network.responseReceived":
+        response = params.get("response", {})
+        timing = response.get("timing") or {}
+        return {"t": "resp", "id": rid, "ts": params.get("timestamp"), "status": response.get("status"),
+                "mime": response.get("mimeType"), "proto": response.get("protocol"),
+                "cache": bool(response.get("fromDiskCache") or response.get("fromServiceWorker")),
+                "timing": {k: timing[k] for k in ("requestTime", "dnsStart", "dnsEnd", "connectStart", "connectEnd",
+                                                   "sslStart", "sslEnd", "sendStart", "receiveHeadersEnd")
+                           if k in timing}}
+    if method == "Network.loadingFinished":
+        return {"t": "done", "id": rid, "ts": params.get("timestamp"), "bytes": params.get("encodedDataLength", 0)}
+    if method == "Network.loadingFailed":
+        return {"t": "fail", "id": rid, "ts": params.get("timestamp"),
+                "error": params.get("blockedReason") or params.get("errorText"),
+                "canceled": params.get("canceled", False)}
+    if method == "Network.requestServedFromCache":
+        return {"t": "cache", "id": rid}
+    if method in _PAGE_EVENTS:
+        return {"t": "page", "ev": _PAGE_EVENTS[method], "ts": params.get("timestamp")}
+    return None
+
+
+def read_trace(path):
+    """
+    Return the records of a trace; a truncated stream (killed run) yields
+    what was flushed before the cut.
+    """
+    records = []
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    break
+    except (EOFError, zlib.error, gzip.BadGzipFile) as e:
+        logging.warning("Trace %s is truncated (%s); analysing %d records", path, e, len(records))
+    return records
+
+
+def _requests(records):
+    requests = {}
+    for r in records:
+        rid = r.get("id")
+        if r["t"] == "req":
+            req = requests.get(rid)
+            if req is None:
+                requests[rid] = {"id": rid, "url": r["url"], "method": r["method"], "type": r["type"],
+                                 "start": r["ts"], "wall": r["wall"], "init": r["init"],
+                                 "init_type": r["init_type"], "redirects": 0, "bytes": 0}
+            else:
+                # a redirect reuses the request id: keep the first start, follow the new URL
+                req["redirects"] += 1
+                req["url"] = r["url"]
+        elif rid in requests:
+            req = requests[rid]
+            if r["t"] == "resp":
+                req.update(status=r["status"], mime=r["mime"], proto=r["proto"], timing=r["timing"],
+                           cache=r["cache"], headers_at=r["ts"])
+            elif r["t"] == "done":
+                req.update(end=r["ts"], bytes=r["bytes"])
+            elif r["t"] == "fail":
+                req.update(end=r["ts"], failed=r["error"] or ("canceled" if r["canceled"] else "failed"))
+            elif r["t"] == "cache":
+                req["cache"] = True
+    return [req for req in requests.values() if req["start"] is not None]
+
+
+def _phases(req):
+    """
+    DNS / connect / TLS / wait / download split in ms from the response timing.
+    """
+    timing = req.get("timing") or {}
+    phases = {}
+
+    def span(a, b):
+        if timing.get(a, -1) >= 0 and timing.get(b, -1) >= 0:
+            return max(0.0, timing[b] - timing[a])
+        return 0.0
+    phases["dns"] = span("dnsStart", "dnsEnd")
+    phases["tls"] = span("sslStart", "sslEnd")
+    phases["connect"] = max(0.0, span("connectStart", "connectEnd") - phases["tls"])
+    phases["wait"] = span("sendStart", "receiveHeadersEnd")
+    if "requestTime" in timing and "receiveHeadersEnd" in timing and req.get("end") is not None:
+        phases["download"] = max(0.0, (req["end"] - timing["requestTime"]) * 1000 - timing["receiveHeadersEnd"])
+    if "requestTime" in timing:
+        phases["queued"] = max(0.0, (timing["requestTime"] - req["start"]) * 1000)
+    return {k: round(v, 1) for k, v in phases.items() if v}
+
+
+def _steps(records, clock_offset):
+    """
+    [(name, start, end)] in the trace's monotonic clock.
+    """
+    marks = [r for r in records if r["t"] == "step"]
+    end_wall = next((r["wall"] for r in reversed(records) if r["t"] == "end"), None)
+    if end_wall is None:
+        end_wall = max((r.get("wall") or 0 for r in records), default=0)
+    steps = []
+    for i, mark in enumerate(marks):
+        stop = marks[i + 1]["wall"] if i + 1 < len(marks) else end_wall
+        label = f"{mark['parent']}.{mark['name']}" if mark.get("parent") else mark["name"]
+        steps.append((label, mark["wall"] - clock_offset, max(stop, mark["wall"]) - clock_offset))
+    return steps
+
+
+def _busy_ms(reqs, start, end):
+    """
+    Time within [start, end] during which at least one request was in flight.
+    """
+    intervals = sorted((max(r["start"], start), min(r["end"], end)) for r in reqs if r.get("end") is not None)
+    busy, cursor = 0.0, start
+    for a, b in intervals:
+        a = max(a, cursor)
+        if b > a:
+            busy += b - a
+            cursor = b
+    return busy * 1000
+
+
+def _critical_path(reqs):
+    """
+    The request that finished last, then walk back through initiators: each
+    parent is the latest request for the initiator URL that started earlier.
+    """
+    finished = [r for r in reqs if r.get("end") is not None]
+    if not finished:
+        return []
+    by_url = {}
+    for r in finished:
+        by_url.setdefault(r["url"], []).append(r)
+    path = [max(finished, key=lambda r: r["end"])]
+    while len(path) < 20:
+        child = path[-1]
+        parents = [r for r in by_url.get(child["init"], []) if r["start"] < child["start"] and r not in path]
+        if not parents:
+            break
+        path.append(max(parents, key=lambda r: r["start"]))
+    return list(reversed(path))
+
+
+def analyze(path, top=10):
+    """
+    Rebuild steps, per-step waterfalls and critical paths from a trace.
+    Returns a dict (see format_report()).
+    """
+    records = read_trace(path)
+    meta = next((r for r in records if r["t"] == "meta"), {})
+    reqs = _requests(records)
+    offsets = [r["wall"] - r["start"] for r in reqs if r.get("wall")]
+    # wall = monotonic + offset; step markers are wall clock, CDP timestamps are monotonic
+    clock_offset = statistics.median(offsets) if offsets else 0.0
+    steps = _steps(records, clock_offset) or [("run", min((r["start"] for r in reqs), default=0),
+                                                max((r.get("end") or r["start"] for r in reqs), default=0))]
+    for r in reqs:
+        r["duration_ms"] = round((r["end"] - r["start"]) * 1000, 1) if r.get("end") is not None else None
+        r["phases"] = _phases(r)
+        # requests sent before the first marker count towards the first step
+        r["step_index"] = max((i for i, (_, start, _) in enumerate(steps) if start <= r["start"]), default=0)
+        r["step"] = steps[r["step_index"]][0]
+    step_reports = []
+    for i, (name, start, end) in enumerate(steps):
+        in_step = sorted((r for r in reqs if r["step_index"] == i), key=lambda r: r["start"])
+        duration_ms = (end - start) * 1000
+        critical = _critical_path(in_step)
+        step_reports.append({
+            "name": name,
+            "start": start,
+            "duration_ms": round(duration_ms, 1),
+            "requests": in_step,
+            "bytes": sum(r["bytes"] for r in in_step),
+            "busy_ms": round(_busy_ms(in_step, start, end), 1),
+            "critical_path": critical,
+            "critical_ms": round((critical[-1]["end"] - critical[0]["start"]) * 1000, 1) if critical else 0.0,
+        })
+    slowest = sorted((r for r in reqs if r["duration_ms"] is not None), key=lambda r: r["duration_ms"],
+                     reverse=True)[:top]
+    return {"run": meta.get("run"), "meta": meta.get("meta", {}), "requests": len(reqs),
+            "bytes": sum(r["bytes"] for r in reqs), "failed": sum(1 for r in reqs if r.get("failed")),
+            "steps": step_reports, "slowest": slowest}
+
+
+def _short(url, width=70):
+    url = url.split("?", 1)[0]
+    return url if len(url) <= width else "..." + url[-(width - 3):]
+
+
+def _bar(req, start, duration_ms, width):
+    scale = width / max(duration_ms, 1.0)
+    offset = int((req["start"] - start) * 1000 * scale)
+    length = max(1, int((req["duration_ms"] or 0) * scale))
+    offset = min(offset, width - 1)
+    return " " * offset + ("x" if req.get("failed") else "=") * min(length, width - offset)
+
+
+def format_report(analysis, step=None, width=40):
+    lines = [f"run {analysis['run']}: {analysis['requests']} requests, {analysis['bytes'] // 1024} KB, "
+             f"{analysis['failed']} failed"]
+    lines.append("")
+    lines.append(f"{'step':28} {'ms':>8} {'reqs':>5} {'KB':>7} {'net busy':>9} {'critical ms':>12}")
+    for s in analysis["steps"]:
+        busy = f"{100 * s['busy_ms'] / s['duration_ms']:.0f}%" if s["duration_ms"] else "-"
+        lines.append(f"{s['name'][:28]:28} {s['duration_ms']:8.0f} {len(s['requests']):5d} {s['bytes'] // 1024:7d} "
+                     f"{busy:>9} {s['critical_ms']:12.0f}")
+    for s in analysis["steps"]:
+        if not s["requests"] or (step and step not in s["name"].split(".")):
+            continue
+        lines.append("")
+        lines.append(f"== {s['name']} ({s['duration_ms']:.0f} ms, network busy {s['busy_ms']:.0f} ms)")
+        for r in s["requests"]:
+            at = (r["start"] - s["start"]) * 1000
+            took = f"{r['duration_ms']:7.0f}" if r["duration_ms"] is not None else "      -"
+            status = r.get("failed") or r.get("status") or ""
+            lines.append(f"  {at:7.0f} {took} |{_bar(r, s['start'], s['duration_ms'], width):{width}}| "
+                         f"{str(status)[:10]:>10} {'C' if r.get('cache') else ' '} {_short(r['url'])}")
+        if s["critical_path"]:
+            lines.append("  critical path:")
+            for r in s["critical_path"]:
+                lines.append(f"    {(r['start'] - s['start']) * 1000:7.0f} ms +{r['duration_ms']:.0f} ms "
+                             f"{_short(r['url'])}")
+    lines.append("")
+    lines.append("slowest requests:")
+    for r in analysis["slowest"]:
+        phases = ", ".join(f"{k} {v:.0f}" for k, v in sorted(r["phases"].items(), key=lambda kv: -kv[1]))
+        lines.append(f"  {r['duration_ms']:7.0f} ms  {r['step'][:20]:20} {_short(r['url'], 60)}"
+                     + (f"  [{phases}]" if phases else "") + (f"  FAILED {r['failed']}" if r.get("failed") else ""))
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyse a Flowscape network trace offline")
+    parser.add_argument("trace", help="traces/trace_<run id>.jsonl.gz")
+    parser.add_argument("--step", type=str, default=None, help="Only print the waterfall of this step")
+    parser.add_argument("--top", type=int, default=10, help="Number of slowest requests to list")
+    parser.add_argument("--width", type=int, default=40, help="Width of the waterfall bars")
+    parser.add_argument("--json", action="store_true", help="Print the analysis as JSON")
+    args = parser.parse_args()
+    analysis = analyze(args.trace, top=args.top)
+    if args.json:
+        print(json.dumps(analysis, indent=1, default=str))
+    else:
+        print(format_report(analysis, step=args.step, width=args.width))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Configuration check behind --dry-run.
+
+Resolves what a real run would use (FLOWSCAPE_* environment, HEADLESS, CLI
+flags, seat list, time range, dates and schedule) and checks the things that
+otherwise only fail once the booking window is open: unparsable times, a
+missing chromedriver / Chrome binary, missing credentials, an expired session
+cache, an unreadable network profile or batch file. Nothing is launched and
+no network request is made; Selenium is looked up, not imported.
+"""
+import importlib.util
+import json
+import os
+import shutil
+import time
+from datetime import date, datetime
+from urllib.parse import urlparse
+
+OK, WARN, ERROR = "ok", "warn", "error"
+
+
+def _time_of_day(value):
+    return datetime.strptime(value, "%H:%M").time()
+
+
+def _check_schedule(add, args):
+    from clock_sync import parse_fire_time
+
+    for flag, value in (("--at", args.at), ("--watch-until", args.watch_until if args.watch else None)):
+        if not value:
+            continue
+        try:
+            now = datetime.now()
+            fire_at = parse_fire_time(value, now)
+            if fire_at <= now.timestamp():
+                add(WARN, flag, f"{value} has already passed; a run now would use the current time")
+            else:
+                add(OK, flag, f"{datetime.fromtimestamp(fire_at):%Y-%m-%d %H:%M:%S} "
+                              f"(in {(fire_at - time.time()) / 60:.1f} min)")
+        except ValueError as e:
+            add(ERROR, flag, str(e))
+
+
+def _check_dates(add, args):
+    if args.date:
+        try:
+            day = datetime.strptime(args.date, "%Y-%m-%d").date()
+            add(WARN if day < date.today() else OK, "date", args.date + (" is in the past" if day < date.today() else ""))
+        except ValueError:
+            add(ERROR, "date", f"{args.date!r} is not YYYY-MM-DD")
+    else:
+        add(OK, "date", "the date shown in the app")
+    if args.dates or args.weeks:
+        from multi_date import expand_dates
+
+        try:
+            dates = expand_dates(args.dates, args.weeks, args.weekdays)
+            add(OK if dates else WARN, "dates", ", ".join(dates) or "no dates match --weekdays")
+        except ValueError as e:
+            add(ERROR, "dates", str(e))
+
+
+def _check_driver(add, args):
+    from cdp_driver import find_chrome
+
+    add(OK, "driver backend", args.driver_backend)
+    chrome = find_chrome()
+    if args.driver_backend == "cdp":
+        add(OK if chrome else ERROR, "chrome", chrome or "not found; install Chrome or set FLOWSCAPE_CHROME_BINARY")
+        return
+    if importlib.util.find_spec("selenium") is None:
+        add(ERROR, "selenium", "not installed (pip install selenium) or use --driver-backend cdp")
+    chromedriver = shutil.which("chromedriver")
+    add(OK if chromedriver else WARN, "chromedriver",
+        chromedriver or "not on PATH; Selenium Manager will try to download one at launch")
+    add(OK if chrome else WARN, "chrome", chrome or "not found on PATH")
+
+
+def _check_login(add, args, session_file):
+    user, password = os.getenv("FLOWSCAPE_USER"), os.getenv("FLOWSCAPE_PASS")
+    session_valid = False
+    if session_file:
+        # read directly: session_cache.load_session deletes expired files
+        try:
+            with open(session_file, encoding="utf-8") as f:
+                expires_at = json.load(f).get("expires_at", 0)
+            session_valid = expires_at > time.time()
+            add(OK if session_valid else WARN, "session cache",
+                f"{session_file} valid for {(expires_at - time.time()) / 3600:.1f} h" if session_valid
+                else f"{session_file} has expired")
+        except FileNotFoundError:
+            add(WARN, "session cache", f"{session_file} does not exist yet")
+        except Exception as e:
+            add(WARN, "session cache", f"{session_file} is unreadable: {e}")
+    else:
+        add(OK, "session cache", "disabled")
+    if user and password:
+        add(OK, "credentials", f"FLOWSCAPE_USER={user}")
+    elif args.batch or args.submit:
+        add(OK, "credentials", "taken from the jobs / the daemon")
+    else:
+        add(WARN if session_valid else ERROR, "credentials",
+            "FLOWSCAPE_USER / FLOWSCAPE_PASS not set" + ("; relying on the session cache" if session_valid else ""))
+
+
+def _check_batch(add, args):
+    from batch_booking import _credentials, load_jobs
+
+    try:
+        jobs = load_jobs(args.batch)
+    except Exception as e:
+        add(ERROR, "batch", f"{args.batch}: {e}")
+        return
+    missing = sorted({job.get("user") or "(default)" for job in jobs if not all(_credentials(job.get("user")))})
+    add(OK, "batch", f"{len(jobs)} jobs, concurrency {args.concurrency}, timeout {args.job_timeout}s")
+    if missing:
+        add(ERROR, "batch credentials", f"no FLOWSCAPE_USER_/FLOWSCAPE_PASS_ for {', '.join(missing)}")
+
+
+def check(args, headless, debug, session_file):
+    """
+    Return [(level, name, detail)] describing the resolved configuration;
+    level is OK, WARN or ERROR.
+    """
+    from book_seat import LOG_FILENAME, TARGET_URL
+    from network_profile import load_profile
+
+    results = []
+
+    def add(level, name, detail):
+        results.append((level, name, detail))
+
+    url = urlparse(TARGET_URL)
+    add(OK if url.scheme in ("http", "https") and url.netloc else ERROR, "url", TARGET_URL)
+    seats = [s.strip() for s in (args.seat or "").split(",") if s.strip()]
+    add(OK if seats or args.zone else ERROR, "seats",
+        (", ".join(seats) or "none") + (f" + zone {args.zone}" if args.zone else ""))
+    try:
+        start, end = _time_of_day(args.start), _time_of_day(args.end)
+        add(OK if start < end else ERROR, "time range",
+            f"{args.start}-{args.end}" + ("" if start < end else " ends before it starts"))
+    except ValueError:
+        add(ERROR, "time range", f"{args.start}-{args.end} is not HH:MM-HH:MM")
+    _check_dates(add, args)
+    _check_schedule(add, args)
+
+    mode = ("submit to daemon" if args.submit else "batch" if args.batch else "daemon" if args.daemon
+            else "watch" if args.watch else "multi-date" if args.dates or args.weeks
+            else "scheduled" if args.at else "single booking")
+    add(OK, "mode", f"{mode} (backend {args.backend})")
+    if args.backend == "http" and not (args.batch or args.submit):
+        from book_seat import http_backend_conflicts
+
+        unsupported = http_backend_conflicts(args)
+        if unsupported:
+            add(ERROR, "backend", f"http cannot be combined with {', '.join(unsupported)}")
+    add(OK, "browser", f"headless={headless} lean={args.lean} debug={debug}")
+    try:
+        load_profile(args.network_profile)
+        add(OK, "network profile", args.network_profile or "off")
+    except Exception as e:
+        add(ERROR, "network profile", f"{args.network_profile}: {e}")
+    if not args.submit:
+        _check_driver(add, args)
+    _check_login(add, args, session_file)
+    if args.batch:
+        _check_batch(add, args)
+    log_dir = os.path.dirname(os.path.abspath(LOG_FILENAME))
+    add(OK if os.access(log_dir, os.W_OK) else ERROR, "log file", LOG_FILENAME)
+    return results
+
+
+def report(results):
+    """
+    Format check() results; returns (text, number of errors).
+    """
+    width = max(len(name) for _, name, _ in results)
+    lines = [f"[{level.upper():5}] {name:<{width}}  {detail}" for level, name, detail in results]
+    errors = sum(1 for level, _, _ in results if level == ERROR)
+    warnings = sum(1 for level, _, _ in results if level == WARN)
+    lines.append(f"{errors} error(s), {warnings} warning(s)")
+    return "\n".join(lines), errors
@@ -0,0 +1,371 @@
+"""
+Per-step latency instrumentation and machine-readable run metrics.
+
+A run is opened with start_run() and closed with finish_run(). In between,
+@timed functions and `with span(...)` blocks record nested spans, and step()
+splits the innermost span into sequential sub-steps (each step ends where the
+next begins). sample_memory() polls the browser's resident memory in the
+background for the rest of the run. drain_network_log() pulls the Chrome
+performance log (goog:loggingPrefs) into the run, and into the network trace
+when FLOWSCAPE_TRACE=1 (see network_trace). finish_run() adds Chrome
+navigation timing and a network summary from that log, writes
+metrics/run_<id>.json and appends a one-line summary to metrics/history.jsonl.
+report() aggregates the history into p50/p95 per step, peak memory and a
+time-to-booked histogram.
+"""
+import collections
+import contextlib
+import functools
+import json
+import logging
+import math
+import os
+import threading
+import time
+import uuid
+
+METRICS_DIR = os.getenv("FLOWSCAPE_METRICS_DIR", "metrics")
+METRICS_ENABLED = os.getenv("FLOWSCAPE_METRICS", "1") == "1"
+HISTORY_FILENAME = "history.jsonl"
+MEMORY_SAMPLE_INTERVAL = float(os.getenv("FLOWSCAPE_MEMORY_SAMPLE_INTERVAL", "1.0"))
+# performance-log entries kept per run for the network summary (an all-day watch keeps the latest)
+NETWORK_LOG_MAX = int(os.getenv("FLOWSCAPE_NETWORK_LOG_MAX", "20000"))
+# spans that are deliberate waiting, not booking work
+IDLE_SPANS = ("calibrate", "wait_fire", "watching")
+
+_local = threading.local()
+
+_NAVIGATION_JS = """
+var nav = performance.getEntriesByType('navigation')[0];
+if (!nav) { return null; }
+return {
+  dns_ms: nav.domainLookupEnd - nav.domainLookupStart,
+  connect_ms: nav.connectEnd - nav.connectStart,
+  ttfb_ms: nav.responseStart - nav.requestStart,
+  dom_content_loaded_ms: nav.domContentLoadedEventEnd,
+  load_ms: nav.loadEventEnd,
+  transfer_bytes: nav.transferSize,
+  resources: performance.getEntriesByType('resource').length
+};
+"""
+
+
+class _Run:
+    def __init__(self, run_id, meta):
+        self.id = run_id
+        self.meta = meta
+        self.wall_start = time.time()
+        self.t0 = time.perf_counter()
+        self.spans = []
+        self.stack = []
+        self.events = []
+        self.memory = []
+        self.sampler_stop = None
+        self.network_log = collections.deque(maxlen=NETWORK_LOG_MAX)
+        self.tracer = None
+
+    def now_ms(self):
+        return (time.perf_counter() - self.t0) * 1000
+
+    def open(self, name, is_step=False):
+        parent = self.stack[-1]["name"] if self.stack else None
+        entry = {"name": name, "parent": parent, "start_ms": round(self.now_ms(), 1), "step": is_step}
+        self.stack.append(entry)
+        return entry
+
+    def close(self, entry, ok=True):
+        # closing a span also closes any steps still open inside it
+        while self.stack:
+            top = self.stack.pop()
+            top["duration_ms"] = round(self.now_ms() - top["start_ms"], 1)
+            top["ok"] = ok if top is entry else True
+            self.spans.append(top)
+            if top is entry:
+                return
+
+
+def current_run():
+    return getattr(_local, "run", None)
+
+
+def start_run(run_id=None, **meta):
+    """
+    Begin collecting metrics for one booking run on this thread.
+    """
+    if not METRICS_ENABLED:
+        return None
+    run = _Run(run_id or time.strftime("%Y%m%d_%H%M%S_") + uuid.uuid4().hex[:6], meta)
+    _local.run = run
+    if os.getenv("FLOWSCAPE_TRACE", "0") == "1":
+        from network_trace import TraceRecorder
+        try:
+            run.tracer = TraceRecorder(run.id, meta)
+        except Exception as e:
+            logging.warning("Network trace disabled: %s", e)
+    return run
+
+
+@contextlib.contextmanager
+def span(name):
+    run = current_run()
+    if run is None:
+        yield
+        return
+    entry = run.open(name)
+    try:
+        yield
+    except BaseException:
+        run.close(entry, ok=False)
+        raise
+    run.close(entry)
+
+
+def timed(name):
+    """
+    Decorator form of span().
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def step(name):
+    """
+    End the current step (if any) of the innermost span and start a new one.
+    """
+    run = current_run()
+    if run is None:
+        return
+    if run.stack and run.stack[-1]["step"]:
+        run.close(run.stack[-1])
+    entry = run.open(name, is_step=True)
+    if run.tracer is not None:
+        run.tracer.mark(name, entry["parent"])
+
+
+def event(name, **fields):
+    run = current_run()
+    if run is not None:
+        run.events.append(dict(fields, name=name, at_ms=round(run.now_ms(), 1)))
+
+
+def sample_memory(read_bytes, interval=MEMORY_SAMPLE_INTERVAL):
+    """
+    Sample read_bytes() (e.g. the Chrome process tree RSS) every interval
+    seconds on a background thread until the current run finishes.
+    """
+    run = current_run()
+    if run is None or run.sampler_stop is not None:
+        return
+
+    def loop():
+        while True:
+            try:
+                value = read_bytes()
+            except Exception:
+                value = None
+            if value:
+                run.memory.append(value)
+            if stop.wait(interval):
+                return
+
+    stop = run.sampler_stop = threading.Event()
+    threading.Thread(target=loop, name="rss-sampler", daemon=True).start()
+
+
+def _memory_summary(samples):
+    if not samples:
+        return None
+    mb = 1024 * 1024
+    return {
+        "samples": len(samples),
+        "peak_mb": round(max(samples) / mb, 1),
+        "mean_mb": round(sum(samples) / len(samples) / mb, 1),
+        "last_mb": round(samples[-1] / mb, 1),
+    }
+
+
+def drain_network_log(driver, force=False):
+    """
+    Move the Chrome performance log into the current run and stream it to
+    the network trace. Without force this only runs when tracing, so the
+    extra round-trip is not paid otherwise; long waits (watch mode) force it
+    now and then so the browser-side log does not grow for hours.
+    """
+    run = current_run()
+    if run is not None and (run.tracer is not None or force):
+        _drain(run, driver)
+
+
+def _drain(run, driver):
+    try:
+        entries = driver.get_log("performance")
+    except Exception:
+        return
+    run.network_log.extend(entries)
+    if run.tracer is not None:
+        try:
+            run.tracer.write_entries(entries)
+        except Exception as e:
+            logging.debug("Failed writing network trace: %s", e)
+
+
+def _network_summary(entries):
+    """
+    Summarise the Chrome performance log: request count, bytes, the slowest
+    requests and what the network profile saved (blocked requests, requests and
+    bytes served from the disk cache).
+    """
+    requests = {}
+    for entry in entries:
+        try:
+            msg = json.loads(entry["message"])["message"]
+        except Exception:
+            continue
+        params = msg.get("params", {})
+        rid = params.get("requestId")
+        if msg.get("method") == "Network.requestWillBeSent":
+            requests[rid] = {"url": params["request"]["url"][:200], "start": params["timestamp"], "bytes": 0}
+        elif rid in requests and msg.get("method") == "Network.responseReceived":
+            response = params.get("response", {})
+            if response.get("fromDiskCache"):
+                headers = {k.lower(): v for k, v in (response.get("headers") or {}).items()}
+                requests[rid]["cached_bytes"] = int(headers.get("content-length") or 0)
+        elif rid in requests and msg.get("method") == "Network.loadingFinished":
+            req = requests[rid]
+            req["bytes"] = params.get("encodedDataLength", 0)
+            req["duration_ms"] = round((params["timestamp"] - req["start"]) * 1000, 1)
+        elif rid in requests and msg.get("method") == "Network.loadingFailed":
+            requests[rid]["failed"] = params.get("blockedReason") or params.get("errorText")
+    finished = [r for r in requests.values() if "duration_ms" in r]
+    cached = [r for r in requests.values() if "cached_bytes" in r]
+    summary = {
+        "requests": len(requests),
+        "failed": sum(1 for r in requests.values() if r.get("failed")),
+        "bytes": sum(r["bytes"] for r in requests.values()),
+        "blocked": sum(1 for r in requests.values() if r.get("failed") == "inspector"),
+        "from_cache": len(cached),
+        "cache_bytes": sum(r["cached_bytes"] for r in cached),
+        "slowest": sorted(finished, key=lambda r: r["duration_ms"], reverse=True)[:10],
+    }
+    if summary["blocked"] or summary["from_cache"]:
+        logging.info("Network profile saved %d requests: %d blocked, %d from disk cache (%d KB)",
+                     summary["blocked"] + summary["from_cache"], summary["blocked"], summary["from_cache"],
+                     summary["cache_bytes"] // 1024)
+    return summary
+
+
+def finish_run(success, driver=None, metrics_dir=METRICS_DIR):
+    """
+    Close the current run, write its JSON file and append to the history.
+    Returns the run summary dict (None when metrics are disabled).
+    """
+    run = current_run()
+    if run is None:
+        return None
+    _local.run = None
+    if run.sampler_stop is not None:
+        run.sampler_stop.set()
+    while run.stack:
+        run.close(run.stack[0], ok=bool(success))
+    total_ms = round(run.now_ms(), 1)
+    idle_ms = sum(s["duration_ms"] for s in run.spans if s["name"] in IDLE_SPANS)
+    memory = _memory_summary(list(run.memory))
+    summary = {
+        "id": run.id,
+        "started": run.wall_start,
+        "success": bool(success),
+        "total_ms": total_ms,
+        "time_to_booked_ms": round(total_ms - idle_ms, 1) if success else None,
+        "spans": _span_totals(run.spans),
+        "peak_rss_mb": memory["peak_mb"] if memory else None,
+    }
+    data = dict(summary, meta=run.meta, memory=memory, timeline=sorted(run.spans, key=lambda s: s["start_ms"]), events=run.events)
+    if driver is not None:
+        try:
+            data["navigation"] = driver.execute_script(_NAVIGATION_JS)
+        except Exception as e:
+            logging.debug("Navigation timing unavailable: %s", e)
+        _drain(run, driver)
+        data["network"] = _network_summary(run.network_log)
+    if run.tracer is not None:
+        run.tracer.close(bool(success))
+    try:
+        os.makedirs(metrics_dir, exist_ok=True)
+        with open(os.path.join(metrics_dir, f"run_{run.id}.json"), "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=1)
+        with open(os.path.join(metrics_dir, HISTORY_FILENAME), "a", encoding="utf-8") as f:
+            f.write(json.dumps(summary) + "\n")
+        logging.info("Run metrics: total %.0f ms, %s", total_ms,
+                     ", ".join(f"{k} {v:.0f} ms" for k, v in summary["spans"].items() if "." not in k))
+        if memory:
+            logging.info("Browser memory: peak %.0f MB, mean %.0f MB over %d samples",
+                         memory["peak_mb"], memory["mean_mb"], memory["samples"])
+    except Exception as e:
+        logging.debug("Failed writing run metrics: %s", e)
+    return summary
+
+
+def _span_totals(spans):
+    """
+    Total duration per span path ("book", "book.seat", ...).
+    """
+    totals = {}
+    for s in spans:
+        key = f"{s['parent']}.{s['name']}" if s["parent"] else s["name"]
+        totals[key] = round(totals.get(key, 0) + s["duration_ms"], 1)
+    return totals
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    index = max(0, math.ceil(pct / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+def report(metrics_dir=METRICS_DIR, last=None):
+    """
+    Aggregate history.jsonl: p50/p95/max per step, peak browser memory and a
+    histogram of time-to-booked. Returns the report as text.
+    """
+    path = os.path.join(metrics_dir, HISTORY_FILENAME)
+    try:
+        with open(path, encoding="utf-8") as f:
+            runs = [json.loads(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        return f"No run history in {path}"
+    if last:
+        runs = runs[-last:]
+    lines = [f"{len(runs)} runs, {sum(1 for r in runs if r['success'])} successful"]
+    per_span = {}
+    for r in runs:
+        for name, ms in r["spans"].items():
+            per_span.setdefault(name, []).append(ms)
+    lines.append(f"{'step':40} {'n':>5} {'p50 ms':>10} {'p95 ms':>10} {'max ms':>10}")
+    for name in sorted(per_span):
+        values = per_span[name]
+        lines.append(f"{name:40} {len(values):5d} {_percentile(values, 50):10.0f} {_percentile(values, 95):10.0f} "
+                     f"{max(values):10.0f}")
+
+    peaks = [r["peak_rss_mb"] for r in runs if r.get("peak_rss_mb")]
+    if peaks:
+        lines.append("")
+        lines.append(f"peak browser RSS: p50 {_percentile(peaks, 50):.0f} MB  p95 {_percentile(peaks, 95):.0f} MB  "
+                     f"max {max(peaks):.0f} MB")
+    booked = [r["time_to_booked_ms"] / 1000 for r in runs if r.get("time_to_booked_ms")]
+    if booked:
+        lines.append("")
+        lines.append(f"time-to-booked: p50 {_percentile(booked, 50):.2f}s  p95 {_percentile(booked, 95):.2f}s")
+        edges = [1, 2, 5, 10, 20, 30, 60, 120]
+        counts = [0] * (len(edges) + 1)
+        for v in booked:
+            counts[next((i for i, e in enumerate(edges) if v < e), len(edges))] += 1
+        labels = [f"<{e}s" for e in edges] + [f">={edges[-1]}s"]
+        width = max(counts)
+        for label, count in zip(labels, counts):
+            lines.append(f"{label:>7} {count:5d} {'#' * round(40 * count / width)}")
+    return "\n".join(lines)
@@ -0,0 +1,98 @@
+"""
+Watch the floor plan for a seat to be released and book it straight away.
+
+One authenticated page stays open. Between checks the wait is a
+dom_waits.race() on seat_free_condition(), i.e. a MutationObserver inside the
+page: no polling while nothing changes, and the booking starts as soon as the
+plan explicitly marks one of the watched seats (a ranked list and/or a zone
+prefix) as free; seats in an unknown state are neither a trigger nor booked. Every observer slice ends with one cheap seat_states() read;
+slices double in length (WATCH_MIN_INTERVAL..WATCH_MAX_INTERVAL) while the
+plan stays the same and drop back to the minimum when it changes. The page is
+only reloaded every WATCH_REFRESH seconds, in case the app does not push
+updates, and when the session is lost.
+"""
+import logging
+import os
+import time
+
+from book_seat import DEFAULT_END, DEFAULT_START, SELECTOR_CACHE, _Flow, _run_stages
+from dom_resolver import seat_free_condition, seat_states
+from dom_waits import race
+from run_metrics import drain_network_log, event, step, timed
+from session_cache import SESSION_FILENAME
+
+WATCH_MIN_INTERVAL = float(os.getenv("FLOWSCAPE_WATCH_MIN_INTERVAL", "5"))
+WATCH_MAX_INTERVAL = float(os.getenv("FLOWSCAPE_WATCH_MAX_INTERVAL", "120"))
+WATCH_REFRESH = float(os.getenv("FLOWSCAPE_WATCH_REFRESH", "900"))
+# the seat scan runs at most once per WATCH_THROTTLE seconds of plan mutations, and only
+# for the attributes seat state and labels are read from
+WATCH_THROTTLE = float(os.getenv("FLOWSCAPE_WATCH_THROTTLE", "0.25"))
+SEAT_ATTRIBUTES = ["class", "aria-label", "title", "aria-disabled", "disabled", "data-status", "data-state"]
+
+
+def _reload(flow):
+    step("refresh")
+    ok = _run_stages(flow, "open", "auth")
+    step("watching")
+    return ok
+
+
+@timed("watch")
+def watch_and_book(driver, seat_identifier, zone=None, until=None, email=None, password=None,
+                   session_file=SESSION_FILENAME, start_time=DEFAULT_START, end_time=DEFAULT_END, booking_date=None):
+    """
+    Hold the floor plan open until a watched seat frees up, then book it with
+    the seat..confirm stages. Keeps watching if someone else gets there first.
+    until is an epoch deadline (None: watch until booked). Returns True once
+    a seat is booked.
+    """
+    flow = _Flow(driver, seat_identifier, email=email, password=password, session_file=session_file,
+                 start_time=start_time, end_time=end_time, booking_date=booking_date, zone=zone)
+    flow.require_free = True
+    if not _reload(flow):
+        return False
+    condition = [{"name": "released", "js": seat_free_condition(flow.candidates, zone)}]
+    interval, last_states, refreshed = WATCH_MIN_INTERVAL, None, time.monotonic()
+    logging.info("Watching %s%s for a release", ", ".join(flow.candidates), f" + zone {zone}" if zone else "")
+    try:
+        while until is None or time.time() < until:
+            slice_s = interval if until is None else max(0.0, min(interval, until - time.time()))
+            name, _ = race(driver, condition, slice_s, throttle=WATCH_THROTTLE, attribute_filter=SEAT_ATTRIBUTES)
+            # keeps the performance log bounded over an all-day watch
+            drain_network_log(driver, force=True)
+            if name == "released":
+                logging.info("A watched seat is free; booking")
+                event("seat_released")
+                if _run_stages(flow, "seat", "confirm"):
+                    return True
+                # back off so a seat the plan wrongly shows as free is not hammered
+                interval = min(interval * 2, WATCH_MAX_INTERVAL)
+                logging.info("Booking the released seat failed; watching again in %.0fs", interval)
+                step("watching")
+                time.sleep(interval)
+                # seats tried now may be released again later
+                flow.tried.clear()
+                if not _reload(flow):
+                    return False
+                last_states, refreshed = None, time.monotonic()
+                continue
+
+            states = [(s["label"], s["state"]) for s in seat_states(driver, flow.candidates, zone)]
+            if not states or time.monotonic() - refreshed > WATCH_REFRESH:
+                if not states:
+                    logging.info("Watched seats are no longer on the page; reloading")
+                if not _reload(flow):
+                    return False
+                interval, last_states, refreshed = WATCH_MIN_INTERVAL, None, time.monotonic()
+                continue
+            if states == last_states:
+                interval = min(interval * 2, WATCH_MAX_INTERVAL)
+            else:
+                interval = WATCH_MIN_INTERVAL
+                logging.debug("Plan changed: %s", ", ".join(f"{label}={state}" for label, state in states),
+                              extra={"sample": True})
+            last_states = states
+        logging.info("Watch ended without a free seat")
+        return False
+    finally:
+        SELECTOR_CACHE.save()
@@ -0,0 +1,139 @@
+"""
+Adaptive selector-strategy cache.
+
+For each page fingerprint and lookup slot (seat, modal, start/end input, ...)
+the cache records which named locator strategy succeeded and how long it
+took. The next run tries the last winner first, so the common path costs one
+lookup instead of a cascade of failed ones. A strategy that misses is demoted
+behind untried ones; after EVICT_AFTER consecutive misses its hit history is
+dropped, but the misses are kept so it stays behind strategies that missed
+less. Strategies that decide which element is picked (an exact label before a
+fuzzy one) are pinned by the caller and never reordered.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+SELECTOR_CACHE_FILENAME = os.getenv("FLOWSCAPE_SELECTOR_CACHE", "selector_cache.json")
+EVICT_AFTER = 3
+
+_FINGERPRINT_JS = (
+    "return [location.host, location.pathname.split('/').slice(0, 3).join('/'), document.title].join('|');"
+)
+
+
+def page_fingerprint(driver):
+    """
+    Short stable key for the current page: host, leading path segments and title.
+    """
+    try:
+        raw = driver.execute_script(_FINGERPRINT_JS) or ""
+    except Exception:
+        raw = ""
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12]
+
+
+class SelectorCache:
+    def __init__(self, path=SELECTOR_CACHE_FILENAME):
+        self.path = path
+        self._entries = None
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    def _stats(self, fingerprint, slot):
+        if self._entries is None:
+            try:
+                with open(self.path, encoding="utf-8") as f:
+                    self._entries = json.load(f)
+            except FileNotFoundError:
+                self._entries = {}
+            except Exception as e:
+                logging.debug("Ignoring unreadable selector cache %s: %s", self.path, e)
+                self._entries = {}
+        return self._entries.setdefault(fingerprint, {}).setdefault(slot, {})
+
+    def order(self, fingerprint, slot, names, pinned=()):
+        """
+        Return names reordered: the pinned ones in their default order, then
+        proven winners (most hits, then fastest), then untried strategies in
+        their default order, then missed ones (fewest misses in a row first).
+        """
+        with self._lock:
+            stats = self._stats(fingerprint, slot)
+
+        def key(item):
+            index, name = item
+            if name in pinned:
+                return (-1, 0, 0.0, index)
+            s = stats.get(name)
+            if not s:
+                return (1, 0, 0.0, index)
+            if s["misses_in_row"]:
+                return (2, s["misses_in_row"], 0.0, index)
+            return (0, -s["hits"], s["avg_ms"], index)
+
+        return [name for _, name in sorted(enumerate(names), key=key)]
+
+    def record(self, fingerprint, slot, name, hit, elapsed_ms=0.0):
+        with self._lock:
+            stats = self._stats(fingerprint, slot)
+            s = stats.setdefault(name, {"hits": 0, "misses_in_row": 0, "avg_ms": 0.0})
+            if hit:
+                s["avg_ms"] = round((s["avg_ms"] * s["hits"] + elapsed_ms) / (s["hits"] + 1), 1)
+                s["hits"] += 1
+                s["misses_in_row"] = 0
+            else:
+                s["misses_in_row"] += 1
+                if s["misses_in_row"] >= EVICT_AFTER and s["hits"]:
+                    # forget the wins but keep the misses: a deleted entry would rank as untried
+                    logging.debug("Evicting selector strategy %s/%s after %d misses", slot, name, s["misses_in_row"])
+                    s["hits"], s["avg_ms"] = 0, 0.0
+            self._dirty = True
+
+    def first_hit(self, fingerprint, slot, strategies, pinned=()):
+        """
+        Try (name, fn) strategies in learned order (pinned names first, see
+        order()). fn(first) receives True for the first strategy tried, so
+        callers can give it the longer wait. Returns (name, result) for the
+        first truthy result, or (None, None).
+        """
+        funcs = dict(strategies)
+        for i, name in enumerate(self.order(fingerprint, slot, [n for n, _ in strategies], pinned)):
+            started = time.monotonic()
+            try:
+                result = funcs[name](i == 0)
+            except Exception as e:
+                logging.debug("Selector strategy %s/%s raised %s", slot, name, e, extra={"sample": True})
+                result = None
+            elapsed_ms = (time.monotonic() - started) * 1000
+            self.record(fingerprint, slot, name, bool(result), elapsed_ms)
+            if result:
+                logging.debug("Selector %s resolved by %s in %.0f ms", slot, name, elapsed_ms, extra={"sample": True})
+                return name, result
+        return None, None
+
+    def save(self):
+        with self._lock:
+            if not self._dirty or self._entries is None:
+                return
+            # a temp file of our own: batch workers save the same cache concurrently
+            fd, tmp = tempfile.mkstemp(prefix=os.path.basename(self.path) + ".",
+                                       dir=os.path.dirname(os.path.abspath(self.path)))
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(self._entries, f, indent=1, sort_keys=True)
+                os.replace(tmp, self.path)
+                self._dirty = False
+            except Exception as e:
+                logging.debug("Failed saving selector cache %s: %s", self.path, e)
+                try:
+                    os.remove(tmp)
+                except OSError:
+                    pass
+
+
+SELECTOR_CACHE = SelectorCache()
@@ -0,0 +1,186 @@
+"""
+Persistent authenticated session cache for the Flowscape booking flow.
+
+After a successful Microsoft SSO login the cookies for the Flowscape and
+login.microsoftonline origins, plus the Flowscape localStorage, are saved to a
+JSON file. The next run restores them before the target URL is opened so the
+SSO round-trip can be skipped while the session is still accepted.
+"""
+import json
+import logging
+import os
+import tempfile
+import time
+from urllib.parse import urlparse
+
+SESSION_FILENAME = os.getenv("FLOWSCAPE_SESSION_FILE", "flowscape_session.json")
+# upper bound for sessions whose cookies carry no explicit expiry (session cookies)
+SESSION_MAX_AGE = int(os.getenv("FLOWSCAPE_SESSION_MAX_AGE", str(12 * 3600)))
+
+SESSION_DOMAINS = ("flowscape", "login.microsoftonline", "login.live", "microsoftonline")
+
+# localStorage is origin scoped; inject it on every new document and let the
+# origin check decide whether the entries belong to the page being loaded.
+_RESTORE_STORAGE_JS = """
+(function() {
+  var stores = %s;
+  var entries = stores[window.location.origin];
+  if (!entries) { return; }
+  try {
+    Object.keys(entries).forEach(function(k) {
+      if (window.localStorage.getItem(k) === null) {
+        window.localStorage.setItem(k, entries[k]);
+      }
+    });
+  } catch (e) {}
+})();
+"""
+
+
+def _origin(url):
+    parts = urlparse(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def _is_session_domain(domain):
+    domain = (domain or "").lstrip(".")
+    return any(d in domain for d in SESSION_DOMAINS)
+
+
+def _all_cookies(driver):
+    """
+    Return cookies for every origin. CDP sees cookies of all domains without
+    navigating; plain WebDriver only sees those of the current page.
+    """
+    try:
+        return driver.execute_cdp_cmd("Network.getAllCookies", {}).get("cookies", [])
+    except Exception:
+        logging.debug("Network.getAllCookies unavailable; using driver.get_cookies()")
+        cookies = []
+        for c in driver.get_cookies():
+            c = dict(c)
+            c["expires"] = c.pop("expiry", -1)
+            cookies.append(c)
+        return cookies
+
+
+def _session_expiry(cookies, saved_at):
+    """
+    Earliest expiry among persistent session cookies, capped by SESSION_MAX_AGE.
+    """
+    expires_at = saved_at + SESSION_MAX_AGE
+    for c in cookies:
+        exp = c.get("expires") or -1
+        if exp > saved_at and "flowscape" in (c.get("domain") or ""):
+            expires_at = min(expires_at, exp)
+    return expires_at
+
+
+def save_session(driver, path=SESSION_FILENAME):
+    """
+    Save cookies and the current origin's localStorage. Returns True on success.
+    """
+    try:
+        saved_at = time.time()
+        cookies = [c for c in _all_cookies(driver) if _is_session_domain(c.get("domain"))]
+        if not cookies:
+            logging.info("No session cookies to cache; skipping session save")
+            return False
+        storage = {}
+        try:
+            origin = _origin(driver.current_url)
+            entries = driver.execute_script(
+                "var o = {}; for (var i = 0; i < localStorage.length; i++) {"
+                " var k = localStorage.key(i); o[k] = localStorage.getItem(k); } return o;"
+            )
+            if entries:
+                storage[origin] = entries
+        except Exception as e:
+            logging.debug("Unable to read localStorage: %s", e)
+
+        data = {
+            "saved_at": saved_at,
+            "expires_at": _session_expiry(cookies, saved_at),
+            "cookies": cookies,
+            "local_storage": storage,
+        }
+        # a temp file per writer (daemon slots and batch jobs save the same file
+        # concurrently); mkstemp creates it 0600, and cookies are credentials
+        fd, tmp = tempfile.mkstemp(prefix=os.path.basename(path) + ".", dir=os.path.dirname(os.path.abspath(path)))
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+        logging.info("Saved session (%d cookies, %d storage origins) to %s", len(cookies), len(storage), path)
+        return True
+    except Exception as e:
+        logging.debug("Failed saving session to %s: %s", path, e)
+        return False
+
+
+def load_session(path=SESSION_FILENAME):
+    """
+    Return the cached session dict, or None when missing, unreadable or expired.
+    """
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logging.debug("Unable to read session file %s: %s", path, e)
+        return None
+    if data.get("expires_at", 0) <= time.time():
+        logging.info("Cached session expired; discarding %s", path)
+        clear_session(path)
+        return None
+    return data
+
+
+def clear_session(path=SESSION_FILENAME):
+    try:
+        os.remove(path)
+        logging.debug("Removed session file %s", path)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logging.debug("Failed removing session file %s: %s", path, e)
+
+
+def _cdp_cookie(c):
+    cookie = {k: c[k] for k in ("name", "value", "domain", "path", "secure", "httpOnly", "sameSite") if k in c}
+    if (c.get("expires") or -1) > 0:
+        cookie["expires"] = c["expires"]
+    return cookie
+
+
+def restore_session(driver, path=SESSION_FILENAME):
+    """
+    Install cached cookies and localStorage before the target URL is opened.
+    Returns True when a session was restored.
+    """
+    data = load_session(path)
+    if not data:
+        return False
+    cookies = data.get("cookies", [])
+    try:
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setCookies", {"cookies": [_cdp_cookie(c) for c in cookies]})
+        storage = data.get("local_storage") or {}
+        if storage:
+            driver.execute_cdp_cmd(
+                "Page.addScriptToEvaluateOnNewDocument",
+                {"source": _RESTORE_STORAGE_JS % json.dumps(storage)},
+            )
+        logging.info("Restored cached session (%d cookies) saved at %s", len(cookies),
+                     time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(data.get("saved_at", 0))))
+        return True
+    except Exception as e:
+        logging.debug("Failed restoring session via CDP: %s", e)
+        return False
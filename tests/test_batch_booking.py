@@ -0,0 +1,37 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batch_booking import load_jobs  # noqa: E402
+
+
+def _write(tmp_path, text):
+    path = tmp_path / "jobs"
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+
+def test_json_list_gets_default_ids(tmp_path):
+    jobs = load_jobs(_write(tmp_path, '[{"seat": "ID-6F-277"}, {"seat": "A,B", "id": "mine"}]'))
+    assert [j["id"] for j in jobs] == ["000", "mine"]
+
+
+def test_json_lines_skip_blank_and_comment_lines(tmp_path):
+    jobs = load_jobs(_write(tmp_path, '# nightly\n{"seat": "ID-6F-277"}\n\n{"seat": "ID-6F-278"}\n'))
+    assert [j["seat"] for j in jobs] == ["ID-6F-277", "ID-6F-278"]
+
+
+@pytest.mark.parametrize("text", ['[{"seat": ""}]', '[{"seat": " , "}]', '[{"seat": 277}]', '[{}]'])
+def test_jobs_without_a_seat_are_rejected(tmp_path, text):
+    with pytest.raises(ValueError, match="has no seat"):
+        load_jobs(_write(tmp_path, text))
+
+
+@pytest.mark.parametrize("text", ['["ID-6F-277"]', '[null]', '{"seat": "A"}\n[1]'])
+def test_jobs_that_are_not_objects_are_rejected(tmp_path, text):
+    with pytest.raises(ValueError, match="not a JSON object"):
+        load_jobs(_write(tmp_path, text))
+
@@ -0,0 +1,182 @@
+import base64
+import hashlib
+import json
+import os
+import shutil
+import socket
+import struct
+import subprocess
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cdp_driver import _WRAPPER_JS, _WS_GUID, CDPDriver, CDPElement, _WebSocket  # noqa: E402
+
+
+def _read_exact(conn, n):
+    data = b""
+    while len(data) < n:
+        chunk = conn.recv(n - len(data))
+        if not chunk:
+            raise ConnectionError("peer closed")
+        data += chunk
+    return data
+
+
+def _read_frame(conn):
+    """
+    Read one client frame; returns (fin, opcode, masked, payload) with the payload unmasked.
+    """
+    b0, b1 = _read_exact(conn, 2)
+    length = b1 & 0x7F
+    if length == 126:
+        length = struct.unpack("!H", _read_exact(conn, 2))[0]
+    elif length == 127:
+        length = struct.unpack("!Q", _read_exact(conn, 8))[0]
+    masked = bool(b1 & 0x80)
+    mask = _read_exact(conn, 4) if masked else None
+    payload = _read_exact(conn, length)
+    if mask:
+        payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+    return bool(b0 & 0x80), b0 & 0x0F, masked, payload
+
+
+def _frame(opcode, payload, fin=True):
+    """
+    Build an unmasked server frame.
+    """
+    b0 = (0x80 if fin else 0) | opcode
+    length = len(payload)
+    if length < 126:
+        header = struct.pack("!BB", b0, length)
+    elif length < 65536:
+        header = struct.pack("!BBH", b0, 126, length)
+    else:
+        header = struct.pack("!BBQ", b0, 127, length)
+    return header + payload
+
+
+@pytest.fixture
+def ws_pair():
+    """
+    A connected _WebSocket and the server side socket of its connection.
+    """
+    listener = socket.create_server(("127.0.0.1", 0))
+    port = listener.getsockname()[1]
+    accepted = {}
+
+    def handshake():
+        conn, _ = listener.accept()
+        request = b""
+        while b"\r\n\r\n" not in request:
+            request += conn.recv(4096)
+        key = next(line.split(b":", 1)[1].strip() for line in request.split(b"\r\n")
+                   if line.lower().startswith(b"sec-websocket-key"))
+        accept = base64.b64encode(hashlib.sha1(key + _WS_GUID.encode()).digest())
+        conn.sendall(b"HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                     b"Sec-WebSocket-Accept: " + accept + b"\r\n\r\n")
+        accepted["conn"] = conn
+
+    thread = threading.Thread(target=handshake, daemon=True)
+    thread.start()
+    ws = _WebSocket(f"ws://127.0.0.1:{port}/devtools/browser/x")
+    thread.join(5)
+    conn = accepted["conn"]
+    conn.settimeout(5)
+    yield ws, conn
+    ws.close()
+    conn.close()
+    listener.close()
+
+
+@pytest.mark.parametrize("size", [5, 300, 70000])
+def test_client_frames_are_masked_with_7_16_and_64_bit_lengths(ws_pair, size):
+    ws, conn = ws_pair
+    text = ("seat-" * (size // 5 + 1))[:size]
+    ws.send(text)
+    fin, opcode, masked, payload = _read_frame(conn)
+    assert (fin, opcode, masked) == (True, 0x1, True)
+    assert payload.decode("utf-8") == text
+
+
+@pytest.mark.parametrize("size", [5, 300, 70000])
+def test_server_frames_with_7_16_and_64_bit_lengths_are_read(ws_pair, size):
+    ws, conn = ws_pair
+    text = ("x" * size)
+    conn.sendall(_frame(0x1, text.encode()))
+    assert ws.recv() == text
+
+
+def test_fragmented_message_is_joined_and_interleaved_ping_answered(ws_pair):
+    ws, conn = ws_pair
+    conn.sendall(_frame(0x1, b'{"id": 1, ', fin=False) + _frame(0x9, b"hb")
+                 + _frame(0x0, b'"result": {}}'))
+    assert json.loads(ws.recv()) == {"id": 1, "result": {}}
+    fin, opcode, masked, payload = _read_frame(conn)
+    assert (fin, opcode, masked, payload) == (True, 0xA, True, b"hb")
+
+
+def test_close_frame_ends_the_stream(ws_pair):
+    ws, conn = ws_pair
+    conn.sendall(_frame(0x8, b""))
+    assert ws.recv() is None
+    ws.close()
+    assert _read_frame(conn)[:3] == (True, 0x8, True)
+
+
+def test_element_arguments_and_results_round_trip():
+    driver = object.__new__(CDPDriver)
+    element = CDPElement(driver, 3, "page-1", None)
+    assert driver._marshal([element, {"nested": (element, 1)}, "x"]) == [
+        {"__cdp_node__": 3}, {"nested": [{"__cdp_node__": 3}, 1]}, "x"]
+    result = driver._unmarshal({"hit": {"__cdp_node__": 7}, "all": [{"__cdp_node__": 8}], "name": "seat",
+                                "extra": {"__cdp_node__": 9, "other": 1}}, "page-2", "frame-1")
+    assert result["hit"] == CDPElement(driver, 7, "page-2", "frame-1")
+    assert result["all"] == [CDPElement(driver, 8, "page-2", "frame-1")]
+    assert result["name"] == "seat"
+    assert result["extra"] == {"__cdp_node__": 9, "other": 1}
+
+
+# fake DOM for running the script wrapper in node
+_FAKE_DOM_JS = """
+class Node { constructor(name) { this.name = name; this.isConnected = true; } }
+class NodeList extends Array {}
+class HTMLCollection extends Array {}
+global.Node = Node; global.NodeList = NodeList; global.HTMLCollection = HTMLCollection;
+global.window = global;
+function run(fn, args) { return eval(WRAPPER)(fn, args, false); }
+"""
+
+_WRAPPER_SCENARIO_JS = """
+var a = new Node('a'), b = new Node('b');
+var out = {};
+out.first = run(function() { return [a, {seat: b, n: 1}]; }, []);
+out.again = run(function() { return a; }, []);
+out.name = run(function(el, o) { return el.name + o.el.name; }, [out.first[0], {el: out.first[1].seat}]);
+b.isConnected = false;
+try { run(function(el) { return el; }, [out.first[1].seat]); } catch (e) { out.stale = e.message; }
+var many = [];
+for (var i = 0; i < 300; i++) { many.push(new Node('n' + i)); }
+run(function() { return many; }, []);
+many.forEach(function(n) { n.isConnected = false; });
+run(function() { return null; }, []);
+out.size = window.__flowscapeNodes.nodes.size;
+out.stillA = run(function(el) { return el.name; }, [out.again]);
+console.log(JSON.stringify(out));
+"""
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="node is not installed")
+def test_wrapper_registers_nodes_and_drops_detached_ones():
+    script = f"var WRAPPER = {json.dumps(_WRAPPER_JS)};\n" + _FAKE_DOM_JS + _WRAPPER_SCENARIO_JS
+    out = json.loads(subprocess.run(["node", "-e", script], capture_output=True, text=True, check=True).stdout)
+    assert out["first"] == [{"__cdp_node__": 0}, {"seat": {"__cdp_node__": 1}, "n": 1}]
+    assert out["again"] == {"__cdp_node__": 0}
+    assert out["name"] == "ab"
+    assert out["stale"] == "stale element reference"
+    # the sweep left only the node that is still in the document
+    assert out["size"] == 1
+    assert out["stillA"] == "a"
@@ -0,0 +1,44 @@
+import os
+import sys
+from datetime import datetime
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import clock_sync  # noqa: E402
+from clock_sync import parse_fire_time  # noqa: E402
+
+NOW = datetime(2026, 10, 17, 20, 0, 0)
+
+
+def test_later_today():
+    assert parse_fire_time("21:30", NOW) == datetime(2026, 10, 17, 21, 30).timestamp()
+
+
+def test_fractional_seconds():
+    assert parse_fire_time("20:00:01.250", NOW) == datetime(2026, 10, 17, 20, 0, 1, 250000).timestamp()
+
+
+def test_late_start_within_grace_fires_now():
+    assert parse_fire_time("19:30", NOW) == NOW.timestamp()
+
+
+def test_time_past_the_grace_rolls_over_to_tomorrow(monkeypatch):
+    assert parse_fire_time("00:05", NOW) == datetime(2026, 10, 18, 0, 5).timestamp()
+    monkeypatch.setattr(clock_sync, "LATE_GRACE", 600)
+    assert parse_fire_time("19:30", NOW) == datetime(2026, 10, 18, 19, 30).timestamp()
+
+
+def test_iso_datetime():
+    assert parse_fire_time("2026-10-18T07:00:00", NOW) == datetime(2026, 10, 18, 7).timestamp()
+
+
+def test_iso_datetime_in_the_past_fires_now():
+    assert parse_fire_time("2026-10-16T07:00:00", NOW) == NOW.timestamp()
+
+
+@pytest.mark.parametrize("value", ["7pm", "25:00", ""])
+def test_unrecognised_time(value):
+    with pytest.raises(ValueError):
+        parse_fire_time(value, NOW)
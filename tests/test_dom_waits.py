@@ -0,0 +1,61 @@
+import os
+import sys
+from collections import namedtuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dom_waits import race  # noqa: E402
+
+
+class _FakeDriver:
+    def __init__(self, hit=None, error=None):
+        self.script_timeout = 30
+        self.set_calls = []
+        self._hit = hit
+        self._error = error
+
+    @property
+    def timeouts(self):
+        return namedtuple("Timeouts", "script")(self.script_timeout)
+
+    def set_script_timeout(self, seconds):
+        self.set_calls.append(seconds)
+        self.script_timeout = seconds
+
+    def execute_async_script(self, script, *args):
+        if self._error:
+            raise self._error
+        return self._hit
+
+
+def test_race_restores_the_script_timeout():
+    driver = _FakeDriver(hit={"name": "seat", "element": "el"})
+    assert race(driver, [{"name": "seat", "css": ".seat"}], timeout=10) == ("seat", "el")
+    assert driver.set_calls == [15, 30]
+
+
+def test_race_restores_the_script_timeout_on_errors():
+    driver = _FakeDriver(error=KeyboardInterrupt())
+    try:
+        race(driver, [{"name": "seat", "css": ".seat"}], timeout=10)
+    except KeyboardInterrupt:
+        pass
+    assert driver.script_timeout == 30
+
+
+class _CDPLikeDriver(_FakeDriver):
+    timeouts = None
+
+    def __init__(self):
+        super().__init__()
+        self._script_timeout = 30
+
+    def set_script_timeout(self, seconds):
+        super().set_script_timeout(seconds)
+        self._script_timeout = seconds
+
+
+def test_race_restores_a_cdp_driver_timeout():
+    driver = _CDPLikeDriver()
+    assert race(driver, [{"name": "seat", "css": ".seat"}], timeout=0.01) == (None, None)
+    assert driver._script_timeout == 30
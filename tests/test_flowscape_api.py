@@ -0,0 +1,74 @@
+import os
+import socket
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flowscape_api import ApiError, FlowscapeApi  # noqa: E402
+
+_OK = b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: 2\r\n\r\n[]"
+
+
+class _DroppingServer:
+    """
+    Answers the first request on each connection with JSON over keep-alive,
+    then reads the next request and closes without answering.
+    """
+
+    def __init__(self):
+        self.sock = socket.create_server(("127.0.0.1", 0))
+        self.port = self.sock.getsockname()[1]
+        self.requests = []
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _read_request(self, conn):
+        data = b""
+        while b"\r\n\r\n" not in data:
+            chunk = conn.recv(4096)
+            if not chunk:
+                return None
+            data += chunk
+        head, _, body = data.partition(b"\r\n\r\n")
+        length = next((int(line.split(b":")[1]) for line in head.split(b"\r\n")
+                       if line.lower().startswith(b"content-length")), 0)
+        while len(body) < length:
+            body += conn.recv(4096)
+        return head.split(b" ")[0].decode()
+
+    def _serve(self):
+        while True:
+            conn, _ = self.sock.accept()
+            with conn:
+                method = self._read_request(conn)
+                if method is None:
+                    continue
+                self.requests.append(method)
+                conn.sendall(_OK)
+                method = self._read_request(conn)
+                if method is not None:
+                    self.requests.append(method)
+
+
+@pytest.fixture
+def server():
+    server = _DroppingServer()
+    yield server
+    server.sock.close()
+
+
+def test_post_is_not_resent_when_a_pooled_connection_drops(server):
+    api = FlowscapeApi(f"http://127.0.0.1:{server.port}/api", token="t")
+    assert api.request("GET", "/seats") == []
+    with pytest.raises(ApiError):
+        api.request("POST", "/reservations", {"seatId": 1})
+    assert server.requests == ["GET", "POST"]
+
+
+def test_get_is_retried_once_when_a_pooled_connection_drops(server):
+    api = FlowscapeApi(f"http://127.0.0.1:{server.port}/api", token="t")
+    assert api.request("GET", "/seats") == []
+    assert api.request("GET", "/seats") == []
+    assert server.requests == ["GET", "GET", "GET"]
@@ -0,0 +1,80 @@
+import http.client
+import json
+import os
+import sys
+import threading
+import time
+from urllib.parse import parse_qs, urlencode, urlparse
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flowscape_api import ApiError, FlowscapeApi  # noqa: E402
+from mock_flowscape import FLOWSCAPE_HOST, LOGIN_HOST, make_server  # noqa: E402
+
+
+@pytest.fixture
+def server():
+    server = make_server(kmsi=False)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _request(server, method, host, path, body=None):
+    conn = http.client.HTTPConnection("127.0.0.1", server.server_address[1], timeout=5)
+    headers = {"Host": f"{host}:{server.server_address[1]}"}
+    if body is not None:
+        body = urlencode(body)
+        headers["Content-Type"] = "application/x-www-form-urlencoded"
+    conn.request(method, path, body=body, headers=headers)
+    resp = conn.getresponse()
+    resp.read()
+    conn.close()
+    return resp
+
+
+def _login(server):
+    """
+    Walk the mock Microsoft login and return the fs_session cookie value.
+    """
+    _request(server, "POST", LOGIN_HOST, "/common/login", {"loginfmt": "user@example.com"})
+    resp = _request(server, "POST", LOGIN_HOST, "/common/password", {"passwd": "secret"})
+    auth = urlparse(resp.getheader("Location"))
+    resp = _request(server, "GET", FLOWSCAPE_HOST, f"{auth.path}?{auth.query}")
+    cookie = resp.getheader("Set-Cookie").split(";")[0]
+    name, _, value = cookie.partition("=")
+    assert name == "fs_session" and value == parse_qs(auth.query)["token"][0]
+    return value
+
+
+def _api(server, **kwargs):
+    return FlowscapeApi(f"http://127.0.0.1:{server.server_address[1]}/api", **kwargs)
+
+
+def test_api_accepts_session_cookie_from_mock_login(server):
+    api = _api(server, cookies=f"fs_session={_login(server)}")
+    reservation = api.book("ID-6F-277 (UK)", "2026-10-19", "08:00", "17:00")
+    assert reservation["seatId"] == api.seat_id("ID-6F-277 (UK)")
+
+
+def test_api_session_cookie_from_cached_session(server, tmp_path):
+    session_file = tmp_path / "session.json"
+    session_file.write_text(json.dumps({
+        "expires_at": time.time() + 3600,
+        "cookies": [{"name": "fs_session", "value": _login(server), "domain": "127.0.0.1"}],
+    }))
+    api = FlowscapeApi.from_session(str(session_file), base_url=f"http://127.0.0.1:{server.server_address[1]}/api")
+    assert api.book("ID-6F-277 (UK)", "2026-10-20", "08:00", "17:00")["date"] == "2026-10-20"
+
+
+def test_api_still_accepts_bearer_token(server):
+    assert _api(server, token="test-token").book("ID-6F-277 (UK)", "2026-10-19", "08:00", "17:00")
+
+
+def test_api_rejects_unknown_session_cookie(server):
+    with pytest.raises(ApiError) as err:
+        _api(server, cookies="fs_session=not-a-session").book("ID-6F-277 (UK)", "2026-10-19", "08:00", "17:00")
+    assert err.value.status == 401
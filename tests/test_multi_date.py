@@ -0,0 +1,51 @@
+import os
+import sys
+from datetime import date
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from multi_date import expand_dates, parse_weekdays  # noqa: E402
+
+# a Saturday
+TODAY = date(2026, 10, 17)
+
+
+@pytest.mark.parametrize("spec,expected", [
+    ("mon-fri", {0, 1, 2, 3, 4}),
+    ("Mon, wed ,FRI", {0, 2, 4}),
+    ("monday-wednesday,sun", {0, 1, 2, 6}),
+    ("", set()),
+])
+def test_parse_weekdays(spec, expected):
+    assert parse_weekdays(spec) == expected
+
+
+def test_parse_weekdays_rejects_unknown_names():
+    with pytest.raises(ValueError, match="unknown weekday"):
+        parse_weekdays("mon,funday")
+
+
+def test_single_dates_are_kept_whatever_the_weekday():
+    assert expand_dates("2026-10-25,2026-10-19,2026-10-19", today=TODAY) == ["2026-10-19", "2026-10-25"]
+
+
+def test_range_keeps_only_the_weekdays():
+    assert expand_dates("2026-10-16..2026-10-21", weekdays="mon,wed,fri", today=TODAY) == [
+        "2026-10-16", "2026-10-19", "2026-10-21"]
+
+
+def test_recurrence_starts_tomorrow():
+    assert expand_dates(weeks=1, weekdays="sat-sun", today=TODAY) == ["2026-10-18", "2026-10-24"]
+    assert len(expand_dates(weeks=2, today=TODAY)) == 10
+
+
+def test_spec_and_recurrence_are_merged():
+    assert expand_dates("2026-10-19", weeks=1, weekdays="mon", today=TODAY) == ["2026-10-19"]
+
+
+@pytest.mark.parametrize("spec", ["2026-13-01", "19/10/2026", "2026-10-19..tomorrow"])
+def test_invalid_dates_are_rejected(spec):
+    with pytest.raises(ValueError, match="invalid date"):
+        expand_dates(spec, today=TODAY)
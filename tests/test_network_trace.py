@@ -0,0 +1,115 @@
+import gzip
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from network_trace import _busy_ms, _critical_path, analyze, read_trace  # noqa: E402
+from run_metrics import _network_summary  # noqa: E402
+
+# wall clock = CDP monotonic timestamp + OFFSET
+OFFSET = 990.0
+
+
+def _req(rid, url, ts, init=None):
+    return {"t": "req", "id": rid, "ts": ts, "wall": ts + OFFSET, "url": url, "method": "GET", "type": "Fetch",
+            "init": init, "init_type": "script", "redirect": False}
+
+
+def _done(rid, ts, size):
+    return {"t": "done", "id": rid, "ts": ts, "bytes": size}
+
+
+def _records():
+    return [
+        {"t": "meta", "v": 1, "run": "r1", "wall": 1000.0, "meta": {"seat": "ID-6F-277"}},
+        {"t": "step", "name": "login", "parent": None, "wall": 1000.0},
+        _req("1", "https://app/", 10.0),
+        {"t": "resp", "id": "1", "ts": 10.2, "status": 200, "mime": "text/html", "proto": "h2", "cache": False,
+         "timing": {"requestTime": 10.0, "dnsStart": 0, "dnsEnd": 5, "connectStart": 5, "connectEnd": 30,
+                    "sslStart": 15, "sslEnd": 30, "sendStart": 31, "receiveHeadersEnd": 200}},
+        _done("1", 10.5, 1000),
+        _req("2", "https://app/main.js", 10.6, init="https://app/"),
+        _req("3", "https://app/api/me", 10.7, init="https://app/main.js"),
+        _done("2", 11.0, 500),
+        _done("3", 11.5, 200),
+        {"t": "step", "name": "seat", "parent": None, "wall": 1002.0},
+        _req("4", "https://app/api/seats", 12.5, init="https://app/main.js"),
+        _req("5", "https://tracker/collect", 12.6),
+        {"t": "fail", "id": "5", "ts": 12.7, "error": "inspector", "canceled": False},
+        _done("4", 13.0, 300),
+        {"t": "end", "wall": 1004.0, "ok": True},
+    ]
+
+
+def _write_trace(path, records):
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+
+
+def test_busy_ms_merges_overlaps_and_clips_to_the_window():
+    reqs = [{"start": 0.0, "end": 1.0}, {"start": 0.5, "end": 1.5}, {"start": 3.0, "end": 5.0},
+            {"start": 2.0, "end": None}]
+    assert round(_busy_ms(reqs, 0.0, 4.0)) == 2500
+
+
+def test_critical_path_follows_initiators_back_from_the_last_request():
+    reqs = [{"url": "doc", "init": None, "start": 0.0, "end": 0.5},
+            {"url": "app.js", "init": "doc", "start": 0.6, "end": 1.0},
+            {"url": "other.js", "init": "doc", "start": 0.7, "end": 0.8},
+            {"url": "api", "init": "app.js", "start": 1.1, "end": 2.0}]
+    assert [r["url"] for r in _critical_path(reqs)] == ["doc", "app.js", "api"]
+    assert _critical_path([{"url": "x", "init": None, "start": 0.0}]) == []
+
+
+def test_analyze_splits_requests_by_step(tmp_path):
+    path = str(tmp_path / "trace.jsonl.gz")
+    _write_trace(path, _records())
+    analysis = analyze(path)
+    assert (analysis["run"], analysis["requests"], analysis["bytes"], analysis["failed"]) == ("r1", 5, 2000, 1)
+    login, seat = analysis["steps"]
+    assert (login["name"], login["duration_ms"], login["busy_ms"], login["critical_ms"]) == ("login", 2000.0, 1400.0,
+                                                                                           1500.0)
+    assert [r["url"] for r in login["critical_path"]] == ["https://app/", "https://app/main.js", "https://app/api/me"]
+    assert [r["id"] for r in seat["requests"]] == ["4", "5"]
+    assert seat["busy_ms"] == 500.0
+    assert login["requests"][0]["phases"] == {"dns": 5, "tls": 15, "connect": 10, "wait": 169, "download": 300}
+    assert analysis["slowest"][0]["id"] == "3"
+
+
+def test_read_trace_of_a_truncated_file_returns_the_flushed_records(tmp_path):
+    records = [{"t": "req", "id": str(i), "url": f"https://app/{i}" * 5} for i in range(2000)]
+    path = str(tmp_path / "trace.jsonl.gz")
+    _write_trace(path, records)
+    with open(path, "rb") as f:
+        data = f.read()
+    with open(path, "wb") as f:
+        f.write(data[:len(data) * 2 // 3])
+    read = read_trace(path)
+    assert 0 < len(read) < len(records)
+    assert read == records[:len(read)]
+
+
+def _entry(method, **params):
+    return {"message": json.dumps({"message": {"method": method, "params": params}})}
+
+
+def test_network_summary_counts_blocked_and_cached_requests():
+    entries = [
+        _entry("Network.requestWillBeSent", requestId="1", timestamp=1.0, request={"url": "https://app/"}),
+        _entry("Network.loadingFinished", requestId="1", timestamp=1.25, encodedDataLength=1000),
+        _entry("Network.requestWillBeSent", requestId="2", timestamp=1.1, request={"url": "https://app/main.js"}),
+        _entry("Network.responseReceived", requestId="2",
+               response={"fromDiskCache": True, "headers": {"Content-Length": "4096"}}),
+        _entry("Network.loadingFinished", requestId="2", timestamp=1.15, encodedDataLength=0),
+        _entry("Network.requestWillBeSent", requestId="3", timestamp=1.2, request={"url": "https://tracker/"}),
+        _entry("Network.loadingFailed", requestId="3", timestamp=1.3, blockedReason="inspector"),
+        {"message": "not json"},
+    ]
+    summary = _network_summary(entries)
+    assert {k: summary[k] for k in ("requests", "failed", "bytes", "blocked", "from_cache", "cache_bytes")} == {
+        "requests": 3, "failed": 1, "bytes": 1000, "blocked": 1, "from_cache": 1, "cache_bytes": 4096}
+    assert [(r["url"], r["duration_ms"]) for r in summary["slowest"]] == [("https://app/", 250.0),
+                                                                          ("https://app/main.js", 50.0)]
@@ -0,0 +1,71 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from selector_cache import EVICT_AFTER, SelectorCache  # noqa: E402
+
+NAMES = ["exact", "contains", "aria", "text"]
+
+
+def _cache(tmp_path):
+    return SelectorCache(str(tmp_path / "selector_cache.json"))
+
+
+def test_untried_strategies_keep_their_default_order(tmp_path):
+    assert _cache(tmp_path).order("fp", "seat", NAMES) == NAMES
+
+
+def test_winner_first_then_untried_then_missed(tmp_path):
+    cache = _cache(tmp_path)
+    cache.record("fp", "seat", "exact", False)
+    cache.record("fp", "seat", "contains", False)
+    cache.record("fp", "seat", "contains", False)
+    cache.record("fp", "seat", "text", True, 40.0)
+    assert cache.order("fp", "seat", NAMES) == ["text", "aria", "exact", "contains"]
+
+
+def test_winners_rank_by_hits_then_speed(tmp_path):
+    cache = _cache(tmp_path)
+    cache.record("fp", "seat", "aria", True, 10.0)
+    cache.record("fp", "seat", "text", True, 90.0)
+    cache.record("fp", "seat", "text", True, 90.0)
+    cache.record("fp", "seat", "contains", True, 30.0)
+    assert cache.order("fp", "seat", NAMES) == ["text", "aria", "contains", "exact"]
+
+
+def test_pinned_names_stay_first_in_default_order(tmp_path):
+    cache = _cache(tmp_path)
+    cache.record("fp", "seat", "text", True, 5.0)
+    cache.record("fp", "seat", "exact", False)
+    assert cache.order("fp", "seat", NAMES, pinned=("contains", "exact")) == ["exact", "contains", "text", "aria"]
+
+
+def test_eviction_forgets_wins_but_keeps_the_misses(tmp_path):
+    cache = _cache(tmp_path)
+    cache.record("fp", "seat", "exact", True, 20.0)
+    for _ in range(EVICT_AFTER):
+        cache.record("fp", "seat", "exact", False)
+    stats = cache._stats("fp", "seat")["exact"]
+    assert (stats["hits"], stats["avg_ms"], stats["misses_in_row"]) == (0, 0.0, EVICT_AFTER)
+    # an evicted strategy ranks behind untried ones, not alongside them
+    assert cache.order("fp", "seat", NAMES) == ["contains", "aria", "text", "exact"]
+
+
+def test_first_hit_records_and_saves(tmp_path):
+    cache = _cache(tmp_path)
+    calls = []
+
+    def strategy(name, result):
+        return name, lambda first: calls.append((name, first)) or result
+
+    name, result = cache.first_hit("fp", "seat", [strategy("exact", None), strategy("contains", "el")])
+    assert (name, result) == ("contains", "el")
+    assert calls == [("exact", True), ("contains", False)]
+    cache.save()
+    with open(cache.path, encoding="utf-8") as f:
+        saved = json.load(f)
+    assert saved["fp"]["seat"]["contains"]["hits"] == 1
+    assert saved["fp"]["seat"]["exact"]["misses_in_row"] == 1
+    assert SelectorCache(cache.path).order("fp", "seat", ["exact", "contains"]) == ["contains", "exact"]